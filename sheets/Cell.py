@@ -1,16 +1,18 @@
-import os
-import math
+import copy
 from .CellValue import CellValue
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-lark_path = os.path.join(current_dir, "formulas.lark")
-
 class Cell:
-    def __init__(self, location=str, contents=''):
-        # self.sheet_name = sheet_name.lower()
-        self.location = location.lower()
+    # A stored cell.  Its location is the key it is stored under in the
+    # sheet (see Sheet.cells), so it is not kept here.
+    __slots__ = ('contents', 'value', 'program', 'parse_error')
+
+    def __init__(self, contents=None):
         self.contents = contents
         self.value = CellValue(None)
-        self.tree = None
+        self.program = None
         self.parse_error = False
-        self.in_cycle = False
\ No newline at end of file
+
+    def __deepcopy__(self, memo):
+        # values are immutable, and programs come from the shared formula
+        # cache and are never mutated, so copies of a cell share them
+        return copy.copy(self)
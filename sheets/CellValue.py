@@ -3,60 +3,82 @@ import decimal
 from .CellError import CellError, CellErrorType
 
 class CellValue:
-    def __init__(self, val):
-        # literal, number, string, formula, boolean, CellError, None
-        self.val = val
+    # An immutable cell value: a literal, number, string, boolean, CellError or
+    # None.  The conversions return new values rather than changing this one,
+    # so values can be shared: the empty value, TRUE and FALSE are single
+    # instances, as are the errors returned by CellValue.error() and the
+    # values of number and string literals in a compiled formula.
+    __slots__ = ('val',)
+
+    def __new__(cls, val=None):
+        if val is None and EMPTY is not None:
+            return EMPTY
+        if val is True and TRUE is not None:
+            return TRUE
+        if val is False and FALSE is not None:
+            return FALSE
+        self = object.__new__(cls)
+        object.__setattr__(self, 'val', val)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CellValue is immutable')
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @staticmethod
+    def error(error_type):
+        # the shared value of an error of the given type, with its standard
+        # detail
+        return ERRORS[error_type]
 
     @staticmethod
     def is_number(s):
+        # finite numbers only; "inf" and "nan" are strings
         try:
-            float(s)
-
-            if (float(s) == float("inf") or float(s) == float("-inf")):
-                return False
-            if (math.isnan(float(s))):
-                return False
-
-            return True
+            return math.isfinite(float(s))
         except ValueError:
             return False
 
     @staticmethod
     def strip_trailing_zeros(contents):
-        if ('.' in contents):
+        # the zeros of an exponent ('1.5E+10') are not trailing zeros
+        if ('.' in contents and 'e' not in contents and 'E' not in contents):
             contents = contents.rstrip('0').rstrip('.')
         return contents
     
     def to_string(self):
         if self.val is None:
-            self.val = ''
-        elif self.is_cell_error():
-            return
-        elif isinstance(self.val, str):
-            return
+            return CellValue('')
+        elif self.is_cell_error() or isinstance(self.val, str):
+            return self
         elif isinstance(self.val, bool):
-            if self.val:
-                self.val = 'TRUE'
-            else:
-                self.val = 'FALSE'
+            return CellValue('TRUE' if self.val else 'FALSE')
         elif CellValue.is_number(self.val):
-            self.val = CellValue.strip_trailing_zeros(str(self.val))
+            return CellValue(CellValue.strip_trailing_zeros(str(self.val)))
         else:
-            self.val = str(self.val)
+            return CellValue(str(self.val))
             
     def to_number(self):
-        if self.val is None:
-            self.val = decimal.Decimal('0')
+        val = self.val
+        if type(val) is decimal.Decimal:
+            return self
+        if val is None:
+            return CellValue(decimal.Decimal('0'))
         elif self.is_cell_error():
-            return
+            return self
+        elif isinstance(val, bool):
+            return CellValue(decimal.Decimal(int(val)))
         else:
-            if isinstance(self.val, bool):
-                self.val = float(self.val)
-            self.val = str(self.val)
-            if CellValue.is_number(self.val):
-                self.val = decimal.Decimal(CellValue.strip_trailing_zeros(self.val))
+            val = str(val)
+            if CellValue.is_number(val):
+                return CellValue(decimal.Decimal(CellValue.strip_trailing_zeros(val)))
             else:
-                self.val = CellError(CellErrorType.TYPE_ERROR, f'Invalid type for {self.val}')
+                return CellValue(CellError(CellErrorType.TYPE_ERROR, f'Invalid type for {val}'))
 
     def is_cell_error(self):
         if isinstance(self.val, CellError):
@@ -66,20 +88,37 @@ class CellValue:
     def to_bool(self):
         # empty cell is used in a context that req Boolean val, default is FALSE
         if self.val is None:
-            self.val = False
+            return FALSE
         elif self.is_cell_error():
-            return 
+            return self
         elif isinstance(self.val, str):
             if self.val.lower() == "true":
-                self.val = True
+                return TRUE
             elif self.val.lower() == "false":
-                self.val = False
+                return FALSE
             else:
-                self.val = CellError(CellErrorType.TYPE_ERROR, f'Invalid type for {self.val}')
+                return CellValue(CellError(CellErrorType.TYPE_ERROR, f'Invalid type for {self.val}'))
         elif CellValue.is_number(self.val):
             if self.val == 0:
-                self.val = False
+                return FALSE
             else:
-                self.val = True
+                return TRUE
         else:
-            self.val = CellError(CellErrorType.TYPE_ERROR, f'Invalid type for {self.val}')
\ No newline at end of file
+            return CellValue(CellError(CellErrorType.TYPE_ERROR, f'Invalid type for {self.val}'))
+
+# the shared values, created once the class exists
+EMPTY = TRUE = FALSE = None
+EMPTY = CellValue(None)
+TRUE = CellValue(True)
+FALSE = CellValue(False)
+
+ERROR_DETAILS = {
+    CellErrorType.PARSE_ERROR: 'Failed to parse formula',
+    CellErrorType.CIRCULAR_REFERENCE: 'Circular reference found',
+    CellErrorType.BAD_REFERENCE: 'Bad reference',
+    CellErrorType.BAD_NAME: 'Unknown function',
+    CellErrorType.TYPE_ERROR: 'Invalid type',
+    CellErrorType.DIVIDE_BY_ZERO: 'Cannot divide by zero',
+}
+ERRORS = {error_type: CellValue(CellError(error_type, detail))
+          for error_type, detail in ERROR_DETAILS.items()}
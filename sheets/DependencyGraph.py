@@ -1,89 +1,546 @@
+import sys
+from .LookupIndex import LookupIndex
+from .RangeAggregate import RangeAggregate
+from .Sheet import Sheet
+
+# adjacency of a node without edges in that direction; replaced by a set when
+# the first edge is added
+NO_EDGES = frozenset()
+
+# size of the blocks of a sheet used to index ranges and formula cells
+BLOCK_COLS = 16
+BLOCK_ROWS = 64
+
+# the order is rebuilt in one pass, rather than restored edge by edge, when
+# at least one in this many of the graph's cells get new edges at once
+BULK_ORDER_RATIO = 16
+
+def location_bounds(location):
+    # (col1, row1, col2, row2) of a lowercase range key such as 'a1:b3',
+    # 0-indexed
+    start, end = location.split(':')
+    return Sheet.split_cell_ref(start) + Sheet.split_cell_ref(end)
+
+def blocks(bounds):
+    col_1, row_1, col_2, row_2 = bounds
+    return [(block_col, block_row)
+            for block_col in range(col_1 // BLOCK_COLS, col_2 // BLOCK_COLS + 1)
+            for block_row in range(row_1 // BLOCK_ROWS, row_2 // BLOCK_ROWS + 1)]
+
+def contains(bounds, col, row):
+    return bounds[0] <= col <= bounds[2] and bounds[1] <= row <= bounds[3]
 
 class DependencyGraph:
+    # Cells are interned as integer node ids the first time they take part in
+    # an edge (or are ranked).  Adjacency sets, ranks and cycles are all kept
+    # per node id; (sheet, location) tuples are only built for callers.
+    #
+    # A range reference is one node, whose location is its key ('a1:b3', see
+    # compiler.range_key), so a formula over a large range adds one edge.
+    # While a range is referenced it is registered in a per-sheet index of
+    # blocks of cells, and the dependents of a cell are found by looking up
+    # the ranges containing it.  For the order and cycle tracking, the range
+    # also gets an edge from each formula cell (cell with references) inside
+    # it; cells without references are never evaluated after their
+    # dependents, so they need no edges.
 
     def __init__(self):
-        self.outgoing = {}
-        self.ingoing = {}
+        self.node_ids = {} # sheet -> {location -> node id}
+        self.nodes = [] # node id -> (sheet, location)
+        self.refs = [] # node id -> ids of the cells it references (outgoing)
+        self.dependents = [] # node id -> ids of the cells referencing it (ingoing)
+        self.ranks = [] # node id -> rank
+        self.next_rank = 0
+        self.cycles = {} # node id -> set of the ids in its cycle
+        self.cycle_changes = set() # ids of cells that joined or left a cycle
+        self.range_bounds = {} # range node id -> (col1, row1, col2, row2)
+        self.range_index = {} # sheet -> {block -> ids of referenced ranges overlapping it}
+        self.formula_index = {} # sheet -> {block -> ids of cells with references in it}
+        self.defer_order = False # while True, edges are added without restoring the order
+        self.aggregates = {} # referenced range node id -> RangeAggregate of its values
+        self.lookup_indexes = {} # (referenced range node id, vertical) -> LookupIndex of its search column or row
+
+    def node_id(self, sheet_name, location):
+        # interns a lowercase (sheet, location), returning its node id
+        sheet_ids = self.node_ids.get(sheet_name)
+        if sheet_ids is None:
+            sheet_ids = self.node_ids[sheet_name] = {}
+        node = sheet_ids.get(location)
+        if node is None:
+            node = sheet_ids[location] = len(self.nodes)
+            self.nodes.append((sys.intern(sheet_name), location))
+            self.refs.append(NO_EDGES)
+            self.dependents.append(NO_EDGES)
+            self.ranks.append((self.next_rank,))
+            self.next_rank += 1
+            if ':' in location:
+                self.range_bounds[node] = location_bounds(location)
+        return node
+
+    def find(self, sheet_name, location):
+        # the node id of a lowercase (sheet, location), or None
+        sheet_ids = self.node_ids.get(sheet_name)
+        return sheet_ids.get(location) if sheet_ids is not None else None
+
+    def adjacency_view(self, adjacency):
+        # the edges between cells, leaving out the range nodes
+        view = {}
+        for node, adjacent in enumerate(adjacency):
+            if node in self.range_bounds:
+                continue
+            adjacent = [self.nodes[other] for other in adjacent if other not in self.range_bounds]
+            if adjacent:
+                sn, loc = self.nodes[node]
+                view.setdefault(sn, {})[loc] = adjacent
+        return view
+
+    @property
+    def outgoing(self):
+        # {sheet: {location: [(sheet, location) referenced]}}, built on demand
+        return self.adjacency_view(self.refs)
+
+    @property
+    def ingoing(self):
+        # {sheet: {location: [(sheet, location) referencing it]}}, built on demand
+        return self.adjacency_view(self.dependents)
 
     def add_sheet(self, sheet_name):
-        sheet_name = sheet_name.lower()
-        if (sheet_name not in self.outgoing):
-            self.outgoing[sheet_name] = {}
-        if (sheet_name not in self.ingoing):
-            self.ingoing[sheet_name] = {}
-    
-    def outgoing_get(self, sheet_name, location):
-        sheet_name = sheet_name.lower()
-        location = location.lower()
+        self.node_ids.setdefault(sheet_name.lower(), {})
 
-        if (sheet_name not in self.outgoing or location not in self.outgoing[sheet_name]):
+    def outgoing_get(self, sheet_name, location):
+        node = self.find(sheet_name.lower(), location.lower())
+        if node is None:
             return []
-        return self.outgoing[sheet_name][location]
+        return [self.nodes[other] for other in self.refs[node]]
 
     def ingoing_get(self, sheet_name, location):
+        # the cells referencing the cell, directly or through a range
         sheet_name = sheet_name.lower()
         location = location.lower()
+        node = self.find(sheet_name, location)
+        if node is None:
+            dependents = []
+        else:
+            dependents = [self.nodes[other] for other in self.dependents[node]
+                          if other not in self.range_bounds]
+        if self.range_index.get(sheet_name) and ':' not in location:
+            ranges = self.containing_ranges(sheet_name, *Sheet.split_cell_ref(location))
+            if ranges:
+                for range_node in ranges:
+                    dependents.extend(self.nodes[other] for other in self.dependents[range_node])
+                dependents = list(dict.fromkeys(dependents))
+        return dependents
 
-        if (sheet_name not in self.ingoing or location not in self.ingoing[sheet_name]):
+    def containing_ranges(self, sheet_name, col, row):
+        # ids of the referenced ranges on the sheet containing the cell
+        sheet_index = self.range_index.get(sheet_name)
+        if not sheet_index:
             return []
-        return self.ingoing[sheet_name][location]
-    
+        candidates = sheet_index.get((col // BLOCK_COLS, row // BLOCK_ROWS), ())
+        return [node for node in candidates if contains(self.range_bounds[node], col, row)]
+
+    def referencing_locations(self, sheet_name):
+        # locations of the cells on the sheet that reference other cells
+        sheet_ids = self.node_ids.get(sheet_name.lower(), {})
+        return [loc for loc, node in sheet_ids.items() if self.refs[node] and node not in self.range_bounds]
+
+    def referenced_locations(self, sheet_name):
+        # locations of the cells on the sheet that other cells reference; a
+        # referenced range is represented by its top-left cell, which is
+        # enough to reach its dependents through ingoing_get()
+        sheet_ids = self.node_ids.get(sheet_name.lower(), {})
+        locations = {}
+        for loc, node in sheet_ids.items():
+            if node in self.range_bounds:
+                if self.dependents[node]:
+                    locations[loc.split(':')[0]] = True
+            elif any(other not in self.range_bounds for other in self.dependents[node]):
+                locations[loc] = True
+        return list(locations)
+
     def outgoing_reset(self, sheet_name, location):
-        sheet_name = sheet_name.lower()
-        location = location.lower()
-        if sheet_name in self.outgoing:
-            self.outgoing[sheet_name].pop(location, None)
+        node = self.find(sheet_name.lower(), location.lower())
+        if node is not None and self.refs[node]:
+            self.refs[node] = NO_EDGES
+            self.formula_changed(node, False)
 
     def outgoing_set(self, sheet_name, location, outgoing_arr):
-        sheet_name = sheet_name.lower()
-        location = location.lower()
-        if sheet_name not in self.outgoing:
-            self.outgoing[sheet_name] = {}
-        sheet_outgoing = self.outgoing[sheet_name]
-        sheet_outgoing[location] = outgoing_arr
+        node = self.node_id(sheet_name.lower(), location.lower())
+        refs = {self.node_id(sn.lower(), loc.lower()) for sn, loc in outgoing_arr}
+        if bool(self.refs[node]) != bool(refs):
+            self.formula_changed(node, bool(refs))
+        self.refs[node] = refs or NO_EDGES
 
     def outgoing_add(self, sheet_name_1, loc_1, sheet_name_2, loc_2):
-        sheet_name_1 = sheet_name_1.lower()
-        loc_1 = loc_1.lower()
-        sheet_name_2 = sheet_name_2.lower()
-        loc_2 = loc_2.lower()
-
-        if sheet_name_1 not in self.outgoing:
-            self.outgoing[sheet_name_1] = {}
-                
-        sheet_outgoing = self.outgoing[sheet_name_1]
-        if loc_1 not in sheet_outgoing:
-            sheet_outgoing[loc_1] = []
-        
-        sheet_outgoing[loc_1].append((sheet_name_2, loc_2))
+        node = self.node_id(sheet_name_1.lower(), loc_1.lower())
+        if not self.refs[node]:
+            self.formula_changed(node, True)
+        self.add_adjacent(self.refs, node, self.node_id(sheet_name_2.lower(), loc_2.lower()))
 
     def ingoing_add(self, sheet_name_1, loc_1, sheet_name_2, loc_2):
-        sheet_name_1 = sheet_name_1.lower()
-        loc_1 = loc_1.lower()
-        sheet_name_2 = sheet_name_2.lower()
-        loc_2 = loc_2.lower()
-
-        if sheet_name_1 not in self.ingoing:
-            self.ingoing[sheet_name_1] = {}
-                
-        sheet_ingoing = self.ingoing[sheet_name_1]
-        if loc_1 not in sheet_ingoing:
-            sheet_ingoing[loc_1] = []
-        
-        sheet_ingoing[loc_1].append((sheet_name_2, loc_2))
+        source = self.node_id(sheet_name_1.lower(), loc_1.lower())
+        target = self.node_id(sheet_name_2.lower(), loc_2.lower())
+        self.add_dependent(source, target)
 
-    def outgoing_remove(self, sheet_name_1, loc_1, sheet_name_2, loc_2):
-        sheet_name_1 = sheet_name_1.lower()
-        loc_1 = loc_1.lower()
-        sheet_name_2 = sheet_name_2.lower()
-        loc_2 = loc_2.lower()
+    def add_adjacent(self, adjacency, node, other):
+        if adjacency[node] is NO_EDGES:
+            adjacency[node] = set()
+        adjacency[node].add(other)
 
-        self.outgoing[sheet_name_1][loc_1].remove((sheet_name_2, loc_2))
+    def outgoing_remove(self, sheet_name_1, loc_1, sheet_name_2, loc_2):
+        node = self.find(sheet_name_1.lower(), loc_1.lower())
+        other = self.find(sheet_name_2.lower(), loc_2.lower())
+        if node is not None and other in self.refs[node]:
+            self.refs[node].remove(other)
+            if not self.refs[node]:
+                self.formula_changed(node, False)
 
     def ingoing_remove(self, sheet_name_1, loc_1, sheet_name_2, loc_2):
-        sheet_name_1 = sheet_name_1.lower()
-        loc_1 = loc_1.lower()
-        sheet_name_2 = sheet_name_2.lower()
-        loc_2 = loc_2.lower()
+        source = self.find(sheet_name_1.lower(), loc_1.lower())
+        target = self.find(sheet_name_2.lower(), loc_2.lower())
+        if source is not None and target in self.dependents[source]:
+            self.remove_dependent(source, target)
+
+    def add_dependent(self, source, target):
+        # adds the edge from source to the cell target, which references it;
+        # a range's own edges are added once the graph has this one
+        first = not self.dependents[source]
+        self.add_adjacent(self.dependents, source, target)
+        self.order_edge(source, target)
+        if first and source in self.range_bounds:
+            self.range_referenced(source)
+
+    def remove_dependent(self, source, target):
+        self.dependents[source].remove(target)
+        self.cycle_edge_removed(source, target)
+        if source in self.range_bounds and not self.dependents[source]:
+            self.range_unreferenced(source)
+
+    def add_range_edge(self, node, range_node):
+        # the edge from a formula cell to a range containing it
+        self.add_adjacent(self.dependents, node, range_node)
+        self.add_adjacent(self.refs, range_node, node)
+        self.order_edge(node, range_node)
+
+    def remove_range_edge(self, node, range_node):
+        self.dependents[node].remove(range_node)
+        self.refs[range_node].remove(node)
+        self.cycle_edge_removed(node, range_node)
+
+    def range_referenced(self, range_node):
+        # registers a range that is now referenced, with edges from the
+        # formula cells inside it
+        sheet_name = self.nodes[range_node][0]
+        bounds = self.range_bounds[range_node]
+        sheet_index = self.range_index.setdefault(sheet_name, {})
+        formula_index = self.formula_index.get(sheet_name, {})
+        for block in blocks(bounds):
+            sheet_index.setdefault(block, set()).add(range_node)
+            for node in formula_index.get(block, ()):
+                if contains(bounds, *Sheet.split_cell_ref(self.nodes[node][1])):
+                    self.add_range_edge(node, range_node)
+
+    def range_unreferenced(self, range_node):
+        self.aggregates.pop(range_node, None)
+        self.lookup_indexes.pop((range_node, True), None)
+        self.lookup_indexes.pop((range_node, False), None)
+        for node in list(self.refs[range_node]):
+            self.remove_range_edge(node, range_node)
+        sheet_index = self.range_index[self.nodes[range_node][0]]
+        for block in blocks(self.range_bounds[range_node]):
+            sheet_index[block].discard(range_node)
+            if not sheet_index[block]:
+                del sheet_index[block]
+
+    def range_aggregate(self, view, kernel):
+        # The aggregate of the values of the range a formula passed to a
+        # function, or None if the range is not referenced yet.  The aggregate
+        # is built from the range's cells the first time, and then kept up to
+        # date by value_changed() until the range is no longer referenced.
+        # An aggregate built for a sheet that has since been deleted (and
+        # replaced by one of the same name) is built again.
+        node = self.find(*view.key) if view.key is not None else None
+        if node is None or not self.dependents[node]:
+            return None
+        aggregate = self.aggregates.get(node)
+        if aggregate is None or aggregate.sheet is not view.sheet:
+            aggregate = self.aggregates[node] = RangeAggregate(view, kernel)
+        return aggregate
+
+    def lookup_index(self, view, vertical):
+        # The index of the search column (if vertical) or row of the range a
+        # formula passed to VLOOKUP (or HLOOKUP), or None if the range is not
+        # referenced yet; built, kept up to date and shared by every lookup
+        # over the range as aggregates are.
+        node = self.find(*view.key) if view.key is not None else None
+        if node is None or not self.dependents[node]:
+            return None
+        index = self.lookup_indexes.get((node, vertical))
+        if index is None or index.sheet is not view.sheet:
+            index = self.lookup_indexes[(node, vertical)] = LookupIndex(view, vertical)
+        return index
+
+    @property
+    def tracks_values(self):
+        # whether any range keeps state built from the values of its cells
+        return bool(self.aggregates or self.lookup_indexes)
+
+    def value_changed(self, sheet_name, location, prev_value, new_value):
+        # the value of the cell changed; updates the aggregates and lookup
+        # indexes of the referenced ranges containing it
+        col, row = Sheet.split_cell_ref(location)
+        for range_node in self.containing_ranges(sheet_name, col, row):
+            aggregate = self.aggregates.get(range_node)
+            if aggregate is not None:
+                aggregate.update(prev_value, new_value)
+            if self.lookup_indexes:
+                for vertical in (True, False):
+                    index = self.lookup_indexes.get((range_node, vertical))
+                    if index is not None:
+                        index.update(col, row, prev_value, new_value)
+
+    def formula_changed(self, node, referencing):
+        # A cell is gaining its first reference, or has lost its last one; it
+        # is indexed, and connected to the referenced ranges containing it,
+        # only while it has references.  The range edges are added before the
+        # cell's first reference, so that the order search (which follows
+        # refs) only sees edges that are also in dependents.
+        sheet_name, location = self.nodes[node]
+        col, row = Sheet.split_cell_ref(location)
+        block = (col // BLOCK_COLS, row // BLOCK_ROWS)
+        sheet_index = self.formula_index.setdefault(sheet_name, {})
+        if referencing:
+            sheet_index.setdefault(block, set()).add(node)
+            for range_node in self.containing_ranges(sheet_name, col, row):
+                self.add_range_edge(node, range_node)
+        else:
+            sheet_index[block].discard(node)
+            if not sheet_index[block]:
+                del sheet_index[block]
+            for range_node in self.containing_ranges(sheet_name, col, row):
+                if range_node in self.dependents[node]:
+                    self.remove_range_edge(node, range_node)
+
+    # Topological order.  Every cell is given a rank such that a cell ranks
+    # below the cells that reference it; the order is kept up to date as edges
+    # are added, using the Pearce-Kelly algorithm, which only reorders the
+    # cells ranked between the two ends of an edge that violates the order.
+    #
+    # Cycles are kept as strongly connected components: the cells of a cycle
+    # share one rank, so the order is one of the graph of components.  An
+    # edge closing a cycle merges the cells ranked between its two ends that
+    # it connects, and removing an edge inside a cycle only re-examines the
+    # cells of that cycle.  Ranks are tuples, so that the cells of a cycle
+    # that splits can be ranked between the cycle's neighbours.
+
+    def rank(self, node):
+        return self.ranks[self.node_id(*node)]
+
+    def order_get(self, sheet_name, location):
+        return self.ranks[self.node_id(sheet_name.lower(), location.lower())]
+
+    def in_cycle(self, sheet_name, location):
+        return self.find(sheet_name.lower(), location.lower()) in self.cycles
+
+    def pop_cycle_changes(self):
+        # returns the cells that joined or left a cycle since the last call
+        changes = [self.nodes[node] for node in self.cycle_changes
+                   if node not in self.range_bounds]
+        self.cycle_changes.clear()
+        return changes
+
+    def set_component(self, nodes):
+        # marks the cells as one cycle
+        component = set(nodes)
+        for node in component:
+            if node not in self.cycles:
+                self.cycle_changes.add(node)
+            self.cycles[node] = component
+
+    def has_self_loop(self, node):
+        return node in self.dependents[node]
+
+    def order_search(self, start, adjacency, in_region):
+        # collects the cells reachable from start through cells in the region
+        found = {start}
+        stack = [start]
+        while stack:
+            for node in adjacency[stack.pop()]:
+                if node not in found and in_region(self.ranks[node]):
+                    found.add(node)
+                    stack.append(node)
+        return found
+
+    def order_edge(self, source, target):
+        # Restores the order after adding an edge from source (the referenced
+        # cell) to target (the cell referencing it).  Returns False if the
+        # edge is part of a cycle, which is merged into one component.
+        if self.defer_order:
+            return True
+        if source == target:
+            if source not in self.cycles:
+                self.set_component([source])
+            return False
+
+        lower, upper = self.ranks[target], self.ranks[source]
+        if lower > upper:
+            return True
+        if lower == upper:
+            # both cells are already in the same cycle
+            return False
+
+        forward = self.order_search(target, self.dependents, lambda rank: rank <= upper)
+        backward = self.order_search(source, self.refs, lambda rank: lower <= rank)
+        cycle = forward & backward if source in forward else set()
+
+        # the cells reaching source move ahead of the cells reachable from
+        # target, each group keeping its relative order; the cells of a new
+        # cycle go in between with one rank
+        before = sorted({self.ranks[node] for node in backward - cycle})
+        after = sorted({self.ranks[node] for node in forward - cycle})
+        pool = sorted({self.ranks[node] for node in forward | backward})
+        # the pool holds the ranks of both groups and of the cycle, so it is
+        # longer than either group: the cells reaching source take its
+        # lowest ranks, and the cells reachable from target its highest
+        assert len(before) + len(after) + bool(cycle) <= len(pool)
+        new_rank = dict(zip(before, pool, strict=False))
+        new_rank.update(zip(after, pool[len(pool) - len(after):], strict=False))
+        cycle_rank = pool[len(before)] if cycle else None
+        for node in forward | backward:
+            if node in cycle:
+                self.ranks[node] = cycle_rank
+            else:
+                self.ranks[node] = new_rank[self.ranks[node]]
+
+        if cycle:
+            self.set_component(cycle)
+            return False
+        return True
+
+    def cycle_edge_removed(self, source, target):
+        # splits the cycle containing both ends of a removed edge, if any
+        if self.defer_order:
+            return
+        component = self.cycles.get(source)
+        if component is None or target not in component:
+            return
+
+        components = self.strong_components(component)
+        if len(components) == 1 and (len(component) > 1 or self.has_self_loop(source)):
+            return
+
+        for node in component:
+            del self.cycles[node]
+            self.cycle_changes.add(node)
+        rank = self.ranks[source]
+        for i, nodes in enumerate(components):
+            for node in nodes:
+                self.ranks[node] = rank + (i,)
+            if len(nodes) > 1 or self.has_self_loop(next(iter(nodes))):
+                self.set_component(nodes)
+
+    def begin_bulk(self, num_cells):
+        # Called before num_cells cells get their edges rebuilt.  If that is
+        # a large part of the graph, restoring the order edge by edge could
+        # take quadratic time (e.g. a block written in the opposite order to
+        # its references), so the order is left until end_bulk().
+        self.defer_order = num_cells * BULK_ORDER_RATIO >= len(self.nodes)
+
+    def end_bulk(self):
+        if self.defer_order:
+            self.defer_order = False
+            self.reorder()
+
+    def reorder(self):
+        # rebuilds the order and the cycles of the whole graph in one pass;
+        # cells that joined or left a cycle are added to cycle_changes
+        components = self.strong_components(range(len(self.nodes)))
+        cycles = {}
+        for i, nodes in enumerate(components):
+            for node in nodes:
+                self.ranks[node] = (i,)
+            if len(nodes) > 1 or self.has_self_loop(next(iter(nodes))):
+                if self.cycles.get(next(iter(nodes))) != nodes:
+                    self.cycle_changes.update(nodes)
+                for node in nodes:
+                    cycles[node] = nodes
+        self.next_rank = len(components)
+        self.cycle_changes.update(node for node in self.cycles if node not in cycles)
+        self.cycles = cycles
+
+    def strong_components(self, nodes):
+        # Tarjan's algorithm over the edges between the given cells; returns
+        # the strongly connected components in topological order
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        components = []
+
+        for root in nodes:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.dependents[root]))]
+
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if child not in nodes:
+                        continue
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(self.dependents[child])))
+                        break
+                    if child in on_stack:
+                        low[node] = min(low[node], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = set()
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.add(member)
+                            if member == node:
+                                break
+                        components.append(component)
+
+        components.reverse()
+        return components
+
+    def rename_sheet(self, sheet_name, new_sheet_name):
+        # Renames the sheet's cells in place, keeping their node ids.  Cells
+        # that were already referenced under the new name (while no sheet had
+        # it) are merged into the renamed cells.
+        sheet_name = sheet_name.lower()
+        new_sheet_name = new_sheet_name.lower()
+        sheet_ids = self.node_ids.pop(sheet_name, {})
+        new_sheet_ids = self.node_ids.setdefault(new_sheet_name, {})
+
+        merges = []
+        for loc, node in sheet_ids.items():
+            merged = new_sheet_ids.get(loc)
+            if merged is not None:
+                merges.append((merged, node))
+            self.nodes[node] = (new_sheet_name, loc)
+            new_sheet_ids[loc] = node
+
+        for index in (self.range_index, self.formula_index):
+            new_index = index.setdefault(new_sheet_name, {})
+            for block, nodes in index.pop(sheet_name, {}).items():
+                new_index.setdefault(block, set()).update(nodes)
 
-        self.ingoing[sheet_name_1][loc_1].remove((sheet_name_2, loc_2))
\ No newline at end of file
+        for merged, node in merges:
+            for other in list(self.dependents[merged]):
+                self.remove_dependent(merged, other)
+                self.refs[other].remove(merged)
+                self.add_adjacent(self.refs, other, node)
+                self.add_dependent(node, other)
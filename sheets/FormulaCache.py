@@ -0,0 +1,85 @@
+import os
+import lark
+from collections import OrderedDict
+from .Sheet import Sheet
+from .compiler import compile_tree, relative_formula
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+lark_path = os.path.join(current_dir, "formulas.lark")
+parser = lark.Lark.open(lark_path, start='formula', parser='lalr', cache=True)
+
+class FormulaCache:
+    '''
+    Bounded LRU caches of parse trees, keyed by formula text, and of compiled
+    programs (see compiler.FormulaCompiler), keyed by the relative form of the
+    formula.  A formula filled down a column therefore has one program shared
+    by every cell, each of which evaluates it against its own location.
+
+    The cached trees and programs are shared between every cell (in every
+    workbook) that holds the same formula, so they must be treated as
+    immutable; the evaluator and the transformers only read them.  Formulas
+    that fail to parse are cached too, and are reported as None.
+    '''
+
+    def __init__(self, maxsize=8192):
+        self.maxsize = maxsize
+        self.trees = OrderedDict()
+        self.programs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, entries, key, build):
+        # looks the key up in one of the caches, building and storing the
+        # entry on a miss
+        if key in entries:
+            self.hits += 1
+            entries.move_to_end(key)
+            return entries[key]
+
+        self.misses += 1
+        try:
+            entry = build()
+        except lark.exceptions.LarkError:
+            entry = None
+
+        entries[key] = entry
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return entry
+
+    def parse(self, formula):
+        formula = formula.strip()
+        return self.fetch(self.trees, formula, lambda: parser.parse(formula))
+
+    def compile(self, formula, location):
+        # Only formulas that parse are looked up by their relative form: the
+        # text of a formula that does not parse may already look like the
+        # relative form of one that does (such as '={C[-1]R[0]}').
+        tree = self.parse(formula)
+        if tree is None:
+            return None
+        col_idx, row_idx = Sheet.split_cell_ref(location)
+        key = relative_formula(formula.strip(), col_idx, row_idx)
+        return self.fetch(self.programs, key, lambda: compile_tree(tree, col_idx, row_idx))
+
+    def clear(self):
+        self.trees.clear()
+        self.programs.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_info(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.trees) + len(self.programs), 'maxsize': self.maxsize}
+
+formula_cache = FormulaCache()
+
+def parse_formula(formula):
+    # Returns the shared parse tree for the formula text, or None if the
+    # formula cannot be parsed.
+    return formula_cache.parse(formula)
+
+def compile_formula(formula, location):
+    # Returns the shared compiled program for the formula entered at the
+    # given location, or None if the formula cannot be parsed.
+    return formula_cache.compile(formula, location)
@@ -0,0 +1,49 @@
+import bisect
+
+class LookupIndex:
+    # The positions in the search column (or row) of a referenced range of
+    # each value found there, in order, so that VLOOKUP (or HLOOKUP) finds a
+    # key's first match without scanning.  The index is shared by every
+    # lookup over the range and kept up to date as the values of the search
+    # column change (see DependencyGraph.lookup_index).  Values are matched
+    # as the scan matched them, by ==, which dict keys also follow; empty
+    # cells are not indexed.
+
+    __slots__ = ('sheet', 'view', 'vertical', 'positions')
+
+    def __init__(self, view, vertical):
+        # vertical: the search column is the range's first column (VLOOKUP);
+        # otherwise the search row is its first row (HLOOKUP)
+        self.sheet = view.sheet
+        self.view = view
+        self.vertical = vertical
+        self.positions = {} # value -> positions (0-indexed within the range) holding it
+        search = view.columns(0) if vertical else view.rows(0)
+        for row, col, cell in search.cells():
+            if cell.value.val is not None:
+                self.positions.setdefault(cell.value.val, []).append(row if vertical else col)
+
+    def find(self, val):
+        # the first position holding the value, or None
+        positions = self.positions.get(val)
+        return positions[0] if positions else None
+
+    def update(self, col, row, prev_value, new_value):
+        # the cell at the 0-indexed sheet coordinates, within the range,
+        # changed from prev_value to new_value
+        if self.vertical:
+            if col != self.view.col_1:
+                return
+            position = row - self.view.row_1
+        else:
+            if row != self.view.row_1:
+                return
+            position = col - self.view.col_1
+
+        if prev_value.val is not None:
+            positions = self.positions[prev_value.val]
+            del positions[bisect.bisect_left(positions, position)]
+            if not positions:
+                del self.positions[prev_value.val]
+        if new_value.val is not None:
+            bisect.insort(self.positions.setdefault(new_value.val, []), position)
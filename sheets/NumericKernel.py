@@ -0,0 +1,155 @@
+import decimal
+import math
+from .CellError import CellError, CellErrorType
+from .CellValue import CellValue
+
+# Numeric kernels: how a workbook represents numbers and does arithmetic on
+# them.  A workbook picks its kernel when it is created (see Workbook()), and
+# the compiled formulas, the spreadsheet functions and the parsing of number
+# contents all go through it, so one compiled program serves workbooks of
+# either kind.
+
+# the types of number values, under any kernel
+NUMBER_TYPES = (decimal.Decimal, float)
+
+# the context of exact Decimal totals, under which addition never rounds
+EXACT_CONTEXT = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+
+class DecimalKernel:
+    # Numbers are decimal.Decimal values, computed with 500 digits of
+    # precision.  Arithmetic results are used as they are, trailing zeros and
+    # all; only the values stored in cells are put in canonical form, without
+    # trailing zeros after the decimal point.
+    name = 'decimal'
+    index = 0
+    number_types = {decimal.Decimal}
+
+    def __init__(self):
+        self.zero = CellValue(decimal.Decimal('0'))
+
+    def number(self, text):
+        # the number written as text, which CellValue.is_number() accepts
+        return decimal.Decimal(CellValue.strip_trailing_zeros(text))
+
+    def value(self, number):
+        # the value of an arithmetic result
+        return CellValue(number)
+
+    def to_number(self, value):
+        # converts a value to a number, or a TYPE_ERROR if it is not one
+        return value.to_number()
+
+    def total(self, numbers):
+        # the sum of a list of numbers, rounded once
+        return self.from_exact(self.exact_total(numbers))
+
+    # Exact totals, which numbers are added to and removed from (see
+    # RangeAggregate) without rounding error, so that a running total and
+    # the total of the same numbers computed afresh are the same number.
+
+    def exact(self, number):
+        # the number as a term of an exact total
+        return number
+
+    def exact_total(self, numbers):
+        with decimal.localcontext(EXACT_CONTEXT):
+            return sum(numbers)
+
+    def exact_add(self, total, term):
+        return EXACT_CONTEXT.add(total, term)
+
+    def from_exact(self, total):
+        # the number an exact total stands for, rounded to 500 digits
+        return +total
+
+    def negate(self, number):
+        # without rounding to the context's precision
+        return number.copy_negate()
+
+    def canonical(self, value):
+        # the value to store in a cell for a formula's result
+        number = value.val
+        if type(number) is not decimal.Decimal:
+            return value
+        # whole numbers lose their decimal places (100.0 is 100, not 1E+2),
+        # other numbers their trailing zeros
+        integral = number.to_integral_value()
+        if integral == number:
+            return CellValue(integral)
+        return CellValue(number.normalize())
+
+# the unit of the exact totals of floats, 2**-1074, as its reciprocal
+FLOAT_UNIT = 1 << 1074
+
+class FloatKernel:
+    # Numbers are float (double precision) values, which are much faster to
+    # compute with, for workbooks that do not need exact decimal results.
+    # Results too large for a float are TYPE_ERRORs.
+    name = 'float'
+    index = 1
+    number_types = {float}
+
+    def __init__(self):
+        self.zero = CellValue(0.0)
+
+    def number(self, text):
+        return float(text)
+
+    def value(self, number):
+        if math.isfinite(number):
+            # + 0.0 turns -0.0 into 0.0
+            return CellValue(number + 0.0)
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, 'Number is out of range'))
+
+    def to_number(self, value):
+        val = value.val
+        if type(val) is float:
+            return value
+        if val is None:
+            return self.zero
+        if isinstance(val, CellError):
+            return value
+        if isinstance(val, bool):
+            return CellValue(float(val))
+        val = str(val)
+        if CellValue.is_number(val):
+            return CellValue(float(val))
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, f'Invalid type for {val}'))
+
+    def total(self, numbers):
+        # without the rounding errors of adding one number at a time
+        try:
+            return math.fsum(numbers)
+        except OverflowError:
+            return self.from_exact(self.exact_total(numbers))
+
+    def exact(self, number):
+        # every float is a whole multiple of 2**-1074, so an exact total of
+        # them is kept as an int count of that unit
+        numerator, denominator = number.as_integer_ratio()
+        return numerator * (FLOAT_UNIT // denominator)
+
+    def exact_total(self, numbers):
+        return sum(map(self.exact, numbers))
+
+    def exact_add(self, total, term):
+        return total + term
+
+    def from_exact(self, total):
+        # int division is correctly rounded, as math.fsum() is
+        try:
+            return total / FLOAT_UNIT
+        except OverflowError:
+            return math.inf if total > 0 else -math.inf
+
+    def negate(self, number):
+        return -number
+
+    def canonical(self, value):
+        return value
+
+DECIMAL_KERNEL = DecimalKernel()
+FLOAT_KERNEL = FloatKernel()
+
+# the kernels by name, and in order of their index
+KERNELS = {kernel.name: kernel for kernel in (DECIMAL_KERNEL, FLOAT_KERNEL)}
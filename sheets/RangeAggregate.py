@@ -0,0 +1,102 @@
+import heapq
+
+class RangeAggregate:
+    # The count, total, minimum and maximum of the numbers in a referenced
+    # range, kept up to date as the values of its cells change (see
+    # DependencyGraph.range_aggregate), so that SUM, COUNT, AVERAGE, MIN and
+    # MAX over a large range do not visit every cell each time one of them
+    # changes.  The total is kept in the kernel's exact form (see
+    # NumericKernel), so adding and removing numbers does not accumulate
+    # rounding error.
+    #
+    # The minimum and maximum are kept in heaps, built on first use, from
+    # which removed numbers are dropped lazily: live counts the occurrences of
+    # each number still in the range.
+    #
+    # Values that are not numbers are only counted, in others; aggregates of
+    # a range holding any are not used, as its values must be converted (or
+    # reported as errors) one by one.
+
+    __slots__ = ('sheet', 'view', 'kernel', 'count', 'others', 'total',
+                 'live', 'min_heap', 'max_heap')
+
+    def __init__(self, view, kernel):
+        self.sheet = view.sheet
+        self.view = view
+        self.kernel = kernel
+        values = view.values()
+        numbers = self.numbers(values)
+        self.count = len(numbers)
+        self.others = len(values) - self.count
+        self.total = kernel.exact_total(numbers)
+        self.live = None
+        self.min_heap = None
+        self.max_heap = None
+
+    def numbers(self, values):
+        # the numbers among the values of the range's cells
+        number_types = self.kernel.number_types
+        return [value.val for value in values if type(value.val) in number_types]
+
+    def update(self, prev_value, new_value):
+        # a cell of the range changed from prev_value to new_value
+        self.remove(prev_value.val)
+        self.add(new_value.val)
+
+    def add(self, val):
+        if val is None:
+            return
+        if type(val) not in self.kernel.number_types:
+            self.others += 1
+            return
+        self.count += 1
+        self.total = self.kernel.exact_add(self.total, self.kernel.exact(val))
+        if self.live is not None:
+            self.live[val] = self.live.get(val, 0) + 1
+            heapq.heappush(self.min_heap, val)
+            heapq.heappush(self.max_heap, self.kernel.negate(val))
+
+    def remove(self, val):
+        if val is None:
+            return
+        if type(val) not in self.kernel.number_types:
+            self.others -= 1
+            return
+        self.count -= 1
+        self.total = self.kernel.exact_add(self.total, self.kernel.exact(self.kernel.negate(val)))
+        if self.live is not None:
+            if self.live[val] == 1:
+                del self.live[val]
+            else:
+                self.live[val] -= 1
+            # rebuild the heaps once most of their entries are removed numbers
+            if len(self.min_heap) > 2 * self.count + 64:
+                self.live = None
+
+    def sum(self):
+        return self.kernel.from_exact(self.total)
+
+    def heaps(self):
+        if self.live is None:
+            numbers = self.numbers(self.view.values())
+            self.live = {}
+            for number in numbers:
+                self.live[number] = self.live.get(number, 0) + 1
+            self.min_heap = numbers
+            heapq.heapify(self.min_heap)
+            self.max_heap = list(map(self.kernel.negate, numbers))
+            heapq.heapify(self.max_heap)
+        return self.min_heap, self.max_heap
+
+    def minimum(self):
+        # the smallest number of the range; the range must hold a number
+        min_heap = self.heaps()[0]
+        while min_heap[0] not in self.live:
+            heapq.heappop(min_heap)
+        return min_heap[0]
+
+    def maximum(self):
+        max_heap = self.heaps()[1]
+        while self.kernel.negate(max_heap[0]) not in self.live:
+            heapq.heappop(max_heap)
+        return self.kernel.negate(max_heap[0])
@@ -0,0 +1,69 @@
+from operator import attrgetter
+from .CellValue import CellValue, EMPTY
+from .Sheet import cell_key
+
+get_value = attrgetter('value')
+
+class RangeView:
+    # A rectangular range of cells of a sheet, as a formula's range reference
+    # passes it to a spreadsheet function.  The view reads the sheet's cell
+    # store when it is used, rather than copying the range into a grid of
+    # cells, so a function can visit only the populated cells of a large
+    # range.  Rows and columns are 0-indexed within the range.
+
+    __slots__ = ('sheet', 'col_1', 'row_1', 'col_2', 'row_2', 'key')
+
+    def __init__(self, sheet, col_1, row_1, col_2, row_2, key=None):
+        # the 0-indexed sheet coordinates of the corners, inclusive, and the
+        # (sheet, range location) the formula referenced, if the view is of a
+        # whole range reference
+        self.sheet = sheet
+        self.col_1 = col_1
+        self.row_1 = row_1
+        self.col_2 = col_2
+        self.row_2 = row_2
+        self.key = key
+
+    @property
+    def num_rows(self):
+        return self.row_2 - self.row_1 + 1
+
+    @property
+    def num_cols(self):
+        return self.col_2 - self.col_1 + 1
+
+    def cells(self):
+        # (row, col, cell) for the cells with contents, in row-major order
+        return [(row_idx - self.row_1, col_idx - self.col_1, cell)
+                for col_idx, row_idx, cell in self.sheet.cells_in_range(
+                    self.col_1, self.row_1, self.col_2, self.row_2)]
+
+    def values(self):
+        # the values of the cells with contents, in row-major order
+        values = list(map(get_value, self.sheet.range_cells(
+            self.col_1, self.row_1, self.col_2, self.row_2)))
+        if EMPTY in values or None in values:
+            values = [value for value in values if value is not None and value is not EMPTY]
+        return values
+
+    def value(self, row, col):
+        # the value of the cell at (row, col) of the range; empty if the cell
+        # has no contents
+        cell = self.sheet.cells.get(cell_key(self.col_1 + col, self.row_1 + row))
+        if cell is None or cell.value is None:
+            return CellValue(None)
+        return cell.value
+
+    def rows(self, start, stop=None):
+        # the view of rows start (inclusive) to stop (exclusive) of the range,
+        # or of row start alone
+        stop = start + 1 if stop is None else stop
+        return RangeView(self.sheet, self.col_1, self.row_1 + start,
+                         self.col_2, self.row_1 + stop - 1)
+
+    def columns(self, start, stop=None):
+        # the view of columns start (inclusive) to stop (exclusive) of the
+        # range, or of column start alone
+        stop = start + 1 if stop is None else stop
+        return RangeView(self.sheet, self.col_1 + start, self.row_1,
+                         self.col_1 + stop - 1, self.row_2)
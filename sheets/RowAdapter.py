@@ -3,6 +3,34 @@ from functools import total_ordering
 from .Cell import Cell
 from .CellError import CellError, CellErrorType
 from .CellValue import CellValue
+from .NumericKernel import NUMBER_TYPES
+
+def sort_value(value):
+    """
+    The key a cell's value sorts by, ordering values by type first:
+    1. Blank
+    2. Cell error
+    3. Numeric 
+    4. Text
+    5. Bool
+    6. Other
+    """
+    if value is None:
+        return (0, decimal.Decimal("-Infinity"))  # Blank cells sort first
+
+    if isinstance(value, CellError):
+        return (1, value.get_type().value)
+
+    if isinstance(value, NUMBER_TYPES):
+        return (2, value)
+    
+    if isinstance(value, str):
+        return (3, value.lower())
+
+    if isinstance(value, bool):
+        return (4, int(value))
+
+    return (5, str(value))
 
 @total_ordering
 class RowAdapter:
@@ -21,7 +49,7 @@ class RowAdapter:
             val_1, val_2 = self._get_cell_sort_value(cell)
 
             if col < 0:  # Handle descending order
-                if isinstance(val_2, (decimal.Decimal)):
+                if isinstance(val_2, NUMBER_TYPES):
                     val_2 = -val_2
                 elif isinstance(val_2, str):
                     val_2 = "".join(chr(255 - ord(c)) for c in val_2) # reverse lexicographically
@@ -31,35 +59,9 @@ class RowAdapter:
         return tuple(key)
 
     def _get_cell_sort_value(self, cell):
-        """
-        1. Blank
-        2. Cell error
-        3. Numeric 
-        4. Text
-        5. Bool
-        6. Other
-        """
         if cell is None or cell.value is None:
-            return (0, decimal.Decimal("-Infinity"))
-
-        value = cell.value.val
-
-        if value is None:
-            return (0, decimal.Decimal("-Infinity"))  # Blank cells sort first
-
-        if isinstance(value, CellError):
-            return (1, value.get_type().value)
-
-        if isinstance(value, decimal.Decimal):
-            return (2, decimal.Decimal(value))
-        
-        if isinstance(value, str):
-            return (3, value.lower())
-
-        if isinstance(value, bool):
-            return (4, int(value))
-
-        return (5, str(value))
+            return sort_value(None)
+        return sort_value(cell.value.val)
 
     def __eq__(self, other):
         return self.get_sort_key() == other.get_sort_key()
@@ -1,19 +1,130 @@
+import functools
+import heapq
 from .Cell import Cell
 from typing import Optional, Tuple
 
+# Cells are stored sparsely, keyed by their packed coordinates: the row in
+# the high bits and the column in the low bits, so that sorting the keys puts
+# the cells in row-major order.  Columns go up to ZZZZ (475254 columns).
+COL_BITS = 19
+COL_MASK = (1 << COL_BITS) - 1
+
+def cell_key(col_idx, row_idx):
+    return (row_idx << COL_BITS) | col_idx
+
+def key_coords(key):
+    # the (col_idx, row_idx) of a packed cell key
+    return key & COL_MASK, key >> COL_BITS
+
+# Locations are converted to and from coordinates through bounded caches, so
+# the locations a workbook keeps using are only parsed (or built) once.
+LOCATION_CACHE_SIZE = 1 << 14
+
 class Sheet:
     def __init__(self, sheet_name=''):
         self.sheet_name = sheet_name
         self.num_rows = 0
         self.num_cols = 0
-        self.cells = []
-    
+        self.cells = {} # packed coordinates -> Cell, for the cells with contents
+        # the number of stored cells in each occupied row and column, and
+        # max-heaps (of negated indices) of the rows and columns that became
+        # occupied, from which the extent is found when its edge is cleared;
+        # entries for rows and columns emptied since are skipped lazily
+        self.row_counts = {}
+        self.col_counts = {}
+        self.row_heap = []
+        self.col_heap = []
+
     def get_cell(self, location):
-        if (self.out_of_bounds(location)):
-            return None
+        # the cell at the location, or None if it is empty
+        return self.cells.get(cell_key(*Sheet.split_cell_ref(location)))
+
+    def get_cell_at(self, col_idx, row_idx):
+        # the cell at the 0-indexed coordinates, or None if it is empty
+        return self.cells.get(cell_key(col_idx, row_idx))
+
+    def add_cell(self, location):
+        # the cell at the location, created (and the extent grown) if it is
+        # empty
         col_idx, row_idx = Sheet.split_cell_ref(location)
-        return self.cells[row_idx][col_idx]
-    
+        key = cell_key(col_idx, row_idx)
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = Cell()
+            Sheet.occupy(self.row_counts, self.row_heap, row_idx)
+            Sheet.occupy(self.col_counts, self.col_heap, col_idx)
+            self.resize_sheet(max(self.num_rows, row_idx + 1), max(self.num_cols, col_idx + 1))
+        return cell
+
+    def remove_cell(self, col_idx, row_idx):
+        del self.cells[cell_key(col_idx, row_idx)]
+        Sheet.vacate(self.row_counts, row_idx)
+        Sheet.vacate(self.col_counts, col_idx)
+
+    @staticmethod
+    def occupy(counts, heap, index):
+        if index in counts:
+            counts[index] += 1
+        else:
+            counts[index] = 1
+            heapq.heappush(heap, -index)
+            # rebuild the heap once most of its entries are for rows (or
+            # columns) emptied since, so repeatedly filling and clearing
+            # cells within the extent does not grow it
+            if len(heap) > 2 * len(counts) + 64:
+                heap[:] = [-i for i in counts]
+                heapq.heapify(heap)
+
+    @staticmethod
+    def vacate(counts, index):
+        if counts[index] == 1:
+            del counts[index]
+        else:
+            counts[index] -= 1
+
+    @staticmethod
+    def last_occupied(counts, heap):
+        # one past the highest occupied index
+        while heap and -heap[0] not in counts:
+            heapq.heappop(heap)
+        return -heap[0] + 1 if heap else 0
+
+    def cell_items(self):
+        # (location, cell) for the cells with contents, in row-major order
+        return [(Sheet.to_sheet_coords(*key_coords(key)), self.cells[key])
+                for key in sorted(self.cells)]
+
+    def range_keys(self, col_1, row_1, col_2, row_2):
+        # the keys of the cells with contents within the 0-indexed bounds, in
+        # row-major order.  Small ranges look their cells up a row (or, for a
+        # single column, the whole column) at a time; ranges larger than the
+        # number of stored cells scan the store.
+        cells = self.cells
+        if (col_2 - col_1 + 1) * (row_2 - row_1 + 1) <= len(cells):
+            if col_1 == col_2:
+                return list(filter(cells.__contains__, range(
+                    cell_key(col_1, row_1), cell_key(col_1, row_2) + 1, 1 << COL_BITS)))
+            found = []
+            for row_idx in range(row_1, row_2 + 1):
+                base = row_idx << COL_BITS
+                found.extend(filter(cells.__contains__, range(base | col_1, base | col_2 + 1)))
+            return found
+        lo, hi = cell_key(col_1, row_1), cell_key(col_2, row_2)
+        return sorted(key for key in cells
+                      if lo <= key <= hi and col_1 <= key & COL_MASK <= col_2)
+
+    def cells_in_range(self, col_1, row_1, col_2, row_2):
+        # (col_idx, row_idx, cell) for the cells with contents within the
+        # 0-indexed bounds, in row-major order
+        cells = self.cells
+        return [key_coords(key) + (cells[key],)
+                for key in self.range_keys(col_1, row_1, col_2, row_2)]
+
+    def range_cells(self, col_1, row_1, col_2, row_2):
+        # the cells with contents within the 0-indexed bounds, in row-major
+        # order
+        return list(map(self.cells.__getitem__, self.range_keys(col_1, row_1, col_2, row_2)))
+
     @staticmethod
     def index_to_col(col_index):
         col = ""
@@ -22,6 +133,8 @@ class Sheet:
             col_index = col_index // 26 - 1
         return col
 
+    @staticmethod
+    @functools.lru_cache(maxsize=LOCATION_CACHE_SIZE)
     def to_sheet_coords(col_index, row_index):
         """
         Converts 0-indexed coordinates (col_index, row_index) to spreadsheet coordinates.
@@ -29,6 +142,13 @@ class Sheet:
         col = Sheet.index_to_col(col_index)
         row = str(row_index + 1)
         return col + row
+
+    @staticmethod
+    @functools.lru_cache(maxsize=LOCATION_CACHE_SIZE)
+    def location_key(col_index, row_index):
+        # the lowercase location of 0-indexed coordinates, as cells are keyed
+        # in the dependency graph and notifications
+        return Sheet.to_sheet_coords(col_index, row_index).lower()
     
     def str_to_index(column: str) -> int:
         column = column.lower()
@@ -43,6 +163,8 @@ class Sheet:
     def is_row_mixed_ref(location: str) -> bool:
         return '$' in location[1:]
     
+    @staticmethod
+    @functools.lru_cache(maxsize=LOCATION_CACHE_SIZE)
     def split_cell_ref(location: str) -> Tuple[int, int]:
         i = 0
         # check if column has $
@@ -60,81 +182,30 @@ class Sheet:
             row = location[i:]
         return Sheet.str_to_index(col), int(row) - 1
 
-    def out_of_bounds(self, location):
-        col_idx, row_idx = Sheet.split_cell_ref(location)
-        if (col_idx >= self.num_cols or row_idx >= self.num_rows):
-            return True
-        return False
-    
     def resize_sheet(self, new_num_rows, new_num_cols) -> None:
-        # resizes sheet and updates num_rows and num_cols fields accordingly
-
-        # Add rows
-        for row_idx in range(self.num_rows, new_num_rows):
-            row = []
-            for col_idx in range(self.num_cols):
-                location = Sheet.to_sheet_coords(col_idx, row_idx)
-                cell = Cell(location, None)
-                row.append(cell)
-            self.cells.append(row)
-
-        # Add columns
-        for row_idx, row in enumerate(self.cells):
-            for col_idx in range(self.num_cols, new_num_cols):
-                location = Sheet.to_sheet_coords(col_idx, row_idx)
-                cell = Cell(location, None)
-                row.append(cell)
-
+        # updates num_rows and num_cols; storage is sparse, so no cells are
+        # allocated for the new extent
         self.num_rows = new_num_rows
         self.num_cols = new_num_cols
     
-    def resize(self, location):
-        col_idx, row_idx = Sheet.split_cell_ref(location)
-
-        updated_num_rows = max(self.num_rows, row_idx + 1)
-        updated_num_cols = max(self.num_cols, col_idx + 1)
-
-        self.resize_sheet(updated_num_rows, updated_num_cols)
-    
     def get_cell_contents(self, location: str) -> Optional[str]:
-        if (self.out_of_bounds(location)):
-            return None
-        return self.get_cell(location).contents
+        cell = self.get_cell(location)
+        return cell.contents if cell is not None else None
     
     def empty_row(self, row_idx):
-        for col_idx in range(self.num_cols):
-            if (self.cells[row_idx][col_idx].contents is not None):
-                return False
-        return True
+        return row_idx not in self.row_counts
     
     def empty_col(self, col_idx):
-        for row_idx in range(self.num_rows):
-            if (self.cells[row_idx][col_idx].contents is not None):
-                return False
-        return True
-    
-    def delete_row(self):
-        self.cells = self.cells[:-1]
-
-    def delete_col(self):
-        for row_idx in range(self.num_rows):
-            self.cells[row_idx] = self.cells[row_idx][:-1]
+        return col_idx not in self.col_counts
     
     def check_shrink(self, location):
+        # drops the cell at the location if it was emptied, and shrinks the
+        # extent to the occupied rows and columns if it was on its edge
         col_idx, row_idx = Sheet.split_cell_ref(location)
-        if (col_idx == self.num_cols - 1):
-            # try to reduce columns
-            while self.num_cols > 0:
-                if (self.empty_col(self.num_cols - 1)):
-                    self.num_cols -= 1
-                    self.delete_col()
-                else:
-                    break
-        if (row_idx == self.num_rows - 1):
-            # try to reduce rows
-            while self.num_rows > 0:
-                if (self.empty_row(self.num_rows - 1)):
-                    self.num_rows -= 1
-                    self.delete_row()
-                else:
-                    break
\ No newline at end of file
+        cell = self.cells.get(cell_key(col_idx, row_idx))
+        if cell is not None and cell.contents is None:
+            self.remove_cell(col_idx, row_idx)
+        if (col_idx == self.num_cols - 1 and self.empty_col(col_idx)) or \
+                (row_idx == self.num_rows - 1 and self.empty_row(row_idx)):
+            self.resize_sheet(Sheet.last_occupied(self.row_counts, self.row_heap),
+                              Sheet.last_occupied(self.col_counts, self.col_heap))
@@ -1,48 +1,55 @@
 from collections import defaultdict
+from operator import attrgetter
+import math
 import sheets
 from .CellValue import CellValue
 from .CellError import CellError, CellErrorType
-import decimal
+from .NumericKernel import NUMBER_TYPES
+from .RangeView import RangeView
+from .RowAdapter import sort_value
 import re
 
 def sheet_name_needs_quotes(sheet_name):
     pattern = r"^[A-Za-z_][A-Za-z0-9_]*$"
     return not bool(re.fullmatch(pattern, sheet_name))
 
-def visit_all(arg_tree, ev):
-    if arg_tree is None:
+# Spreadsheet functions receive their arguments as a tuple of compiled nodes
+# (see compiler.FormulaCompiler), and evaluate the ones they need with
+# ev.visit().
+
+get_val = attrgetter('val')
+
+def visit_all(arg_nodes, ev):
+    if arg_nodes is None:
         return []
-    args = ev.visit(arg_tree)
-    if not isinstance(args, list):
-        args = [args]
-    return args
+    return [ev.visit(arg) for arg in arg_nodes]
 
-def get_first_arg(arg_tree, ev, valid_arg_len):
-    if arg_tree is None:
+def get_first_arg(arg_nodes, ev, valid_arg_len):
+    if arg_nodes is None:
         return None, True
-    elif len(arg_tree.children) not in valid_arg_len:
+    elif len(arg_nodes) not in valid_arg_len:
         return None, True
     else:
-        arg_one = ev.visit(arg_tree.children[0])
+        arg_one = ev.visit(arg_nodes[0])
         return arg_one, False
 
-def get_ith_arg(arg_tree, ev, i):
-    if i < 0 or i >= len(arg_tree.children):
+def get_ith_arg(arg_nodes, ev, i):
+    if i < 0 or i >= len(arg_nodes):
         return None
-    return ev.visit(arg_tree.children[i])
+    return ev.visit(arg_nodes[i])
 
 # TODO: Propagate cell errors
 # BOOLEAN FUNCTIONS
-def and_function(arg_tree, ev):
+def and_function(arg_nodes, ev):
     """Returns TRUE if all arguments are TRUE. All arguments are converted to Boolean values."""
-    args = visit_all(arg_tree, ev)
+    args = visit_all(arg_nodes, ev)
     if len(args) == 0:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, "Expected at least 1 arguments, but got 0 arguments."))
     
     converted = []
     for cell_val in args:
         if not isinstance(cell_val.val, bool):
-            cell_val.to_bool()
+            cell_val = cell_val.to_bool()
 
             if isinstance(cell_val.val, sheets.CellError):
                 return cell_val
@@ -50,16 +57,16 @@ def and_function(arg_tree, ev):
         converted.append(cell_val.val)
     return CellValue(all(arg for arg in converted))
 
-def or_function(arg_tree, ev):
+def or_function(arg_nodes, ev):
     """Returns TRUE if any argument is TRUE. All arguments are converted to Boolean values."""
-    args = visit_all(arg_tree, ev)
+    args = visit_all(arg_nodes, ev)
     if len(args) == 0:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, "Expected at least 1 arguments, but got 0 arguments."))
     
     converted = []
     for cell_val in args:
         if not isinstance(cell_val.val, bool):
-            cell_val.to_bool()
+            cell_val = cell_val.to_bool()
 
             if isinstance(cell_val.val, sheets.CellError):
                 return cell_val
@@ -67,30 +74,30 @@ def or_function(arg_tree, ev):
         converted.append(cell_val.val)
     return CellValue(any(arg for arg in converted))
 
-def not_function(arg_tree, ev):
+def not_function(arg_nodes, ev):
     """Returns the logical negation of the argument. The argument is converted to a Boolean value."""
-    args = visit_all(arg_tree, ev)
+    args = visit_all(arg_nodes, ev)
     if len(args) != 1:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected exactly 1 argument, but got {len(args)} arguments."))
     
     arg = args[0]
     if not isinstance(arg.val, bool):
-        arg.to_bool()
+        arg = arg.to_bool()
 
         if isinstance(arg.val, sheets.CellError):
             return arg
         
     return CellValue(not arg.val)
 
-def xor_function(arg_tree, ev):
+def xor_function(arg_nodes, ev):
     """Returns TRUE if an odd number of arguments are TRUE. All arguments are converted to Boolean values."""
-    args = visit_all(arg_tree, ev)
+    args = visit_all(arg_nodes, ev)
     if len(args) == 0:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, "Expected at least 1 arguments, but got 0 arguments."))
     converted = []
     for cell_val in args:
         if not isinstance(cell_val.val, bool):
-            cell_val.to_bool()
+            cell_val = cell_val.to_bool()
 
             if isinstance(cell_val.val, sheets.CellError):
                 return cell_val
@@ -99,15 +106,15 @@ def xor_function(arg_tree, ev):
     return CellValue(sum(arg for arg in converted) % 2 == 1)
 
 # STRING-MATCH FUNCTIONS
-def exact_function(arg_tree, ev):
+def exact_function(arg_nodes, ev):
     """Returns TRUE if the two strings are identical. Case-sensitive. The arguments are converted to string values."""
-    args = visit_all(arg_tree, ev)
+    args = visit_all(arg_nodes, ev)
     if len(args) != 2:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected 2 arguments, but got {len(args)} arguments."))      
     converted = []
     for cell_val in args:
         if not isinstance(cell_val.val, str):
-            cell_val.to_string()
+            cell_val = cell_val.to_string()
 
             if isinstance(cell_val.val, sheets.CellError):
                 return cell_val
@@ -116,74 +123,74 @@ def exact_function(arg_tree, ev):
     return CellValue(converted[0] == converted[1])
 
 # CONDITIONAL FUNCTIONS
-def if_function(arg_tree, ev):
+def if_function(arg_nodes, ev):
     # arguments: condition, true_value, false_value=None 
     """Returns `true_value` if `condition` is TRUE, otherwise `false_value`. The condition is converted to a Boolean value."""
-    arg_one, not_enough_args = get_first_arg(arg_tree, ev, [2, 3])
+    arg_one, not_enough_args = get_first_arg(arg_nodes, ev, [2, 3])
     if not_enough_args:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected 2 or 3 arguments."))      
     
     if not isinstance(arg_one.val, bool):    
-        arg_one.to_bool()
+        arg_one = arg_one.to_bool()
 
         if isinstance(arg_one.val, sheets.CellError):
             return arg_one
     
     if arg_one.val:
-        value_1 = get_ith_arg(arg_tree, ev, 1)
+        value_1 = get_ith_arg(arg_nodes, ev, 1)
         return value_1
     else:
-        value_2 = get_ith_arg(arg_tree, ev, 2)
+        value_2 = get_ith_arg(arg_nodes, ev, 2)
         if value_2 is None:
             value_2 = CellValue(False)
         return value_2
     
-def iferror_function(arg_tree, ev):
+def iferror_function(arg_nodes, ev):
     """Returns `value` if it is not an error, otherwise `value_if_error`."""
-    arg_one, not_enough_args = get_first_arg(arg_tree, ev, [1, 2])
+    arg_one, not_enough_args = get_first_arg(arg_nodes, ev, [1, 2])
     if not_enough_args:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected 1 or 2 arguments."))     
     
     if not isinstance(arg_one.val, CellError):
         return arg_one
     else:
-        value_2 = get_ith_arg(arg_tree, ev, 1)
+        value_2 = get_ith_arg(arg_nodes, ev, 1)
         if value_2 is None:
             value_2 = CellValue("")
         return value_2
 
-def choose_function(arg_tree, ev):
+def choose_function(arg_nodes, ev):
     """Returns the `index`-th argument (1-based indexing). The index is converted to a number."""
-    if arg_tree is None or len(arg_tree.children) < 2:
+    if arg_nodes is None or len(arg_nodes) < 2:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected atleast 2 arguments."))
     
-    arg_one = ev.visit(arg_tree.children[0])
-    if not isinstance(arg_one.val, decimal.Decimal):    
-        arg_one.to_number()
+    arg_one = ev.visit(arg_nodes[0])
+    if not isinstance(arg_one.val, NUMBER_TYPES):    
+        arg_one = ev.kernel.to_number(arg_one)
 
         if isinstance(arg_one.val, sheets.CellError):
             return arg_one
     
-    if (arg_one.val != int(arg_one.val)) or (arg_one.val <= 0) or (arg_one.val > len(arg_tree.children)-1):
+    if (arg_one.val != int(arg_one.val)) or (arg_one.val <= 0) or (arg_one.val > len(arg_nodes)-1):
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Invalid Index."))  
     
     index = int(arg_one.val)
 
-    value = get_ith_arg(arg_tree, ev, index)
+    value = get_ith_arg(arg_nodes, ev, index)
 
     if value is None:
         value = CellValue("")
     return value
 
 # INFORMATIONAL FUNCTIONS
-def isblank_function(arg_tree, ev):
+def isblank_function(arg_nodes, ev):
     """
     Returns TRUE if empty cell value.
     evaluates to TRUE if its input is an empty-cell value, or FALSE otherwise. 
     This function always takes exactly one argument. Note specifically that ISBLANK("") evaluates to FALSE, 
     as do ISBLANK(FALSE) and ISBLANK(0).
     """
-    args = visit_all(arg_tree, ev)
+    args = visit_all(arg_nodes, ev)
     if len(args) != 1:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected exactly 1 arguments, but got {len(args)} arguments."))
 
@@ -196,9 +203,9 @@ def isblank_function(arg_tree, ev):
     else:
         return CellValue(False)
 
-def iserror_function(arg_tree, ev):
+def iserror_function(arg_nodes, ev):
     """Returns TRUE if the value is an error."""
-    args = visit_all(arg_tree, ev)
+    args = visit_all(arg_nodes, ev)
     if len(args) != 1:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected exactly 1 arguments, but got {len(args)} arguments."))
     
@@ -208,9 +215,9 @@ def iserror_function(arg_tree, ev):
     else:
         return CellValue(False)
 
-def version_function(arg_tree, ev):
+def version_function(arg_nodes, ev):
     """Returns the version of the spreadsheet library."""
-    args = visit_all(arg_tree, ev)
+    args = visit_all(arg_nodes, ev)
     if len(args) != 0:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected no arguments, but got {len(args)} arguments."))
     return CellValue(sheets.__version__)
@@ -225,15 +232,15 @@ def indirect_function(workbook):
     argument can be parsed as a cell reference, but the cell-reference is invalid for some reason 
     (other than creating a circular reference in the workbook), this function returns a BAD_REFERENCE error."""
 
-    def indirect(arg_tree, ev):
-        args = visit_all(arg_tree, ev)
+    def indirect(arg_nodes, ev):
+        args = visit_all(arg_nodes, ev)
         if len(args) != 1:
             return CellValue(CellError(CellErrorType.TYPE_ERROR, f"Expected exactly 1 arguments, but got {len(args)} arguments."))
         
         arg = args[0]
 
         if not isinstance(arg.val, str):
-            arg.to_string()
+            arg = arg.to_string()
 
             if isinstance(arg.val, sheets.CellError):
                 return arg
@@ -267,7 +274,73 @@ def indirect_function(workbook):
     return indirect
 
 # EXTRA CREDIT
-def min_function(arg_tree, ev):
+def collect_numbers(arg_nodes, ev, convert=True, aggregate=False):
+    """
+    The engine of the aggregate functions: evaluates the arguments and
+    collects the numbers among their values and the values of the non-empty
+    cells of range arguments, in one pass.  Returns (numbers, aggregates,
+    error).
+
+    Values that are not numbers are converted to numbers, or skipped if
+    convert is False.  If there are no arguments, or a value cannot be
+    converted to a number, error is the CellValue to return.  A range whose
+    values are all numbers of the workbook's numeric kernel is taken as it
+    is, classified and copied by builtins rather than value by value.
+
+    If aggregate is True, a referenced range is not read at all when the
+    workbook keeps its aggregate (see RangeAggregate) and it can be used;
+    the aggregates of such ranges are returned instead of their numbers.
+    """
+    args = visit_all(arg_nodes, ev)
+    if len(args) == 0:
+        return None, None, CellValue(CellError(CellErrorType.TYPE_ERROR, "Expected at least 1 arguments, but got 0 arguments."))
+
+    kernel = ev.kernel
+    numbers = []
+    aggregates = []
+    for arg in args:
+        if arg is None:
+            continue
+
+        if isinstance(arg, RangeView):
+            if aggregate and ev.workbook is not None:
+                range_aggregate = ev.workbook.graph.range_aggregate(arg, kernel)
+                if range_aggregate is not None and (range_aggregate.others == 0 or not convert):
+                    aggregates.append(range_aggregate)
+                    continue
+            values = arg.values()
+            vals = list(map(get_val, values))
+            if set(map(type, vals)) <= kernel.number_types:
+                numbers.extend(vals)
+                continue
+        else:
+            values = [arg]
+
+        for value in values:
+            if isinstance(value.val, NUMBER_TYPES):
+                numbers.append(value.val)
+            elif value.val is None or not convert:
+                continue
+            else:
+                value = kernel.to_number(value)
+                if isinstance(value.val, sheets.CellError):
+                    return None, None, value
+                numbers.append(value.val)
+    return numbers, aggregates, None
+
+def total_numbers(numbers, aggregates, kernel):
+    # the sum of the numbers and of the ranges' aggregates
+    if not aggregates:
+        return kernel.total(numbers)
+    total = kernel.exact_total(numbers)
+    for range_aggregate in aggregates:
+        total = kernel.exact_add(total, range_aggregate.total)
+    return kernel.from_exact(total)
+
+def count_numbers(numbers, aggregates):
+    return len(numbers) + sum(range_aggregate.count for range_aggregate in aggregates)
+
+def min_function(arg_nodes, ev):
     """
     MIN(value1, ...) returns the minimum value over the set of inputs. 
     Arguments may include cell-range references as well as normal expressions; 
@@ -276,98 +349,28 @@ def min_function(arg_tree, ev):
     then the function returns a TYPE_ERROR. Only non-empty cells should be considered; 
     empty cells should be ignored. 
     """
-    args = visit_all(arg_tree, ev)
-    if len(args) == 0:
-        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Expected at least 1 arguments, but got 0 arguments."))
-
-    converted = []
-    for cell_val in args:
-        if cell_val is None:
-            continue
-        
-        if isinstance(cell_val, list):
-            m, n = len(cell_val), len(cell_val[0])
-            for i in range(m):
-                for j in range(n):
-                    if cell_val[i][j]:
-                        curr = cell_val[i][j].value
-
-                        if curr.val is None:
-                            continue
-
-                        if not isinstance(curr.val, decimal.Decimal):
-                            curr.to_number()
-
-                            if isinstance(curr.val, sheets.CellError):
-                                return curr
-
-                        converted.append(curr.val)
-
-        elif cell_val.val is None:
-            continue
-        else:
-            if not isinstance(cell_val.val, decimal.Decimal):
-                cell_val.to_number()
-
-                if isinstance(cell_val.val, sheets.CellError):
-                    return cell_val
-            
-            converted.append(cell_val.val)
-
-    # print('converted', converted)
-    if not converted:
-        return CellValue(decimal.Decimal('0'))
-
-    return CellValue(min(converted))
-
-def max_function(arg_tree, ev):
-    args = visit_all(arg_tree, ev)
-    if len(args) == 0:
-        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Expected at least 1 arguments, but got 0 arguments."))
-
-    converted = []
-    for cell_val in args:
-        if cell_val is None:
-            continue
-        
-        if isinstance(cell_val, list):
-            m, n = len(cell_val), len(cell_val[0])
-            for i in range(m):
-                for j in range(n):
-                    if cell_val[i][j]:
-                        curr = cell_val[i][j].value
-
-                        if curr.val is None:
-                            continue
-
-                        if isinstance(curr.val, sheets.CellError):
-                            return curr
-
-                        if not isinstance(curr.val, decimal.Decimal):
-                            curr.to_number()
-
-                            if isinstance(curr.val, sheets.CellError):
-                                return curr
-
-                        converted.append(curr.val)
-        elif cell_val.val is None:
-            continue
-        else:
-            if not isinstance(cell_val.val, decimal.Decimal):
-                cell_val.to_number()
-
-                if isinstance(cell_val.val, sheets.CellError):
-                    return cell_val
-            
-            converted.append(cell_val.val)
-
-    # print('converted', converted)
-    if not converted:
-        return CellValue(decimal.Decimal('0'))
-
-    return CellValue(max(converted))
-
-def sum_function(arg_tree, ev):
+    numbers, aggregates, error = collect_numbers(arg_nodes, ev, aggregate=True)
+    if error is not None:
+        return error
+    numbers.extend(range_aggregate.minimum() for range_aggregate in aggregates if range_aggregate.count)
+    if not numbers:
+        return ev.kernel.zero
+    return CellValue(min(numbers))
+
+def max_function(arg_nodes, ev):
+    """
+    MAX(value1, ...) returns the maximum value over the set of inputs, in the
+    same way as MIN.
+    """
+    numbers, aggregates, error = collect_numbers(arg_nodes, ev, aggregate=True)
+    if error is not None:
+        return error
+    numbers.extend(range_aggregate.maximum() for range_aggregate in aggregates if range_aggregate.count)
+    if not numbers:
+        return ev.kernel.zero
+    return CellValue(max(numbers))
+
+def sum_function(arg_nodes, ev):
     """
     returns the sum of all inputs. Arguments may include cell-range references as well 
     as normal expressions; values from the cell-range are added into the sum.
@@ -375,100 +378,95 @@ def sum_function(arg_tree, ev):
     to a number then the function returns a TYPE_ERROR. If the functions inputs only 
     include empty cells then the functions result is 0. This function requires at least 1 argument.
     """
-    args = visit_all(arg_tree, ev)
-    if len(args) == 0:
-        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Expected at least 1 arguments, but got 0 arguments."))
-    
-    converted = []
-    for cell_val in args:
-        if cell_val is None:
-            continue
-        
-        # cell range arguments
-        if isinstance(cell_val, list):
-            m, n = len(cell_val), len(cell_val[0])
-            for i in range(m):
-                for j in range(n):
-                    if cell_val[i][j]:
-                        curr = cell_val[i][j].value
-
-                        if curr.val is None:
-                            continue
-
-                        if not isinstance(curr.val, decimal.Decimal):
-                            curr.to_number()
-
-                            if isinstance(curr.val, sheets.CellError):
-                                return curr
-
-                        converted.append(curr.val)
-        elif cell_val.val is None:
-            continue
-        else:
-            if not isinstance(cell_val.val, decimal.Decimal):
-                cell_val.to_number()
-
-                if isinstance(cell_val.val, sheets.CellError):
-                    return cell_val
-            
-            converted.append(cell_val.val)
-
-    # print('converted', converted)
-    if not converted:
-        return CellValue(decimal.Decimal('0'))
-
-    return CellValue(sum(converted))
-
-def average_function(arg_tree, ev):
-    args = visit_all(arg_tree, ev)
-    if len(args) == 0:
-        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Expected at least 1 arguments, but got 0 arguments."))
-    
-    converted = []
-    for cell_val in args:
-        if cell_val is None:
-            continue
-        
-        # cell range arguments
-        if isinstance(cell_val, list):
-            m, n = len(cell_val), len(cell_val[0])
-            for i in range(m):
-                for j in range(n):
-                    if cell_val[i][j]:
-                        curr = cell_val[i][j].value
-
-                        if curr.val is None:
-                            continue
-
-                        if not isinstance(curr.val, decimal.Decimal):
-                            curr.to_number()
-
-                            if isinstance(curr.val, sheets.CellError):
-                                return curr
+    numbers, aggregates, error = collect_numbers(arg_nodes, ev, aggregate=True)
+    if error is not None:
+        return error
+    if not count_numbers(numbers, aggregates):
+        return ev.kernel.zero
+    return ev.kernel.value(total_numbers(numbers, aggregates, ev.kernel))
+
+def average_function(arg_nodes, ev):
+    """
+    AVERAGE(value1, ...) returns the average of the inputs, which are handled
+    as for SUM.  If the inputs only include empty cells then the function
+    returns a DIVIDE_BY_ZERO error.
+    """
+    numbers, aggregates, error = collect_numbers(arg_nodes, ev, aggregate=True)
+    if error is not None:
+        return error
+    count = count_numbers(numbers, aggregates)
+    if not count:
+        return CellValue(CellError(CellErrorType.DIVIDE_BY_ZERO, "All arguments are None."))
+    return ev.kernel.value(total_numbers(numbers, aggregates, ev.kernel) / count)
 
-                        converted.append(curr.val)
-        elif cell_val.val is None:
-            continue
+def product_function(arg_nodes, ev):
+    """
+    PRODUCT(value1, ...) returns the product of the inputs, which are handled
+    as for SUM.  If the inputs only include empty cells then the function's
+    result is 0.
+    """
+    numbers, _, error = collect_numbers(arg_nodes, ev)
+    if error is not None:
+        return error
+    if not numbers:
+        return ev.kernel.zero
+    return ev.kernel.value(math.prod(numbers))
+
+def count_function(arg_nodes, ev):
+    """
+    COUNT(value1, ...) returns the number of inputs, and of cells in
+    cell-range inputs, whose values are numbers.  Other values (including
+    empty cells, strings, booleans and errors) are not counted.  This
+    function requires at least 1 argument.
+    """
+    numbers, aggregates, error = collect_numbers(arg_nodes, ev, convert=False, aggregate=True)
+    if error is not None:
+        return error
+    return CellValue(ev.kernel.number(str(count_numbers(numbers, aggregates))))
+
+def find_key(cell_range, key, ev, vertical):
+    # the first row (if vertical) or column of the range whose cell in the
+    # search column (or row) equals key, or None; found through the range's
+    # lookup index when the workbook keeps one
+    if key.val is not None and ev.workbook is not None:
+        index = ev.workbook.graph.lookup_index(cell_range, vertical)
+        if index is not None:
+            return index.find(key.val)
+    if vertical:
+        for row_idx in range(cell_range.num_rows):
+            if cell_range.value(row_idx, 0).val == key.val:
+                return row_idx
+    else:
+        for col_idx in range(cell_range.num_cols):
+            if cell_range.value(0, col_idx).val == key.val:
+                return col_idx
+    return None
+
+def bisect_sorted(cell_range, key, vertical, descending=False):
+    # the last row (if vertical) or column of the range whose cell in the
+    # search column (or row), which is sorted in ascending (or descending)
+    # order, is at most (or at least) key, or None; found by bisection.
+    # Values are ordered as sort_region() orders them, except that empty
+    # cells are taken to be at the end, so a range may extend past a table.
+    target = sort_value(key.val)
+    low, high = 0, cell_range.num_rows if vertical else cell_range.num_cols
+    while low < high:
+        middle = (low + high) // 2
+        val = (cell_range.value(middle, 0) if vertical else cell_range.value(0, middle)).val
+        if val is not None and (sort_value(val) >= target if descending else sort_value(val) <= target):
+            low = middle + 1
         else:
-            if not isinstance(cell_val.val, decimal.Decimal):
-                cell_val.to_number()
-
-                if isinstance(cell_val.val, sheets.CellError):
-                    return cell_val
-            
-            converted.append(cell_val.val)
+            high = middle
+    return low - 1 if low > 0 else None
 
-    # print('converted', converted)
-    if not converted:
-        return CellValue(CellError(CellErrorType.DIVIDE_BY_ZERO, "All arguments are None."))
-    
-    total = sum(converted)
-    count = len(converted)
-    average = total / count
-
-    return CellValue(average)
+def lookup_mode(args):
+    # the range_lookup argument of VLOOKUP or HLOOKUP, after their first
+    # three, as a bool CellValue (FALSE if it is omitted)
+    if len(args) == 3:
+        return CellValue(False)
+    return args[3].to_bool()
 
-def hlookup_function(arg_tree, ev):
+def hlookup_function(arg_nodes, ev):
     """
     HLOOKUP(key, range, index) searches horizontally through a range of cells. 
     The function searches through the first (i.e. topmost) row in range, looking 
@@ -476,12 +474,19 @@ def hlookup_function(arg_tree, ev):
     type and value). If such a column is found, the cell in the index-th row of 
     the found column. The index is 1-based; an index of 1 refers to the search row. 
     If no column is found, the function returns a TYPE_ERROR.
+
+    HLOOKUP(key, range, index, range_lookup) with a true range_lookup instead
+    finds the last column whose value is at most key, by bisection, in a
+    search row sorted in ascending order (see bisect_sorted).
     """
-    args = visit_all(arg_tree, ev)
-    if len(args) != 3:
-        return CellValue(CellError(CellErrorType.TYPE_ERROR, "HLOOKUP requires exactly 3 arguments."))
+    args = visit_all(arg_nodes, ev)
+    if len(args) not in (3, 4):
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "HLOOKUP requires 3 or 4 arguments."))
     
-    key, cell_range, index = args
+    key, cell_range, index = args[:3]
+    approximate = lookup_mode(args)
+    if isinstance(approximate.val, CellError):
+        return approximate
 
     if not int(index.val) == index.val:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, "Index must be an integer."))
@@ -490,26 +495,20 @@ def hlookup_function(arg_tree, ev):
     
     index = int(index.val)
     
-    if not isinstance(cell_range, list):
+    if not isinstance(cell_range, RangeView):
         return CellValue(CellError(CellErrorType.TYPE_ERROR, "Range must be a cell range."))
     
-    first_row = cell_range[0]
-    column_found = False
-
-    for col_idx, cell in enumerate(first_row):
-
-        if cell.value.val == key.val:
-            if index > len(cell_range):
-                return CellValue(CellError(CellErrorType.TYPE_ERROR, "Index is out of range."))
-            column_found = True
-            output_val = cell_range[index - 1][col_idx].value.val
-            return CellValue(output_val)
-
-    if not column_found:
+    if approximate.val:
+        col_idx = bisect_sorted(cell_range, key, vertical=False)
+    else:
+        col_idx = find_key(cell_range, key, ev, vertical=False)
+    if col_idx is None:
         return CellValue(CellError(CellErrorType.TYPE_ERROR, "No such column found."))
-        
+    if index > cell_range.num_rows:
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Index is out of range."))
+    return cell_range.value(index - 1, col_idx)
 
-def vlookup_function(arg_tree, ev):
+def vlookup_function(arg_nodes, ev):
     """
     VLOOKUP(key, range, index) searches vertically through a range of cells.
     The function searches through the first (i.e. leftmost) column in range,
@@ -518,12 +517,20 @@ def vlookup_function(arg_tree, ev):
     index-th column of the found row is returned. The index is 1-based; an
     index of 1 refers to the search column. If no row is found, the function
     returns a TYPE_ERROR.
+
+    VLOOKUP(key, range, index, range_lookup) with a true range_lookup instead
+    finds the last row whose value is at most key, by bisection, in a search
+    column sorted in ascending order (see bisect_sorted), as for a table of
+    brackets.
     """
-    args = visit_all(arg_tree, ev)
-    if len(args) != 3:
-        return CellValue(CellError(CellErrorType.TYPE_ERROR, "VLOOKUP requires exactly 3 arguments."))
+    args = visit_all(arg_nodes, ev)
+    if len(args) not in (3, 4):
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "VLOOKUP requires 3 or 4 arguments."))
 
-    key, cell_range, index = args
+    key, cell_range, index = args[:3]
+    approximate = lookup_mode(args)
+    if isinstance(approximate.val, CellError):
+        return approximate
 
     # Validate the index
     if not int(index.val) == index.val:
@@ -533,22 +540,53 @@ def vlookup_function(arg_tree, ev):
 
     index = int(index.val)
 
-    if not isinstance(cell_range, list):
+    if not isinstance(cell_range, RangeView):
         return CellValue(CellError(CellErrorType.TYPE_ERROR, "Range must be a cell range."))
 
-    row_found = False
-    for _, row in enumerate(cell_range):
-
-        if row[0].value.val == key.val:
-            if index > len(row):
-                return CellValue(CellError(CellErrorType.TYPE_ERROR, "Index is out of range."))
-            row_found = True
+    if approximate.val:
+        row_idx = bisect_sorted(cell_range, key, vertical=True)
+    else:
+        row_idx = find_key(cell_range, key, ev, vertical=True)
+    if row_idx is None:
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Key not found in the search column."))
+    if index > cell_range.num_cols:
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Index is out of range."))
+    return cell_range.value(row_idx, index - 1)
 
-            output_val = row[index - 1].value.val
-            return CellValue(output_val)
+def match_function(arg_nodes, ev):
+    """
+    MATCH(key, range, match_type) returns the 1-based position of key in a
+    range of one row or one column.  A match_type of 1 (the default) finds
+    the last value that is at most key, in a range sorted in ascending order;
+    -1 finds the last value that is at least key, in a range sorted in
+    descending order; both bisect the range (see bisect_sorted).  A
+    match_type of 0 finds the first value equal to key, as VLOOKUP does.  If
+    no value is found, the function returns a TYPE_ERROR.
+    """
+    args = visit_all(arg_nodes, ev)
+    if len(args) not in (2, 3):
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "MATCH requires 2 or 3 arguments."))
+
+    key, cell_range = args[:2]
+    match_type = ev.kernel.to_number(args[2]) if len(args) == 3 else CellValue(1)
+    if isinstance(match_type.val, CellError):
+        return match_type
+    if match_type.val not in (-1, 0, 1):
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Match type must be -1, 0 or 1."))
+
+    if not isinstance(cell_range, RangeView):
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Range must be a cell range."))
+    if cell_range.num_rows > 1 and cell_range.num_cols > 1:
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Range must be one row or one column."))
 
-    if not row_found:
-        return CellValue(CellError(CellErrorType.TYPE_ERROR, "Key not found in the search column."))
+    vertical = cell_range.num_cols == 1
+    if match_type.val == 0:
+        position = find_key(cell_range, key, ev, vertical)
+    else:
+        position = bisect_sorted(cell_range, key, vertical, descending=match_type.val < 0)
+    if position is None:
+        return CellValue(CellError(CellErrorType.TYPE_ERROR, "No match found."))
+    return CellValue(ev.kernel.number(str(position + 1)))
 
 def create_function_directory(workbook):
     BUILTIN_SPREADSHEET_FUNCTIONS = {
@@ -579,7 +617,10 @@ def create_function_directory(workbook):
         "MAX": max_function,
         "SUM": sum_function,
         "AVERAGE": average_function,
+        "PRODUCT": product_function,
+        "COUNT": count_function,
         "HLOOKUP": hlookup_function,
         "VLOOKUP": vlookup_function,
+        "MATCH": match_function,
     }
     return BUILTIN_SPREADSHEET_FUNCTIONS
\ No newline at end of file
@@ -1,25 +1,31 @@
 from __future__ import annotations
-from .Sheet import Sheet
+from .Sheet import Sheet, LOCATION_CACHE_SIZE
 from .Cell import Cell
 from .CellError import CellError, CellErrorType
 from .CellValue import CellValue
-from collections import OrderedDict, deque
+from .NumericKernel import KERNELS
+from collections import OrderedDict
 from typing import List, Optional, Tuple, Any, Callable, Iterable, TextIO
-import os
-import lark
+import contextlib
+import functools
+import heapq
 import json
-from .DependencyGraph import DependencyGraph
+from .DependencyGraph import DependencyGraph, location_bounds
+from .FormulaCache import parse_formula, compile_formula
+from .compiler import formula_references, MAX_COL, MAX_ROW
 from .transformer import SheetNameExtractor, FormulaUpdater
 from .interpreter import FormulaEvaluator
 from .SpreadsheetFunctions import create_function_directory
 from .RowAdapter import RowAdapter
-import decimal
 import re
 import copy
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-lark_path = os.path.join(current_dir, "formulas.lark")
-parser = lark.Lark.open(lark_path, start='formula')
+class StaleReference(Exception):
+    # Raised when a formula being computed on demand reads a stale cell; see
+    # Workbook.refresh_cell().
+    def __init__(self, cell_tup):
+        super().__init__(cell_tup)
+        self.cell_tup = cell_tup
 
 class Workbook:
     # A workbook containing zero or more named spreadsheets.
@@ -27,7 +33,22 @@ class Workbook:
     # Any and all operations on a workbook that may affect calculated cell
     # values should cause the workbook's contents to be updated properly.
 
-    def __init__(self):
+    def __init__(self, numeric: str = 'decimal'):
+        # Create an empty workbook whose numbers are computed by the given
+        # numeric kernel:
+        #
+        # 'decimal' (the default): numbers are decimal.Decimal values,
+        #     computed with 500 digits of precision.
+        #
+        # 'float': numbers are float (double precision) values, which are
+        #     much faster to compute with but subject to rounding error; cell
+        #     values that are numbers are returned as floats, and results
+        #     too large for a float are TYPE_ERRORs.
+        #
+        # If the numeric kernel is not recognized, a ValueError is raised.
+        if numeric not in KERNELS:
+            raise ValueError(f'Unknown numeric kernel {numeric}.')
+        self.kernel = KERNELS[numeric]
         self.graph = DependencyGraph()
         self.sheets = OrderedDict() # lowercase keys
         self.notify_functions = []
@@ -36,6 +57,13 @@ class Workbook:
         self.in_api_call = False
         self.func_directory = create_function_directory(self)
         self.renaming_info = {}
+        self.batch_depth = 0
+        self.dirty_cells = {} # ordered set of (sheet, location) awaiting recalculation
+        self.recalc_stats = {'evaluated': 0, 'skipped': 0} # cells evaluated, and dependents skipped as their inputs did not change
+        self.calculation_mode = 'automatic'
+        self.recalc_on_save = False
+        self.stale_cells = set() # (sheet, location) whose values must be computed before they are read
+        self.refreshing = None # ordered set of stale cells being computed on demand
 
     def num_sheets(self) -> int:
         return len(self.sheets.keys())
@@ -58,12 +86,20 @@ class Workbook:
         return lst # preserves case
     
     def handle_notifications(self):
+        if self.batch_depth > 0:
+            # notifications are coalesced until the outermost batch commits
+            return
         if len(self.notify_info):
+            # reading values in a notify function may compute stale cells,
+            # which records new notifications
+            notify_info, self.notify_info = self.notify_info, {}
             notifications = []
-            for (sn, loc), v in self.notify_info.items():
+            for (sn, loc), v in notify_info.items():
                 if sn.lower() in self.sheets:
                     cell = self.get_cell(sn, loc)
-                    if cell is not None and cell.value.val != v:
+                    # cells cleared past the sheet extent no longer exist
+                    value = cell.value.val if cell is not None else None
+                    if value != v:
                         notifications.append((sn, loc))
             if len(notifications):
                 for notify_function in self.notify_functions:
@@ -71,7 +107,6 @@ class Workbook:
                         notify_function(self, notifications)
                     except Exception:
                         pass
-            self.notify_info = {}
 
     def new_sheet(self, sheet_name: Optional[str] = None) -> Tuple[int, str]:
         # Add a new sheet to the workbook.  If the sheet name is specified, it
@@ -111,11 +146,11 @@ class Workbook:
             if (sheet_name.lower() in sheet_names_lower):
                 raise ValueError('Spreadsheet names must be unique.')
 
+        self.flush_dirty_cells()
         self.in_api_call = True
         self.sheets[sheet_name.lower()] = Sheet(sheet_name)
-        if sheet_name.lower() in self.graph.ingoing:
-            for loc in self.graph.ingoing[sheet_name.lower()]:
-                self.set_cell_contents(sheet_name, loc, None)
+        for loc in self.graph.referenced_locations(sheet_name):
+            self.set_cell_contents(sheet_name, loc, None)
         self.graph.add_sheet(sheet_name.lower())
         self.in_api_call = False
         self.handle_notifications()
@@ -133,16 +168,18 @@ class Workbook:
         if (sheet_name not in self.sheets):
             raise KeyError(f'{sheet_name} not found, cannot delete.')
 
-        sheet_graph_outgoing = self.graph.outgoing[sheet_name]
-        for loc, outgoing_arr in sheet_graph_outgoing.items():
-            for outgoing_sn, outgoing_loc in outgoing_arr:
+        self.flush_dirty_cells()
+
+        for loc in self.graph.referencing_locations(sheet_name):
+            for outgoing_sn, outgoing_loc in self.graph.outgoing_get(sheet_name, loc):
                 self.graph.ingoing_remove(outgoing_sn, outgoing_loc, sheet_name, loc)
         
         self.is_deleting = True
-        for loc in self.graph.ingoing[sheet_name]:
+        for loc in self.graph.referenced_locations(sheet_name):
             self.set_cell_contents(sheet_name, loc, '#ref!')
         
-        del self.graph.outgoing[sheet_name]
+        for loc in self.graph.referencing_locations(sheet_name):
+            self.graph.outgoing_reset(sheet_name, loc)
         del self.sheets[sheet_name]
         self.is_deleting = False
         self.in_api_call = False
@@ -163,10 +200,19 @@ class Workbook:
         num_cols, num_rows = sheet.num_cols, sheet.num_rows
         return num_cols, num_rows
 
+    @staticmethod
+    @functools.lru_cache(maxsize=LOCATION_CACHE_SIZE)
     def is_valid_location(location: str) -> bool:
         # Checks if a given location string is a valid spreadsheet cell location.
         pattern = r'^[A-Za-z]{1,4}[1-9][0-9]{0,3}$'
         return bool(re.match(pattern, location))
+
+    @staticmethod
+    def is_valid_coordinates(row: int, col: int) -> bool:
+        # Checks if a 1-indexed row and column are within the spreadsheet,
+        # whose bottom-right-most cell is ZZZZ9999.
+        return isinstance(row, int) and isinstance(col, int) and \
+            1 <= row <= MAX_ROW and 1 <= col <= MAX_COL + 1
     
     def get_cell(self, sheet_name, location):
         if sheet_name.lower() not in self.sheets.keys():
@@ -175,134 +221,208 @@ class Workbook:
         if not Workbook.is_valid_location(location):
             raise ValueError('Spreadsheet cell location is invalid. ZZZZ9999 is the bottom-right-most cell.')
         
-        sheet = self.sheets[sheet_name.lower()]
-        if (sheet.out_of_bounds(location)):
-            return None
-        return sheet.get_cell(location)
+        return self.sheets[sheet_name.lower()].get_cell(location)
     
     def handle_update_tree(self, cell_tuple):
+        # re-evaluates every cell downstream of cell_tuple, which has just
+        # been evaluated, and returns the cells whose values changed
         pending_notifications = []
         sheet_name, location = cell_tuple
-        sheet_name = sheet_name.lower()
-        location = location.lower()
-        out_degree = self.calculate_out_degree((sheet_name, location))
+        cell_tuple = (sheet_name.lower(), location.lower())
 
-        visited = {key: False for key in out_degree} # cells "connected" to src
-        
-        visited[(sheet_name, location)] = True
-        queue = [(sheet_name, location)]
-        first = True
-        
-        while len(queue):
-            sheet_name, location = queue.pop(0)
-            sheet_name = sheet_name.lower()
-            location = location.lower()
+        for cell_tup, prev_value, new_value in self.evaluate_in_order([cell_tuple], True):
+            if not (isinstance(prev_value, CellError) and isinstance(new_value, CellError) and prev_value.get_type() == new_value.get_type()):
+                pending_notifications.append(cell_tup)
+                if self.in_api_call:
+                    if cell_tup not in self.notify_info:
+                        self.notify_info[cell_tup] = prev_value
 
-            prev_value = self.get_cell_value(sheet_name, location)
-            self.evaluate_cell((sheet_name, location), first)
-            first = False
-            new_value = self.get_cell_value(sheet_name, location)
-            if (prev_value != new_value):
-                if not (isinstance(prev_value, CellError) and isinstance(new_value, CellError) and prev_value.get_type() == new_value.get_type()):
-                    pending_notifications.append((sheet_name, location))
-                    if self.in_api_call:
-                        if (sheet_name, location) not in self.notify_info:
-                            self.notify_info[(sheet_name, location)] = prev_value
-
-            visited[(sheet_name, location)] = True
-            for sn, loc in self.graph.ingoing_get(sheet_name, location):
-                # ingoing_cell = self.get_cell(sn, loc)
-                if visited[(sn, loc)]:
-                    continue
-                out_degree[(sn, loc)] -= 1
-                if (out_degree[(sn, loc)] == 0):
-                    queue.append((sn, loc))
-        
-        for sn, loc in visited:
-            if not visited[(sn, loc)]:
-                prev_value = self.get_cell_value(sn, loc)
-                self.evaluate_cell((sn, loc))
-                new_value = self.get_cell_value(sn, loc)
-                if (prev_value != new_value):
-                    if not (isinstance(prev_value, CellError) and isinstance(new_value, CellError) and prev_value.get_type() == new_value.get_type()):
-                        pending_notifications.append((sn, loc))
-                        if self.in_api_call:
-                            if (sn, loc) not in self.notify_info:
-                                self.notify_info[(sn, loc)] = prev_value
-        
         return pending_notifications
-    
-    def calculate_out_degree(self, cell_tup):
-        sheet_name, location = cell_tup
-        stack = [(sheet_name, location)]
-        visited = set()
-        out_degree = {}
 
-        while stack:
-            sheet_name, location = stack.pop()
-            if (sheet_name, location) in visited:
+    @staticmethod
+    def value_changed(prev_value, new_value):
+        # values of different types are different even if they compare equal
+        # (True == 1); errors of the same type are treated as unchanged
+        if isinstance(prev_value, CellError) and isinstance(new_value, CellError):
+            return prev_value.get_type() != new_value.get_type()
+        return type(prev_value) is not type(new_value) or prev_value != new_value
+
+    def evaluate_in_order(self, roots, roots_evaluated=False):
+        # evaluates the roots and the cells downstream of them once each, in
+        # the dependency graph's topological order, using a heap keyed on the
+        # cells' ranks.  A cell's dependents are only evaluated if its value
+        # changed (or it is a root); cells that joined or left a cycle are
+        # always evaluated.  Returns (cell, previous value, new value) for
+        # every cell whose value changed.
+        changed = []
+        heap = []
+        queued = set()
+        done = set()
+        cut_off = set()
+
+        def push(cell_tup):
+            queued.add(cell_tup)
+            heapq.heappush(heap, (self.graph.rank(cell_tup), cell_tup))
+
+        def push_ingoing(cell_tup):
+            ingoings = self.graph.ingoing_get(*cell_tup)
+            rank = self.graph.rank(cell_tup) if ingoings else None
+            for ingoing in ingoings:
+                # a referencing cell that was already evaluated (outside of
+                # this cell's cycle) only started referencing this cell during
+                # this pass, so it saw the old value; evaluate it again
+                if ingoing in done and self.graph.rank(ingoing) != rank:
+                    done.discard(ingoing)
+                    queued.discard(ingoing)
+                if ingoing not in queued:
+                    push(ingoing)
+
+        def push_cycle_changes():
+            for cell_tup in self.graph.pop_cycle_changes():
+                if cell_tup[0] in self.sheets:
+                    done.discard(cell_tup)
+                    push(cell_tup)
+
+        roots = dict.fromkeys(roots) # ordered, for the membership tests below
+        for cell_tup in roots:
+            if roots_evaluated:
+                queued.add(cell_tup)
+                done.add(cell_tup)
+            else:
+                push(cell_tup)
+        if roots_evaluated:
+            for cell_tup in roots:
+                push_ingoing(cell_tup)
+        push_cycle_changes()
+
+        while heap:
+            rank, cell_tup = heapq.heappop(heap)
+            if cell_tup in done or cell_tup not in queued:
+                continue
+            if rank != self.graph.rank(cell_tup):
+                # reordered since it was pushed
+                heapq.heappush(heap, (self.graph.rank(cell_tup), cell_tup))
                 continue
-            visited.add((sheet_name, location))
-            for sn, loc in self.graph.ingoing_get(sheet_name, location):
-                # ingoing_cell = self.get_cell(sn, loc)
-                out_degree[(sn, loc)] = out_degree.get((sn, loc), 0) + 1
-                stack.append((sn, loc))
+            done.add(cell_tup)
+
+            sn, loc = cell_tup
+            prev_value = self.get_cell_value(sn, loc)
+            self.evaluate_cell(cell_tup)
+            self.recalc_stats['evaluated'] += 1
+            new_value = self.get_cell_value(sn, loc)
+            if self.value_changed(prev_value, new_value):
+                changed.append((cell_tup, prev_value, new_value))
+                push_ingoing(cell_tup)
+            elif cell_tup in roots:
+                push_ingoing(cell_tup)
+            else:
+                cut_off.update(self.graph.ingoing_get(sn, loc))
+            if self.graph.cycle_changes:
+                push_cycle_changes()
+
+        # dependents of unchanged cells that nothing else caused to be
+        # evaluated
+        self.recalc_stats['skipped'] += len(cut_off - done)
+        return changed
+
+    def flush_dirty_cells(self):
+        # brings the workbook's values up to date before an operation; in
+        # manual mode, edits stay pending until recalculate()
+        if self.calculation_mode != 'manual':
+            self.recalculate_cells()
+
+    def recalculate_cells(self, full=False):
+        # recalculates every cell edited since the last recalculation in one
+        # pass (or, if full, every cell): edges are rebuilt for the edited
+        # cells, and then each affected cell is evaluated once in topological
+        # order.  Stale cells left by lazy mode are computed first.  Changed
+        # values are recorded in notify_info.
+        if self.stale_cells:
+            self.refresh_stale_cells()
+
+        roots = {}
+        for cell_tup in self.dirty_cells:
+            if cell_tup[0] in self.sheets:
+                roots[cell_tup] = True
+            else:
+                # the cell's sheet was deleted; recalculate the cells that
+                # referenced it
+                for ingoing in self.graph.ingoing_get(*cell_tup):
+                    if ingoing[0] in self.sheets:
+                        roots[ingoing] = True
+        self.dirty_cells = {}
+
+        # (re)build the outgoing edges of the edited cells; when they are many,
+        # the graph's order and cycles are rebuilt once afterwards
+        self.graph.begin_bulk(len(roots))
+        try:
+            for cell_tup in roots:
+                prev_value = self.get_cell_value(*cell_tup)
+                self.evaluate_cell(cell_tup)
+                if cell_tup not in self.notify_info:
+                    self.notify_info[cell_tup] = prev_value
+        finally:
+            self.graph.end_bulk()
+
+        if full:
+            for sheet_key, sheet in self.sheets.items():
+                for location, cell in sheet.cell_items():
+                    if cell.contents is not None:
+                        roots[(sheet_key, location.lower())] = True
+        if not roots:
+            return
 
-        return out_degree
-    
-    def evaluate_cell(self, cell_tup, first=False):
+        for cell_tup, prev_value, _new_value in self.evaluate_in_order(list(roots)):
+            if cell_tup not in self.notify_info:
+                self.notify_info[cell_tup] = prev_value
+
+    def evaluate_cell(self, cell_tup):
         sheet_name, location = cell_tup
         sheet_name = sheet_name.lower()
         location = location.lower()
         cell = self.get_cell(sheet_name, location)
         if cell is None:
             return
+        prev_value = cell.value
         contents = cell.contents
         if (contents is None):
             cell.value = CellValue(None)
-            return
-        
-        if contents.startswith('='):
-            tree = cell.tree
+        elif contents.startswith('='):
             if cell.parse_error:
-                cell.value = CellValue(CellError(CellErrorType.PARSE_ERROR, 'Failed to parse formula'))
+                cell.value = CellValue.error(CellErrorType.PARSE_ERROR)
             else:
-                orig_outgoing = self.graph.outgoing_get(sheet_name, location)
-                for sn, loc in orig_outgoing:
-                    self.graph.ingoing_remove(sn, loc, sheet_name, location)
-
-                # feed references and sheet name into interpreter
-                ev = FormulaEvaluator(sheet_name, self, self.func_directory)
-                visit_value = ev.visit(tree)
+                # run the compiled formula, collecting its references
+                ev = FormulaEvaluator(sheet_name, self, self.func_directory, location)
+                visit_value = cell.program(ev)
 
                 if (visit_value is None or visit_value.val is None):
-                    cell.value = CellValue(decimal.Decimal('0'))
+                    cell.value = self.kernel.zero
                 else:
-                    cell.value = visit_value
-
-                # update graph
-                # if first:
-                outgoing = list(ev.refs)
-                for sn, loc in outgoing:
-                    self.graph.ingoing_add(sn, loc, sheet_name, location)
-
-                if len(outgoing):
-                    self.graph.outgoing_set(sheet_name, location, outgoing)
-
-                # detect cycle
-                if first and self.detect_cycle((sheet_name, location)):
-                    cell.value = CellValue(CellError(CellErrorType.CIRCULAR_REFERENCE, 'Circular reference found'))
-                elif cell.in_cycle:
-                    cell.value = CellValue(CellError(CellErrorType.CIRCULAR_REFERENCE, 'Circular reference found'))
+                    cell.value = self.kernel.canonical(visit_value)
+
+                # update graph with the references that changed; each edge is
+                # updated in both directions before the next, so the graph's
+                # cycle tracking sees a consistent graph
+                orig_outgoing = set(self.graph.outgoing_get(sheet_name, location))
+                if orig_outgoing != ev.refs:
+                    for sn, loc in orig_outgoing - ev.refs:
+                        self.graph.outgoing_remove(sheet_name, location, sn, loc)
+                        self.graph.ingoing_remove(sn, loc, sheet_name, location)
+                    for sn, loc in ev.refs - orig_outgoing:
+                        self.graph.outgoing_add(sheet_name, location, sn, loc)
+                        self.graph.ingoing_add(sn, loc, sheet_name, location)
+
+                # the graph tracks which cells are in a cycle as edges change
+                if self.graph.in_cycle(sheet_name, location):
+                    cell.value = CellValue.error(CellErrorType.CIRCULAR_REFERENCE)
                 
         elif contents.startswith("'"):
             cell.value = CellValue(contents[1:])
         else:
             if CellValue.is_number(contents):
-                contents = CellValue.strip_trailing_zeros(contents)
-                cell.value = CellValue(decimal.Decimal(contents))
+                cell.value = CellValue(self.kernel.number(contents))
             elif contents.lower() in FormulaEvaluator.error_dict:
-                cell.value = CellValue(CellError(FormulaEvaluator.error_dict[contents.lower()], 'String representation'))
+                cell.value = CellValue.error(FormulaEvaluator.error_dict[contents.lower()])
             elif contents.lower() == 'true':
                 cell.value = CellValue(True)
             elif contents.lower() == 'false':
@@ -310,6 +430,9 @@ class Workbook:
             else:
                 cell.value = CellValue(contents)
 
+        if self.graph.tracks_values and cell.value is not prev_value:
+            self.graph.value_changed(sheet_name, location, prev_value, cell.value)
+
     def set_cell_contents(self, sheet_name: str, location: str,
                           contents: Optional[str]) -> None:
         # Set the contents of the specified cell on the specified sheet.
@@ -341,16 +464,17 @@ class Workbook:
         
         # remove original outgoing cells' ingoing & outgoing lists before setting new content
         curr_sheet = self.sheets[sheet_name.lower()]
-        curr_sheet.resize(location)
-        curr_cell = curr_sheet.get_cell(location)
-        prev_value = self.get_cell_value(sheet_name, location)
-
-        nodes = set()
-        self.find_nodes(sheet_name, location, nodes)
-        for (sn, loc) in nodes:
-            cell = self.get_cell(sn, loc)
-            if cell is not None:
-                cell.in_cycle = False
+        curr_cell = curr_sheet.add_cell(location)
+
+        # inside a batch, edits made by the user only record the new contents;
+        # evaluation and updates happen once on commit.  In manual mode, every
+        # edit does so until recalculate().
+        manual = self.calculation_mode == 'manual'
+        deferred = (self.batch_depth > 0 and not self.in_api_call) or manual
+        # in lazy mode, edits only mark the cell and its dependents stale
+        lazy = self.calculation_mode == 'lazy' and not self.in_api_call and not deferred
+        if not lazy:
+            prev_value = self.get_cell_value(sheet_name, location)
 
         if not self.is_deleting:
             orig_outgoing = self.graph.outgoing_get(sheet_name, location)
@@ -366,31 +490,56 @@ class Workbook:
         if contents is None:
             curr_cell.contents = contents
         elif contents.startswith('='):
-            # parse formula into tree
-            if contents == curr_cell.contents:
-                if not curr_cell.parse_error:
-                    tree = curr_cell.tree
-            else:
-                try:
-                    tree = parser.parse(contents)
-                    curr_cell.tree = tree
-                    curr_cell.parse_error = False
-                except lark.exceptions.LarkError:
-                    curr_cell.parse_error = True
+            # compile the formula once; formulas with the same relative form
+            # (e.g. filled down a column) share one cached program
+            curr_cell.program = compile_formula(contents, location)
+            curr_cell.parse_error = curr_cell.program is None
         
         curr_cell.contents = contents
         self.graph.outgoing_reset(sheet_name, location)
 
+        if manual and curr_cell.program is not None and contents is not None and contents.startswith('='):
+            # keep the dependency graph current without evaluating, so that
+            # operations such as rename_sheet() find the cell's references
+            for sn, loc in formula_references(parse_formula(contents), sheet_name):
+                self.graph.outgoing_add(sheet_name, location, sn, loc)
+                self.graph.ingoing_add(sn, loc, sheet_name, location)
+
+        if contents is None and (deferred or lazy) and self.graph.tracks_values:
+            # the emptied cell is dropped before it is evaluated again, so its
+            # value leaves the aggregates and lookup indexes of the ranges
+            # containing it now
+            self.graph.value_changed(sheet_name.lower(), location.lower(),
+                                     curr_cell.value, CellValue(None))
+
+        if deferred:
+            cell_tup = (sheet_name.lower(), location.lower())
+            self.dirty_cells[cell_tup] = True
+            if cell_tup not in self.notify_info:
+                self.notify_info[cell_tup] = prev_value
+            if contents is None:
+                curr_sheet.check_shrink(location)
+            return
+
+        if lazy:
+            self.mark_stale([(sheet_name.lower(), location.lower())])
+            if self.graph.cycle_changes:
+                self.mark_stale(self.graph.pop_cycle_changes())
+            if contents is None:
+                curr_sheet.check_shrink(location)
+            return
+
         pending_notifications = []
-        self.evaluate_cell((sheet_name, location), True)
+        self.evaluate_cell((sheet_name, location))
         new_value = self.get_cell_value(sheet_name, location)
         if (prev_value != new_value):
 
             if not (isinstance(prev_value, CellError) and isinstance(new_value, CellError) and prev_value.get_type() == new_value.get_type()):
                 pending_notifications.append((sheet_name, location))
                 if self.in_api_call:
-                    if (sheet_name, location) not in self.notify_info:
-                        self.notify_info[(sheet_name, location)] = prev_value
+                    cell_tup = (sheet_name.lower(), location.lower())
+                    if cell_tup not in self.notify_info:
+                        self.notify_info[cell_tup] = prev_value
         
         ### Update the value field of the cell
         pending_notifications = pending_notifications + self.handle_update_tree((sheet_name, location))
@@ -435,89 +584,7 @@ class Workbook:
 
     def detect_cycle(self, cell_tup) -> bool:
         sheet_name, location = cell_tup
-        sheet_name = sheet_name.lower()
-        location = location.lower()
-        nodes = set()
-        self.find_nodes(sheet_name, location, nodes)
-
-        current_id = 0
-        ids = {node: -1 for node in nodes}
-        low = {node: 0 for node in nodes}
-        on_stack = {node: False for node in nodes}
-        stack_scc = []
-        is_cycle = {node: False for node in nodes}
-
-        # pre-fetch adjacency to simplify lookups
-        adjacency = {}
-        for (sn, loc) in nodes:
-            adjacency[(sn, loc)] = self.graph.ingoing_get(sn, loc)
-
-        def iterative_dfs(start_node):
-            nonlocal current_id, ids, low, on_stack, stack_scc, is_cycle, adjacency
-            call_stack = [(start_node, 0, None)]
-
-            while call_stack:
-                node, child_idx, parent = call_stack.pop()
-                sn, loc = node
-
-                if ids[node] == -1:
-                    current_id += 1
-                    ids[node] = current_id
-                    low[node] = current_id
-                    on_stack[node] = True
-                    stack_scc.append(node)
-
-                if child_idx < len(adjacency[node]):
-                    #pPut this frame back, but increment the child's index
-                    call_stack.append((node, child_idx + 1, parent))
-
-                    # process the next child
-                    child = adjacency[node][child_idx]
-                    if ids[child] == -1:
-                        call_stack.append((child, 0, node))
-                    elif on_stack[child]:
-                        low[node] = min(low[node], ids[child])
-                else:
-                    # update parent
-                    if parent is not None:
-                        low[parent] = min(low[parent], low[node])
-
-                    # found scc start node
-                    if ids[node] == low[node]:
-                        scc = []
-                        while True:
-                            top_node = stack_scc.pop()
-                            on_stack[top_node] = False
-                            scc.append(top_node)
-                            low[top_node] = ids[node]
-                            if top_node == node:
-                                break
-
-                        # if SCC size > 1, or a single node with a self-loop, mark as cycle
-                        if (len(scc) > 1) or (len(scc) == 1 and node in adjacency[node]):
-                            for comp_node in scc:
-                                is_cycle[comp_node] = True
-
-        for node in nodes:
-            if ids[node] == -1:
-                iterative_dfs(node)
-
-        for node in nodes:
-            cell = self.get_cell(node[0], node[1])
-            cell.in_cycle = is_cycle[node]
-        return is_cycle[(sheet_name, location)]
-
-    def find_nodes(self, sn, loc, nodes):
-        stack = [(sn, loc)]
-        while len(stack):
-            sn, loc = stack.pop()
-            ref_id = (sn, loc)
-            if ref_id in nodes:
-                continue
-            nodes.add(ref_id)
-            ingoing = self.graph.ingoing_get(sn, loc)
-            for next_sheet, next_loc in ingoing:
-                stack.append((next_sheet, next_loc))
+        return self.graph.in_cycle(sheet_name, location)
 
     def get_cell_value(self, sheet_name: str, location: str) -> Any:
         # Return the evaluated value of the specified cell on the specified
@@ -530,31 +597,290 @@ class Workbook:
         # If the specified sheet name is not found, a KeyError is raised.
         # If the cell location is invalid, a ValueError is raised.
         #
+        # In lazy calculation mode (see set_calculation_mode()), a cell whose
+        # value is out of date is computed now, along with the out-of-date
+        # cells it references.
+        #
         # The value of empty cells is None.  Non-empty cells may contain a
-        # value of str, decimal.Decimal, or CellError.
+        # value of str, decimal.Decimal (float for workbooks created with the
+        # 'float' numeric kernel), bool, or CellError.
         #
         # Decimal values will not have trailing zeros to the right of any
         # decimal place, and will not include a decimal place if the value is a
         # whole number.  For example, this function would not return
         # Decimal('1.000'); rather it would return Decimal('1').
-        if sheet_name.lower() not in self.sheets.keys():
+        sheet = self.sheets.get(sheet_name.lower())
+        if sheet is None:
             raise KeyError('Sheet not found.')
         
         if not Workbook.is_valid_location(location):
             raise ValueError('Spreadsheet cell location is invalid. ZZZZ9999 is the bottom-right-most cell.') 
         
-        sheet = self.sheets[sheet_name.lower()]
+        if self.stale_cells:
+            cell_tup = (sheet_name.lower(), location.lower())
+            if cell_tup in self.stale_cells:
+                self.refresh_cell(cell_tup)
+                if self.refreshing is None and not self.in_api_call:
+                    self.handle_notifications()
+
         cell = sheet.get_cell(location)
         if (cell is None or cell.value is None):
             return None
         return cell.value.val
 
+    def get_cell_value_rc(self, sheet_name: str, row: int, col: int) -> Any:
+        # Return the evaluated value of the cell at the given row and column
+        # of the specified sheet, as get_cell_value() does for a location.
+        # Rows and columns are numbered from 1, so that (1, 1) is A1 and
+        # (9999, 475254) is ZZZZ9999; clients working with coordinates skip
+        # building and parsing location strings.
+        #
+        # If the specified sheet name is not found, a KeyError is raised.
+        # If the row or column is outside the spreadsheet, a ValueError is
+        # raised.
+        sheet = self.sheets.get(sheet_name.lower())
+        if sheet is None:
+            raise KeyError('Sheet not found.')
+
+        if not Workbook.is_valid_coordinates(row, col):
+            raise ValueError('Spreadsheet cell location is invalid. ZZZZ9999 is the bottom-right-most cell.')
+
+        if self.stale_cells:
+            return self.get_cell_value(sheet_name, Sheet.location_key(col - 1, row - 1))
+
+        cell = sheet.get_cell_at(col - 1, row - 1)
+        if (cell is None or cell.value is None):
+            return None
+        return cell.value.val
+
+    def get_cell_contents_rc(self, sheet_name: str, row: int, col: int) -> Optional[str]:
+        # Return the contents of the cell at the given row and column of the
+        # specified sheet, numbered from 1 as for get_cell_value_rc().
+        #
+        # If the specified sheet name is not found, a KeyError is raised.
+        # If the row or column is outside the spreadsheet, a ValueError is
+        # raised.
+        sheet = self.sheets.get(sheet_name.lower())
+        if sheet is None:
+            raise KeyError('Sheet not found.')
+
+        if not Workbook.is_valid_coordinates(row, col):
+            raise ValueError('Spreadsheet cell location is invalid. ZZZZ9999 is the bottom-right-most cell.')
+
+        cell = sheet.get_cell_at(col - 1, row - 1)
+        return cell.contents if cell is not None else None
+
+    def set_cell_contents_rc(self, sheet_name: str, row: int, col: int,
+                             contents: Optional[str]) -> None:
+        # Set the contents of the cell at the given row and column of the
+        # specified sheet, numbered from 1 as for get_cell_value_rc(), as
+        # set_cell_contents() does for a location.
+        #
+        # If the specified sheet name is not found, a KeyError is raised.
+        # If the row or column is outside the spreadsheet, a ValueError is
+        # raised.
+        if sheet_name.lower() not in self.sheets:
+            raise KeyError('Sheet not found.')
+
+        if not Workbook.is_valid_coordinates(row, col):
+            raise ValueError('Spreadsheet cell location is invalid. ZZZZ9999 is the bottom-right-most cell.')
+
+        self.set_cell_contents(sheet_name, Sheet.location_key(col - 1, row - 1), contents)
+
+    def get_range_values(self, sheet_name: str, range_ref: str,
+                         sparse: bool = False) -> Any:
+        # Return the evaluated values of the cells in the specified range of
+        # the specified sheet, such as 'A1:Z5000', in one pass over the
+        # sheet's cells.  The corners may be given in either order, and a
+        # single location is a one-cell range.
+        #
+        # By default the result is a list of rows, each a list of the values
+        # of the cells in that row from left to right, with None for empty
+        # cells, as get_cell_value() would return them.
+        #
+        # If sparse is True, only the cells with contents are returned, as an
+        # iterator of (row, col, value) tuples in row-major order; rows and
+        # columns are numbered from 1 as for get_cell_value_rc().
+        #
+        # If the specified sheet name is not found, a KeyError is raised.
+        # If the range is invalid, a ValueError is raised.
+        #
+        # In lazy calculation mode, the out-of-date cells in the range are
+        # computed first.
+        sheet = self.sheets.get(sheet_name.lower())
+        if sheet is None:
+            raise KeyError('Sheet not found.')
+
+        start, sep, end = range_ref.partition(':')
+        if not sep:
+            end = start
+        if not (Workbook.is_valid_location(start) and Workbook.is_valid_location(end)):
+            raise ValueError('Spreadsheet cell range is invalid. ZZZZ9999 is the bottom-right-most cell.')
+
+        (col_1, row_1), (col_2, row_2) = Sheet.split_cell_ref(start), Sheet.split_cell_ref(end)
+        col_1, col_2 = min(col_1, col_2), max(col_1, col_2)
+        row_1, row_2 = min(row_1, row_2), max(row_1, row_2)
+
+        if self.stale_cells:
+            for cell_tup in self.stale_in_range(sheet_name.lower(), (col_1, row_1, col_2, row_2)):
+                if cell_tup in self.stale_cells:
+                    self.refresh_cell(cell_tup)
+            if self.refreshing is None and not self.in_api_call:
+                self.handle_notifications()
+
+        found = sheet.cells_in_range(col_1, row_1, col_2, row_2)
+        if sparse:
+            return iter([(row_idx + 1, col_idx + 1, cell.value.val)
+                         for col_idx, row_idx, cell in found if cell.value is not None])
+
+        values = [[None] * (col_2 - col_1 + 1) for _ in range(row_2 - row_1 + 1)]
+        for col_idx, row_idx, cell in found:
+            if cell.value is not None:
+                values[row_idx - row_1][col_idx - col_1] = cell.value.val
+        return values
+
+    def set_range_contents(self, sheet_name: str, top_left: str,
+                           rows: Iterable[Iterable[Optional[str]]]) -> None:
+        # Set the contents of a block of cells on the specified sheet from a
+        # 2D iterable of rows, each an iterable of contents as accepted by
+        # set_cell_contents(), with the first row's first contents going in
+        # the top_left cell.  Rows may differ in length; None clears a cell.
+        #
+        # The block is written as a batch (see begin_batch()): the formulas
+        # are compiled as they are stored, and then the dependency graph is
+        # updated and every affected cell is recalculated once, in a single
+        # pass, with a single coalesced notification.
+        #
+        # If the specified sheet name is not found, a KeyError is raised.
+        # If the top-left location is invalid, or the block extends past
+        # ZZZZ9999, a ValueError is raised and no cells are changed.
+        if sheet_name.lower() not in self.sheets:
+            raise KeyError('Sheet not found.')
+
+        if not Workbook.is_valid_location(top_left):
+            raise ValueError('Spreadsheet cell location is invalid. ZZZZ9999 is the bottom-right-most cell.')
+
+        rows = [list(row) for row in rows]
+        col_1, row_1 = Sheet.split_cell_ref(top_left)
+        num_cols = max((len(row) for row in rows), default=0)
+        if not Workbook.is_valid_coordinates(row_1 + max(len(rows), 1), col_1 + max(num_cols, 1)):
+            raise ValueError('Spreadsheet cell location is invalid. ZZZZ9999 is the bottom-right-most cell.')
+
+        with self.batch():
+            for row_idx, row in enumerate(rows, row_1):
+                for col_idx, contents in enumerate(row, col_1):
+                    self.set_cell_contents(sheet_name, Sheet.location_key(col_idx, row_idx), contents)
+
+    def mark_stale(self, cells):
+        # marks the cells, and every cell downstream of them, as stale.  The
+        # stale cells are kept closed under their dependents, so the walk
+        # stops at cells that are already stale.
+        stack = list(cells)
+        while stack:
+            cell_tup = stack.pop()
+            if cell_tup in self.stale_cells:
+                continue
+            self.stale_cells.add(cell_tup)
+            stack.extend(self.graph.ingoing_get(*cell_tup))
+
+    def refresh_cell(self, cell_tup):
+        # computes a stale cell on demand, first computing the stale cells it
+        # references.  The cells being computed are kept on an explicit stack
+        # rather than by recursing, so long chains of stale cells do not
+        # exhaust Python's stack: a formula that reads a stale cell raises
+        # StaleReference, and is evaluated again once that cell is computed.
+        # Changed values are recorded in notify_info.
+        if self.refreshing is not None:
+            if cell_tup in self.refreshing:
+                # the cell is being computed further down the stack, so the
+                # reference is circular; the graph reports the cycle once the
+                # reading cell's edges are in place
+                return
+            raise StaleReference(cell_tup)
+
+        self.refreshing = {cell_tup: True}
+        try:
+            while self.refreshing:
+                top = next(reversed(self.refreshing))
+                if top not in self.stale_cells or top[0] not in self.sheets:
+                    self.stale_cells.discard(top)
+                    del self.refreshing[top]
+                    continue
+
+                # the edges of cells whose contents did not change are still
+                # in place, so their stale references can be found up front
+                pending = [ref for ref in self.stale_references(top)
+                           if ref not in self.refreshing]
+                if pending:
+                    for ref in pending:
+                        self.refreshing[ref] = True
+                    continue
+
+                cell = self.get_cell(*top)
+                prev_value = cell.value.val if cell is not None and cell.value is not None else None
+                try:
+                    self.evaluate_cell(top)
+                except StaleReference as e:
+                    self.refreshing[e.cell_tup] = True
+                    continue
+                self.recalc_stats['evaluated'] += 1
+                self.stale_cells.discard(top)
+                del self.refreshing[top]
+
+                new_value = self.get_cell_value(*top)
+                if self.value_changed(prev_value, new_value):
+                    if top not in self.notify_info:
+                        self.notify_info[top] = prev_value
+                    # dependents are normally stale already; ones that read
+                    # this cell while it was being computed (a cycle) are not
+                    self.mark_stale(self.graph.ingoing_get(*top))
+                if self.graph.cycle_changes:
+                    self.mark_stale(self.graph.pop_cycle_changes())
+        finally:
+            self.refreshing = None
+
+    def stale_references(self, cell_tup):
+        # the stale cells the cell references, directly or within a range
+        stale = []
+        for sn, loc in self.graph.outgoing_get(*cell_tup):
+            if ':' not in loc:
+                if (sn, loc) in self.stale_cells:
+                    stale.append((sn, loc))
+                continue
+            stale.extend(self.stale_in_range(sn, location_bounds(loc)))
+        return stale
+
+    def stale_in_range(self, sn, bounds):
+        # the stale cells of sheet sn within the 0-indexed bounds, found by
+        # enumerating the range or the stale cells, whichever is smaller
+        col_1, row_1, col_2, row_2 = bounds
+        if (col_2 - col_1 + 1) * (row_2 - row_1 + 1) <= len(self.stale_cells):
+            return [(sn, Sheet.location_key(col, row))
+                    for row in range(row_1, row_2 + 1)
+                    for col in range(col_1, col_2 + 1)
+                    if (sn, Sheet.location_key(col, row)) in self.stale_cells]
+        stale = []
+        for ref in self.stale_cells:
+            if ref[0] == sn and ':' not in ref[1]:
+                col, row = Sheet.split_cell_ref(ref[1])
+                if col_1 <= col <= col_2 and row_1 <= row <= row_2:
+                    stale.append(ref)
+        return stale
+
+    def refresh_stale_cells(self):
+        # computes every stale cell
+        for cell_tup in list(self.stale_cells):
+            if cell_tup in self.stale_cells:
+                self.refresh_cell(cell_tup)
+        self.stale_cells.clear()
+
     @staticmethod
-    def load_workbook(fp: TextIO) -> Workbook:
+    def load_workbook(fp: TextIO, numeric: str = 'decimal') -> Workbook:
         # This is a static method (not an instance method) to load a workbook
         # from a text file or file-like object in JSON format, and return the
         # new Workbook instance.  Note that the _caller_ of this function is
         # expected to have opened the file; this function merely reads the file.
+        # The workbook uses the given numeric kernel (see Workbook()).
         #
         # If the contents of the input cannot be parsed by the Python json
         # module then a json.JSONDecodeError should be raised by the method.
@@ -584,7 +910,7 @@ class Workbook:
             raise TypeError('Value corresponding to sheets key must be list.')
         
         sheets_data = json_data['sheets']
-        wb = Workbook()
+        wb = Workbook(numeric)
         for sheet_data in sheets_data:
             if ('name' not in sheet_data or 'cell-contents' not in sheet_data):
                 raise KeyError('Sheet is missing necessary key(s) (must have name and cell-contents)')
@@ -609,16 +935,15 @@ class Workbook:
         #
         # If an IO write error occurs (unlikely but possible), let any raised
         # exception propagate through.
+        if self.recalc_on_save:
+            self.recalculate()
         try:
             sheet_list = []
             for sheet in self.sheets.values():
                 cell_contents = {}
-                for row_idx in range(sheet.num_rows):
-                    for col_idx in range(sheet.num_cols):
-                        curr_cell = sheet.cells[row_idx][col_idx]
-                        loc = Sheet.to_sheet_coords(col_idx, row_idx).upper()
-                        if curr_cell and curr_cell.contents is not None:
-                            cell_contents[loc] = curr_cell.contents
+                for loc, curr_cell in sheet.cell_items():
+                    if curr_cell.contents is not None:
+                        cell_contents[loc] = curr_cell.contents
                 sheet_data = {"name": sheet.sheet_name, "cell-contents": cell_contents}
                 sheet_list.append(sheet_data)
             workbook_data = {"sheets": sheet_list}
@@ -649,6 +974,103 @@ class Workbook:
         # this requirement, the behavior is undefined.
         self.notify_functions.append(notify_function)
 
+    def begin_batch(self) -> None:
+        # Start a batch of edits.  Until the matching commit(), calls to
+        # set_cell_contents() only record the new cell contents; the affected
+        # cells are recalculated once, in a single pass, when the batch is
+        # committed, and a single coalesced notification is sent to the
+        # functions registered with notify_cells_changed().
+        #
+        # While a batch is open, get_cell_value() may return stale values for
+        # the edited cells and the cells that depend on them.  Other workbook
+        # operations (moving or copying cells, renaming sheets, etc.) first
+        # recalculate any pending edits, so they always see a consistent
+        # workbook.
+        #
+        # Batches may be nested; only the outermost commit() recalculates.
+        self.batch_depth += 1
+
+    def commit(self) -> None:
+        # Finish the batch started by the matching begin_batch().  When the
+        # outermost batch is committed, all cells affected by the batch are
+        # recalculated and the notification functions are called once with
+        # every cell whose value changed.
+        #
+        # If no batch is in progress, a RuntimeError is raised.
+        if self.batch_depth == 0:
+            raise RuntimeError('No batch in progress.')
+        self.batch_depth -= 1
+        if self.batch_depth == 0:
+            self.flush_dirty_cells()
+            self.handle_notifications()
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Context manager wrapping begin_batch() and commit():
+        #
+        #     with wb.batch():
+        #         wb.set_cell_contents('Sheet1', 'A1', '5')
+        #         wb.set_cell_contents('Sheet1', 'A2', '=A1 * 2')
+        #
+        # The batch is committed even if the body raises an exception, so the
+        # workbook's values are never left stale.
+        self.begin_batch()
+        try:
+            yield self
+        finally:
+            self.commit()
+
+    def set_calculation_mode(self, mode: str, recalc_on_save: bool = False) -> None:
+        # Set how the workbook recalculates cell values after edits:
+        #
+        # 'automatic' (the default): set_cell_contents() recalculates every
+        #     cell that depends on the edited cell before it returns.
+        #
+        # 'lazy': set_cell_contents() only records the new contents and marks
+        #     the edited cell and the cells that depend on it as stale.  A
+        #     stale cell is computed when its value is read, by
+        #     get_cell_value() or by a formula being computed, and then kept
+        #     until one of its inputs changes again; cells that are never
+        #     read are never recalculated.  Notifications for a cell are sent
+        #     when its new value is computed.  Other workbook operations
+        #     (moving or copying cells, renaming sheets, etc.) first compute
+        #     every stale cell.
+        #
+        # 'manual': set_cell_contents() and the other workbook operations
+        #     (moving, copying and sorting cells, renaming sheets, etc.) only
+        #     update cell contents and the dependency graph; values, and the
+        #     notifications for them, are only updated by recalculate().
+        #     Sorting uses the values as of the last recalculation.
+        #
+        # Leaving 'lazy' mode computes every stale cell, and leaving 'manual'
+        # mode recalculates the cells edited since the last recalculation.
+        #
+        # If recalc_on_save is True, save_workbook() first calls
+        # recalculate(), so the values match the contents that are saved.
+        #
+        # If the mode is not recognized, a ValueError is raised.
+        if mode not in ('automatic', 'lazy', 'manual'):
+            raise ValueError(f'Unknown calculation mode {mode}.')
+        prev_mode = self.calculation_mode
+        self.calculation_mode = mode
+        self.recalc_on_save = recalc_on_save
+        if prev_mode != mode:
+            self.recalculate()
+
+    def recalculate(self, full: bool = False) -> None:
+        # Bring cell values up to date in a single pass, evaluating each
+        # affected cell once in dependency order.  By default only the cells
+        # edited since the last recalculation, and the cells depending on
+        # them, are recalculated; if full is True, every cell in the workbook
+        # is.  The notification functions are called once with every cell
+        # whose value changed.
+        #
+        # This is mainly useful in 'manual' calculation mode; in the other
+        # modes, values are already up to date (or computed when read), so
+        # only a full recalculation does any work.
+        self.recalculate_cells(full)
+        self.handle_notifications()
+
     def rename_sheet(self, sheet_name: str, new_sheet_name: str) -> None:
         # Rename the specified sheet to the new sheet name.  Additionally, all
         # cell formulas that referenced the original sheet name are updated to
@@ -677,42 +1099,32 @@ class Workbook:
         if (new_sheet_name.lower() in self.sheets):
             raise ValueError('Spreadsheet names must be unique.')
         
+        self.flush_dirty_cells()
         self.in_api_call = True
 
         sne = SheetNameExtractor(sheet_name, new_sheet_name)
         
         sheet_name = sheet_name.lower()
         
-        # copying old_sheet_name info in self.graph.ingoings, outgoings over to new_sheet_name
-        self.graph.outgoing[new_sheet_name.lower()] = self.graph.outgoing[sheet_name]
-        if (new_sheet_name.lower() in self.graph.ingoing):
-            self.graph.ingoing[new_sheet_name.lower()] = {**self.graph.ingoing[new_sheet_name.lower()], **self.graph.ingoing[sheet_name]}
-        else:
-            self.graph.ingoing[new_sheet_name.lower()] = self.graph.ingoing[sheet_name]
-        
-        # resolve internal errors (when the references are within current sheet_name)
-        sheet_ingoings = self.graph.ingoing[new_sheet_name.lower()]
-        for loc in sheet_ingoings:
-            cell_ingoings = sheet_ingoings[loc]
-            for i in range(len(cell_ingoings)):
-                sn, new_loc = cell_ingoings[i]
-                if (sn == sheet_name):
-                    cell_ingoings[i] = (new_sheet_name.lower(), new_loc)
-
-        sheet_outgoings = self.graph.outgoing[new_sheet_name.lower()]
-        for loc in sheet_outgoings:
-            cell_outgoings = sheet_outgoings[loc]
-            for i in range(len(cell_outgoings)):
-                sn, new_loc = cell_outgoings[i]
-                if (sn == sheet_name):
-                    cell_outgoings[i] = (new_sheet_name.lower(), new_loc)
+        # update sheet name in self.sheets
+        old_index = list(self.sheets.keys()).index(sheet_name.lower())
+        self.sheets[new_sheet_name.lower()] = self.sheets.pop(sheet_name.lower()) # sheet object
+        self.sheets[new_sheet_name.lower()].sheet_name = new_sheet_name
+        self.move_sheet(new_sheet_name.lower(), old_index)
+
+        # the graph renames the sheet's cells in place, so the edges to and
+        # from them (including references within the sheet) use the new name
+        self.graph.rename_sheet(sheet_name, new_sheet_name)
+
+        # edits awaiting recalculation (manual mode) move with the sheet
+        self.dirty_cells = {((new_sheet_name.lower() if sn == sheet_name else sn), loc): True
+                            for sn, loc in self.dirty_cells}
 
         # changing the sheet to be changed's ingoing cells' outgoing lists, 
         # which contain the sheet to be changed
         # this changes the contents, as well as the outgoing of the ingoings
-        for loc in sheet_ingoings:
-            cell_ingoings = sheet_ingoings[loc].copy()
-            for sn, loc2 in cell_ingoings:
+        for loc in self.graph.referenced_locations(new_sheet_name):
+            for sn, loc2 in self.graph.ingoing_get(new_sheet_name, loc):
                 if sn == new_sheet_name.lower():
                     continue
 
@@ -720,38 +1132,18 @@ class Workbook:
                 if self.get_cell_contents(sn, loc2).startswith('='):
                     cell = self.get_cell(sn, loc2)
                     if not cell.parse_error:
-                        new_formula = sne.transform(cell.tree)
+                        new_formula = sne.transform(parse_formula(cell.contents))
                         self.set_cell_contents(sn, loc2, '=' + new_formula)
 
-        # changes the ingoing of the outgoings
-        for loc in sheet_outgoings:
-            cell_outgoings = sheet_outgoings[loc]
-            for sn, loc2 in cell_outgoings:
-                # access ingoing of this cell and modify
-                ingoing_lst = self.graph.ingoing_get(sn, loc2)
-                for i, (ingoing_sn, ingoing_loc) in enumerate(ingoing_lst):
-                      if ingoing_sn == sheet_name:
-                          ingoing_lst[i] = (new_sheet_name.lower(), ingoing_loc)
-                                                                                                                                                                                    
-        # update sheet name in self.sheets, self.graph.ingoing, self.graph.outgoing
-        old_index = list(self.sheets.keys()).index(sheet_name.lower())
-        self.sheets[new_sheet_name.lower()] = self.sheets.pop(sheet_name.lower()) # sheet object
-        self.sheets[new_sheet_name.lower()].sheet_name = new_sheet_name
-        self.move_sheet(new_sheet_name.lower(), old_index)
-
-        self.graph.ingoing.pop(sheet_name)
-        self.graph.outgoing.pop(sheet_name)
-
-        for loc in sheet_ingoings:
-            cell_ingoings = sheet_ingoings[loc].copy()
-            for sn, loc2 in cell_ingoings:
+        for loc in self.graph.referenced_locations(new_sheet_name):
+            for sn, loc2 in self.graph.ingoing_get(new_sheet_name, loc):
                 if sn == new_sheet_name.lower():
                     cell = self.get_cell(sn, loc2)
                     if not cell.parse_error:
-                        new_formula = sne.transform(cell.tree)
+                        new_formula = sne.transform(parse_formula(cell.contents))
                         self.set_cell_contents(sn, loc2, '=' + new_formula)
         
-        for loc in self.graph.ingoing[new_sheet_name.lower()]:
+        for loc in self.graph.referenced_locations(new_sheet_name):
             self.set_cell_contents(new_sheet_name, loc, self.get_cell_contents(new_sheet_name, loc))
 
         self.in_api_call = False
@@ -806,6 +1198,7 @@ class Workbook:
         if sheet_name.lower() not in self.sheets.keys():
             raise KeyError('Sheet not found.')
         
+        self.flush_dirty_cells()
         self.in_api_call = True
         
         sheet_names_lower = [sheet_name.lower() for sheet_name in self.list_sheets()]
@@ -825,12 +1218,16 @@ class Workbook:
         self.sheets[new_name.lower()] = copy.deepcopy(sheet_to_copy)
         self.sheets[new_name.lower()].sheet_name = new_name
         
-        outgoings = self.graph.outgoing[sheet_name.lower()]
-        for loc in outgoings:
+        # the copy's cells also await recalculation where the original's do
+        # (manual mode)
+        for sn, loc in list(self.dirty_cells):
+            if sn == sheet_name.lower():
+                self.dirty_cells[(new_name.lower(), loc)] = True
+
+        for loc in self.graph.referencing_locations(sheet_name):
             self.set_cell_contents(new_name, loc, self.get_cell_contents(sheet_name, loc))
 
-        new_ingoings = self.graph.ingoing[new_name.lower()]
-        for loc in new_ingoings:
+        for loc in self.graph.referenced_locations(new_name):
             self.set_cell_contents(new_name, loc, self.get_cell_contents(sheet_name, loc))
 
         self.in_api_call = False
@@ -883,7 +1280,7 @@ class Workbook:
                 cell = self.get_cell(sheet_name, orig_loc)
                 if cell:
                     if (cell.contents and cell.contents.startswith('=')):
-                        new_formula = updater.transform(cell.tree)
+                        new_formula = updater.transform(parse_formula(cell.contents))
                         contents_grid[i][j] = '=' + new_formula
                     else:
                         contents_grid[i][j] = cell.contents
@@ -947,6 +1344,7 @@ class Workbook:
         # If a formula being moved contains a relative or mixed cell-reference
         # that will become invalid after updating the cell-reference, then the
         # cell-reference is replaced with a #REF! error-literal in the formula.
+        self.flush_dirty_cells()
         self.in_api_call = True
         self.transfer_cells(sheet_name, start_location, end_location, to_location, True, to_sheet)
 
@@ -995,6 +1393,7 @@ class Workbook:
         # If a formula being copied contains a relative or mixed cell-reference
         # that will become invalid after updating the cell-reference, then the
         # cell-reference is replaced with a #REF! error-literal in the formula.
+        self.flush_dirty_cells()
         self.in_api_call = True
         self.transfer_cells(sheet_name, start_location, end_location, to_location, False, to_sheet)
         self.in_api_call = False
@@ -1080,6 +1479,7 @@ class Workbook:
         m = bottom_right_col - top_left_col + 1
         n = bottom_right_row - top_left_row + 1
 
+        self.flush_dirty_cells()
         adapters = []
         orig_cells = [[0 for _ in range(m)] for _ in range(n)]
         for i in range(n):
@@ -1122,7 +1522,7 @@ class Workbook:
                 if target_cell:
 
                     if target_cell.contents and target_cell.contents.startswith('='):
-                        new_formula = updater.transform(target_cell.tree)
+                        new_formula = updater.transform(parse_formula(target_cell.contents))
                         if new_formula: # is within region
                             contents_grid[i][j] = '=' + new_formula
                         else:
@@ -0,0 +1,479 @@
+import decimal
+import operator
+import re
+import lark
+from .CellError import CellError, CellErrorType
+from .CellValue import CellValue
+from .NumericKernel import KERNELS, NUMBER_TYPES
+from .RangeView import RangeView
+from .Sheet import Sheet
+
+decimal.getcontext().prec = 500
+
+ERROR_DICT = {
+    "#error!": CellErrorType.PARSE_ERROR,
+    "#circref!": CellErrorType.CIRCULAR_REFERENCE,
+    "#ref!": CellErrorType.BAD_REFERENCE,
+    "#name?": CellErrorType.BAD_NAME,
+    "#value!": CellErrorType.TYPE_ERROR,
+    "#div/0!": CellErrorType.DIVIDE_BY_ZERO
+}
+
+COMPARE_OPS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '<>': operator.ne,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+}
+
+def strip_sheet_quotes(sheet_name):
+    if (len(sheet_name) > 2 and sheet_name[0] == '\'' and sheet_name[-1] == '\''):
+        return sheet_name[1:-1]
+    return sheet_name
+
+def bad_reference(detail='Bad reference', exception=None):
+    if exception is None and detail == 'Bad reference':
+        return CellValue.error(CellErrorType.BAD_REFERENCE)
+    return CellValue(CellError(CellErrorType.BAD_REFERENCE, detail, exception))
+
+# Relative (R1C1-style) formula form.  Formulas that only differ by the
+# offset of their relative references, such as =A1*B1 in C1 and =A2*B2 in C2,
+# have the same relative form, so they can share one compiled program which
+# resolves each reference against the location of the cell being evaluated.
+
+MAX_COL = Sheet.str_to_index('zzzz')
+MAX_ROW = 9999
+
+# strings, quoted sheet names and words (sheet names, function names,
+# booleans and cell references); everything else is copied verbatim
+FORMULA_TOKEN = re.compile(r'"[^"]*"|\'[^\']*\'|\$?[A-Za-z_][A-Za-z0-9_]*(?:\$[0-9]+)?')
+CELLREF_PARTS = re.compile(r'(\$?)([A-Za-z]+)(\$?)([1-9][0-9]*)')
+# the lexer only treats a word as a sheet or function name when it is
+# followed by "!" or "("
+NAME_SUFFIX = re.compile(r'\s*(?:\(|!(?!=))')
+
+def split_reference(location):
+    # Splits a cell reference into (col_absolute, col_idx, row_absolute,
+    # row_idx) with 0-indexed coordinates.
+    col_abs, col, row_abs, row = CELLREF_PARTS.fullmatch(location).groups()
+    return bool(col_abs), Sheet.str_to_index(col), bool(row_abs), int(row) - 1
+
+def relative_reference(location, col_idx, row_idx):
+    # Renders a cell reference relative to the cell at (col_idx, row_idx):
+    # relative parts become offsets, absolute parts are kept.
+    col_abs, col, row_abs, row = split_reference(location)
+    col_part = f'${col}' if col_abs else f'C[{col - col_idx}]'
+    row_part = f'${row}' if row_abs else f'R[{row - row_idx}]'
+    return '{' + col_part + row_part + '}'
+
+def relative_formula(formula, col_idx, row_idx):
+    # Returns the relative form of a formula entered in the cell at
+    # (col_idx, row_idx).
+    parts = []
+    end = 0
+    for match in FORMULA_TOKEN.finditer(formula):
+        token = match.group()
+        if CELLREF_PARTS.fullmatch(token) and not NAME_SUFFIX.match(formula, match.end()):
+            parts.append(formula[end:match.start()])
+            parts.append(relative_reference(token, col_idx, row_idx))
+            end = match.end()
+    parts.append(formula[end:])
+    return ''.join(parts)
+
+def make_locator(location, col_idx, row_idx):
+    # Compiles a cell reference in the cell at (col_idx, row_idx) into a
+    # function returning the (col_idx, row_idx) it refers to from the cell
+    # being evaluated, or None if that is outside the spreadsheet.
+    col_abs, col, row_abs, row = split_reference(location)
+    col_delta = col - col_idx
+    row_delta = row - row_idx
+
+    if col_abs and row_abs:
+        coords = (col, row) if col <= MAX_COL and row < MAX_ROW else None
+        return lambda ev: coords
+
+    def locator(ev):
+        ref_col = col if col_abs else ev.col_idx + col_delta
+        ref_row = row if row_abs else ev.row_idx + row_delta
+        if 0 <= ref_col <= MAX_COL and 0 <= ref_row < MAX_ROW:
+            return ref_col, ref_row
+        return None
+    return locator
+
+def reference_coords(location):
+    # The 0-indexed (col_idx, row_idx) a cell reference names, or None if
+    # that is outside the spreadsheet.
+    _, col, _, row = split_reference(location)
+    return (col, row) if col <= MAX_COL and row < MAX_ROW else None
+
+def range_key(start, end):
+    # The lowercase location ('a1:b3') a formula references the range with
+    # corners start and end by, from its top-left to its bottom-right cell;
+    # the dependency graph keeps the range as one node under this key.
+    (start_col, start_row), (end_col, end_row) = start, end
+    return (Sheet.location_key(min(start_col, end_col), min(start_row, end_row)) + ':' +
+            Sheet.location_key(max(start_col, end_col), max(start_row, end_row)))
+
+# Operator semantics.  Each takes and returns CellValues; the compiled
+# closures below call these with the values of their operands, and the
+# arithmetic operators with the workbook's numeric kernel.
+
+def compare(val_1, compare_op, val_2):
+    if val_1.is_cell_error():
+        return val_1
+    elif val_2.is_cell_error():
+        return val_2
+
+    val_1, val_2 = val_1.val, val_2.val
+    if isinstance(val_1, NUMBER_TYPES) and isinstance(val_2, NUMBER_TYPES):
+        # check if both numbers
+        # do nothing
+        pass
+    elif isinstance(val_1, str) and isinstance(val_2, str):
+        # check if both strings
+        val_1 = val_1.lower()
+        val_2 = val_2.lower()
+    elif isinstance(val_1, bool) and isinstance(val_2, bool):
+        # check if both booleans
+        # do nothing
+        pass
+    elif val_1 is None and val_2 is None:
+        # check for both being empty cell
+        val_1 = 1
+        val_2 = 1
+    elif val_1 is None:
+        # check for val_1 being empty cell
+        if isinstance(val_2, NUMBER_TYPES):
+            val_1 = 0
+        elif isinstance(val_2, str):
+            val_1 = ''
+        elif isinstance(val_2, bool):
+            val_1 = False
+    elif val_2 is None:
+        # check for val_2 being empty cell
+        if isinstance(val_1, NUMBER_TYPES):
+            val_2 = 0
+        elif isinstance(val_1, str):
+            val_2 = ''
+        elif isinstance(val_1, bool):
+            val_2 = False
+    else:
+        # handle different types
+        if isinstance(val_1, NUMBER_TYPES):
+            val_1 = 0
+        elif isinstance(val_1, str):
+            val_1 = 1
+        elif isinstance(val_1, bool):
+            val_1 = 2
+
+        if isinstance(val_2, NUMBER_TYPES):
+            val_2 = 0
+        elif isinstance(val_2, str):
+            val_2 = 1
+        elif isinstance(val_2, bool):
+            val_2 = 2
+
+    return CellValue(compare_op(val_1, val_2))
+
+def add(val_1, val_2, kernel):
+    val_1 = kernel.to_number(val_1)
+    val_2 = kernel.to_number(val_2)
+    if val_1.is_cell_error():
+        return val_1
+    elif val_2.is_cell_error():
+        return val_2
+    return kernel.value(val_1.val + val_2.val)
+
+def subtract(val_1, val_2, kernel):
+    val_1 = kernel.to_number(val_1)
+    val_2 = kernel.to_number(val_2)
+    if val_1.is_cell_error():
+        return val_1
+    elif val_2.is_cell_error():
+        return val_2
+    return kernel.value(val_1.val - val_2.val)
+
+def multiply(val_1, val_2, kernel):
+    val_1 = kernel.to_number(val_1)
+    val_2 = kernel.to_number(val_2)
+    if val_1.is_cell_error():
+        return val_1
+    elif val_2.is_cell_error():
+        return val_2
+    return kernel.value(val_1.val * val_2.val)
+
+def divide(val_1, val_2, kernel):
+    val_1 = kernel.to_number(val_1)
+    val_2 = kernel.to_number(val_2)
+    if val_1.is_cell_error():
+        return val_1
+    elif val_2.is_cell_error():
+        return val_2
+    if (val_2.val == 0):
+        return CellValue.error(CellErrorType.DIVIDE_BY_ZERO)
+    return kernel.value(val_1.val / val_2.val)
+
+def positive(val, kernel):
+    val = kernel.to_number(val)
+    if val.is_cell_error():
+        return val
+    return kernel.value(val.val)
+
+def negative(val, kernel):
+    val = kernel.to_number(val)
+    if val.is_cell_error():
+        return val
+    return kernel.value(-val.val)
+
+def concat(val_1, val_2):
+    val_1 = val_1.to_string()
+    val_2 = val_2.to_string()
+    if val_1.is_cell_error():
+        return val_1
+    if val_2.is_cell_error():
+        return val_2
+    return CellValue(val_1.val + val_2.val).to_string()
+
+BINARY_OPS = {
+    '+': add,
+    '-': subtract,
+    '*': multiply,
+    '/': divide,
+}
+
+UNARY_OPS = {
+    '+': positive,
+    '-': negative,
+}
+
+class FormulaCompiler(lark.visitors.Transformer):
+    '''
+    Compiles a formula parse tree into a closure, bottom-up.  Every node
+    becomes a function taking a FormulaEvaluator (which supplies the sheet,
+    cell, workbook and function directory, and collects the cell references)
+    and returning a CellValue, so evaluating a formula is a chain of plain
+    Python calls rather than a walk over the tree.
+
+    The tree is compiled for the cell at (col_idx, row_idx).  Relative cell
+    references are stored as offsets from that cell and resolved against the
+    cell being evaluated, so the program can be shared by every cell whose
+    formula has the same relative form (see relative_formula).
+
+    Function arguments are passed to the spreadsheet functions as a tuple of
+    compiled nodes, which they evaluate with ev.visit(), so functions such as
+    IF only evaluate the arguments they need.
+    '''
+
+    def __init__(self, col_idx=0, row_idx=0):
+        super().__init__(visit_tokens=False)
+        self.col_idx = col_idx
+        self.row_idx = row_idx
+
+    def compare_expr(self, children):
+        left, compare_op, right = children
+        if str(compare_op) not in COMPARE_OPS:
+            raise AssertionError('Compare operator is unidentifiable.')
+        compare_op = COMPARE_OPS[str(compare_op)]
+
+        def compare_expr(ev):
+            return compare(left(ev), compare_op, right(ev))
+        return compare_expr
+
+    def add_expr(self, children):
+        left, op, right = children
+        if str(op) not in ('+', '-'):
+            raise AssertionError(f'Unexpected operation: {op}')
+        binary_op = BINARY_OPS[str(op)]
+
+        def add_expr(ev):
+            return binary_op(left(ev), right(ev), ev.kernel)
+        return add_expr
+
+    def mul_expr(self, children):
+        left, op, right = children
+        if str(op) not in ('*', '/'):
+            raise AssertionError(f'Unexpected operation: {op}')
+        binary_op = BINARY_OPS[str(op)]
+
+        def mul_expr(ev):
+            return binary_op(left(ev), right(ev), ev.kernel)
+        return mul_expr
+
+    def unary_op(self, children):
+        op, operand = children
+        if str(op) not in UNARY_OPS:
+            raise AssertionError(f'Unexpected operation: {op}')
+        unary_op = UNARY_OPS[str(op)]
+
+        def unary(ev):
+            return unary_op(operand(ev), ev.kernel)
+        return unary
+
+    def concat_expr(self, children):
+        assert len(children) == 2, 'Unexpected number of args'
+        left, right = children
+
+        def concat_expr(ev):
+            return concat(left(ev), right(ev))
+        return concat_expr
+
+    def error(self, children):
+        value = CellValue.error(ERROR_DICT[children[0].lower()])
+
+        def error(ev):
+            return value
+        return error
+
+    def parens(self, children):
+        assert len(children) == 1, 'Unexpected parenthesized expression'
+        inner = children[0]
+
+        def parens(ev):
+            value = inner(ev)
+            if value is None or value.val is None:
+                return ev.kernel.zero
+            return value
+        return parens
+
+    def number(self, children):
+        # the literal's value under each numeric kernel, by kernel index
+        values = tuple(CellValue(kernel.number(children[0])) for kernel in KERNELS.values())
+
+        def number_literal(ev):
+            return values[ev.kernel.index]
+        return number_literal
+
+    def string(self, children):
+        value = CellValue(children[0].value[1:-1])
+
+        def string_literal(ev):
+            return value
+        return string_literal
+
+    def boolean(self, children):
+        boolean = children[0].lower() == 'true'
+
+        def boolean_literal(ev):
+            return CellValue(boolean)
+        return boolean_literal
+
+    def args(self, children):
+        return tuple(children)
+
+    def function_call(self, children):
+        function_name, arg_nodes = children
+        return function_name.upper(), arg_nodes
+
+    def function(self, children):
+        function_name, arg_nodes = children[0]
+
+        def function(ev):
+            func = ev.func_directory.get(function_name)
+            if func is None:
+                return CellValue(CellError(CellErrorType.BAD_NAME, f"Unknown function: {function_name}"))
+            return func(arg_nodes, ev)
+        return function
+
+    def cell(self, children):
+        if len(children) == 1:
+            sheet_name = None
+            location = children[0].value
+        elif len(children) == 2:
+            sheet_name = strip_sheet_quotes(children[0].value.lower())
+            location = children[1].value
+        else:
+            raise AssertionError('Length of tree for cell is not one or two')
+
+        locator = make_locator(location, self.col_idx, self.row_idx)
+
+        def cell(ev):
+            coords = locator(ev)
+            if coords is None:
+                return bad_reference()
+            location = Sheet.location_key(*coords)
+            sheet = sheet_name if sheet_name is not None else ev.sheet_name.lower()
+            ev.refs.add((sheet, location))
+            try:
+                return CellValue(ev.workbook.get_cell_value(sheet, location))
+            except (ValueError, KeyError) as e:
+                return bad_reference(exception=e)
+        return cell
+
+    def cell_range(self, children):
+        if len(children) == 1 and callable(children[0]):
+            # the `-> cell_range` alias wraps the cell_range rule itself
+            return children[0]
+
+        if len(children) == 3:
+            sheet_name = strip_sheet_quotes(children[0].value.lower())
+            start_location, end_location = children[1].value, children[2].value
+        else:
+            sheet_name = None
+            start_location, end_location = children[0].value, children[1].value
+
+        start_locator = make_locator(start_location, self.col_idx, self.row_idx)
+        end_locator = make_locator(end_location, self.col_idx, self.row_idx)
+
+        # the corners and key of the last range resolved, which are reused
+        # while the program is evaluated for cells with the same range
+        last = [None, None]
+
+        def cell_range(ev):
+            corners = (start_locator(ev), end_locator(ev))
+            if None in corners:
+                return bad_reference('Spreadsheet cell location is invalid. ZZZZ9999 is the bottom-right-most cell.')
+            if last[0] != corners:
+                last[:] = corners, range_key(*corners)
+
+            sheet_key = sheet_name if sheet_name is not None else ev.sheet_name.lower()
+            ev.refs.add((sheet_key, last[1]))
+            sheet = ev.workbook.sheets.get(sheet_key)
+            if sheet is None:
+                return bad_reference(exception=KeyError('Sheet not found.'))
+
+            (start_col, start_row), (end_col, end_row) = corners
+            bounds = (min(start_col, end_col), min(start_row, end_row),
+                      max(start_col, end_col), max(start_row, end_row))
+            if ev.workbook.stale_cells:
+                # compute any stale cells in the range (lazy mode)
+                for cell_tup in ev.workbook.stale_in_range(sheet_key, bounds):
+                    if cell_tup in ev.workbook.stale_cells:
+                        ev.workbook.get_cell_value(*cell_tup)
+            return RangeView(sheet, *bounds, key=(sheet_key, last[1]))
+        return cell_range
+
+def compile_tree(tree, col_idx=0, row_idx=0):
+    # Compiles a formula parse tree, entered in the cell at (col_idx,
+    # row_idx), into a closure taking a FormulaEvaluator.
+    return FormulaCompiler(col_idx, row_idx).transform(tree)
+
+def formula_references(tree, sheet_name):
+    # The (sheet, location) references of a formula parse tree entered on the
+    # given sheet, found without evaluating it; these are the references an
+    # evaluation records, except that references computed at run time (by
+    # INDIRECT) are not known, and references in branches an evaluation
+    # would skip are included.
+    refs = set()
+    sheet_name = sheet_name.lower()
+    for node in tree.iter_subtrees():
+        if node.data == 'cell':
+            if len(node.children) == 2:
+                sheet = strip_sheet_quotes(node.children[0].value.lower())
+            else:
+                sheet = sheet_name
+            coords = reference_coords(node.children[-1].value)
+            if coords is not None:
+                refs.add((sheet, Sheet.location_key(*coords)))
+        elif node.data == 'cell_range' and not isinstance(node.children[0], lark.Tree):
+            if len(node.children) == 3:
+                sheet = strip_sheet_quotes(node.children[0].value.lower())
+            else:
+                sheet = sheet_name
+            corners = [reference_coords(token.value) for token in node.children[-2:]]
+            if None not in corners:
+                refs.add((sheet, range_key(*corners)))
+    return refs
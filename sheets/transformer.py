@@ -77,6 +77,13 @@ class SheetNameExtractor(lark.visitors.Transformer):
         else:
             raise AssertionError('Invalid formula. Format must be in ZZZZ9999.')
 
+    def cell_range(self, tree):
+        # the `-> cell_range` alias wraps the cell_range rule itself
+        if len(tree) == 1:
+            return str(tree[0])
+        # the sheet name and first corner are renamed as a cell reference
+        return self.cell(tree[:-1]) + ':' + str(tree[-1])
+
 class FormulaUpdater(lark.visitors.Transformer):
 
     def __init__(self, delta_x, delta_y, sort_region=None):
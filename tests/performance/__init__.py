@@ -1,4 +1,6 @@
 from .test_cycles import CycleDetectionTests
 from .test_performance import GeneralPerformanceTests
 from .test_updates import CellUpdateTests
-from .test_workbook import WorkbookTests
\ No newline at end of file
+from .test_workbook import WorkbookTests
+from .test_memory import MemoryTests
+from .test_numeric import NumericKernelTests
\ No newline at end of file
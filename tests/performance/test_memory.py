@@ -0,0 +1,42 @@
+import unittest
+import tracemalloc
+import sheets
+
+num_cells = 5000
+
+def bytes_per_cell(fill):
+    # the memory a workbook allocates per cell filled by fill(wb, row); a
+    # first workbook is filled to warm the shared (bounded) caches of
+    # locations and formulas, so only the second workbook is counted
+    for measured in (False, True):
+        if measured:
+            tracemalloc.start()
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        before = tracemalloc.get_traced_memory()[0]
+        for row in range(1, num_cells + 1):
+            fill(wb, row)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / num_cells
+
+class MemoryTests(unittest.TestCase):
+    # Checks the bytes allocated per cell for common kinds of contents.  The
+    # bounds are generous; they catch a regression to per-cell dictionaries
+    # and unshared values, not small changes.
+
+    def check(self, kind, fill, bound):
+        size = bytes_per_cell(fill)
+        self.assertLess(size, bound, msg=f'{kind}: {size:.0f} bytes per cell')
+
+    def test_number_cells(self):
+        self.check('numbers', lambda wb, row: wb.set_cell_contents('Sheet1', f'A{row}', str(row)), 550)
+
+    def test_boolean_cells(self):
+        self.check('booleans', lambda wb, row: wb.set_cell_contents('Sheet1', f'A{row}', 'TRUE'), 350)
+
+    def test_error_cells(self):
+        self.check('errors', lambda wb, row: wb.set_cell_contents('Sheet1', f'A{row}', '#REF!'), 350)
+
+    def test_formula_cells(self):
+        self.check('formulas', lambda wb, row: wb.set_cell_contents('Sheet1', f'B{row}', f'=A{row} * 2'), 2000)
@@ -0,0 +1,67 @@
+import unittest
+import timeit
+import decimal
+import sheets
+from sheets.CellValue import CellValue
+from sheets.compiler import add, multiply, divide
+from sheets.NumericKernel import DECIMAL_KERNEL, FLOAT_KERNEL
+
+num_operations = 20000
+
+def normalized(number):
+    # how each arithmetic result used to be normalized, through its string
+    return CellValue(decimal.Decimal(CellValue.strip_trailing_zeros(str(number))))
+
+def time_operations(operation, val_1, val_2):
+    # the best time per operation, in microseconds
+    timer = timeit.Timer(lambda: operation(val_1, val_2))
+    return min(timer.repeat(repeat=5, number=num_operations)) / num_operations * 1e6
+
+class NumericKernelTests(unittest.TestCase):
+    # Times the arithmetic operators per operation under the Decimal kernel,
+    # which leaves results as computed, against normalizing every result
+    # through a string as the interpreter did before, and under the float
+    # kernel.  The results a workbook stores must still be in canonical form.
+
+    def check(self, name, operator, val_1, val_2, formula, stored):
+        def string_normalized(val_1, val_2):
+            return normalized(operator(val_1, val_2, DECIMAL_KERNEL).val)
+
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', formula)
+        value = wb.get_cell_value('Sheet1', 'A1')
+        self.assertEqual(str(value), stored)
+        self.assertEqual(value.as_tuple(), normalized(operator(val_1, val_2, DECIMAL_KERNEL).val).val.as_tuple())
+
+        before = time_operations(string_normalized, val_1, val_2)
+        after = time_operations(lambda val_1, val_2: operator(val_1, val_2, DECIMAL_KERNEL), val_1, val_2)
+        floats = time_operations(lambda val_1, val_2: operator(val_1, val_2, FLOAT_KERNEL),
+                                 FLOAT_KERNEL.to_number(val_1), FLOAT_KERNEL.to_number(val_2))
+        # leaving results unnormalized takes well under half the time; the
+        # margin only keeps timing noise from failing the test
+        self.assertLess(after, 0.8 * before, msg=f'{name}: {before:.2f}us normalized, {after:.2f}us decimal, '
+                                                 f'{floats:.2f}us float')
+
+    def test_add(self):
+        # the sum is computed as 1235.0, and stored without the trailing zero
+        self.check('add', add, CellValue(decimal.Decimal('1234.5')), CellValue(decimal.Decimal('0.5')),
+                   '=1234.5 + 0.5', '1235')
+
+    def test_multiply(self):
+        self.check('multiply', multiply, CellValue(decimal.Decimal('1234.5')), CellValue(decimal.Decimal('-2')),
+                   '=1234.5 * -2', '-2469')
+
+    def test_divide(self):
+        # a 500-digit quotient makes the string round trip most expensive
+        self.check('divide', divide, CellValue(decimal.Decimal('10')), CellValue(decimal.Decimal('3')),
+                   '=10 / 3', '3.' + '3' * 499)
+
+    def test_formula_chain(self):
+        # the values a formula chain stores are still in canonical form
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', '0.5')
+        for i in range(2, 1001):
+            wb.set_cell_contents('Sheet1', f'A{i}', f'=A{i - 1} * 2.0 - A{i - 1} + 0.50')
+        self.assertEqual(str(wb.get_cell_value('Sheet1', 'A1000')), '500')
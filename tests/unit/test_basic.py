@@ -7,6 +7,7 @@ import os
 import lark
 from sheets.interpreter import FormulaEvaluator
 from sheets.transformer import SheetNameExtractor
+from sheets.FormulaCache import FormulaCache, parser as lalr_parser
 import decimal
 import json
 import contextlib
@@ -69,7 +70,36 @@ class BasicTests(unittest.TestCase):
         # parentheses
         wb.set_cell_contents('Sheet1', 'A1', '=(D1)')
         self.assertEqual(str(wb.get_cell_value('Sheet1', 'A1')), '0')
-    
+
+    def test_sheet_extent(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        sheet = wb.sheets['sheet1']
+
+        wb.set_cell_contents('Sheet1', 'Z1000', '1')
+        # filling and clearing a cell within the extent does not grow the
+        # row and column heaps
+        for _ in range(10000):
+            wb.set_cell_contents('Sheet1', 'B5', '2')
+            wb.set_cell_contents('Sheet1', 'B5', None)
+        self.assertEqual(len(sheet.cells), 1)
+        self.assertLess(len(sheet.row_heap), 100)
+        self.assertLess(len(sheet.col_heap), 100)
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (26, 1000))
+
+        # clearing the edge shrinks the extent to the next occupied row and
+        # column, skipping those emptied since
+        wb.set_cell_contents('Sheet1', 'C7', '3')
+        wb.set_cell_contents('Sheet1', 'E3', '4')
+        wb.set_cell_contents('Sheet1', 'D9', '5')
+        wb.set_cell_contents('Sheet1', 'D9', None)
+        wb.set_cell_contents('Sheet1', 'Z1000', None)
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (5, 7))
+        wb.set_cell_contents('Sheet1', 'C7', None)
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (5, 3))
+        wb.set_cell_contents('Sheet1', 'E3', None)
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (0, 0))
+
     def test_concat(self):
         wb = sheets.Workbook()
         wb.new_sheet()
@@ -197,6 +227,45 @@ class BasicTests(unittest.TestCase):
         wb.set_cell_contents('Sheet1', 'D1', '=D1')
         self.assertEqual(wb.detect_cycle(('Sheet1', 'D1')), True)
 
+    def test_cycle_merge_split(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+
+        # two cycles sharing A1: A1 -> B1 -> A1 and A1 -> C1 -> D1 -> A1
+        wb.set_cell_contents('Sheet1', 'A1', '=B1 + D1')
+        wb.set_cell_contents('Sheet1', 'B1', '=A1')
+        wb.set_cell_contents('Sheet1', 'C1', '=A1')
+        wb.set_cell_contents('Sheet1', 'D1', '=C1')
+        wb.set_cell_contents('Sheet1', 'E1', '=D1 + 1')
+        for loc in ['A1', 'B1', 'C1', 'D1']:
+            self.assertTrue(wb.detect_cycle(('Sheet1', loc)))
+        self.assertFalse(wb.detect_cycle(('Sheet1', 'E1')))
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E1').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+        # breaking one cycle leaves the other
+        wb.set_cell_contents('Sheet1', 'B1', '5')
+        self.assertFalse(wb.detect_cycle(('Sheet1', 'B1')))
+        for loc in ['A1', 'C1', 'D1']:
+            self.assertTrue(wb.detect_cycle(('Sheet1', loc)))
+            self.assertEqual(wb.get_cell_value('Sheet1', loc).get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+        wb.set_cell_contents('Sheet1', 'C1', '=B1')
+        for loc in ['A1', 'B1', 'C1', 'D1', 'E1']:
+            self.assertFalse(wb.detect_cycle(('Sheet1', loc)))
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1'), 10)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E1'), 6)
+
+        # a cycle formed and broken inside a batch
+        with wb.batch():
+            wb.set_cell_contents('Sheet1', 'B1', '=E1')
+        self.assertTrue(wb.detect_cycle(('Sheet1', 'E1')))
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        with wb.batch():
+            wb.set_cell_contents('Sheet1', 'D1', '2')
+        self.assertFalse(wb.detect_cycle(('Sheet1', 'E1')))
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 3)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1'), 5)
+
     def test_interpreter(self):
         wb = sheets.Workbook()
         wb.new_sheet()
@@ -238,6 +307,150 @@ class BasicTests(unittest.TestCase):
         tree_5 = parser.parse('=(((((Sheet1!B1)))))')
         self.assertEqual(sne.transform(tree_5), '(((((SheetBla!B1)))))')
 
+    def test_lalr_grammar(self):
+        # the workbook's LALR parser tells sheet names, function names and
+        # booleans apart from cell references by what follows them
+        parser = lalr_parser
+
+        def tokens(formula):
+            return [(token.type, str(token)) for token in parser.parse(formula).scan_values(lambda v: True)]
+
+        # a sheet name that looks like a cell reference, before '!'
+        self.assertEqual(tokens('=AB1!A1'), [('SHEET_NAME', 'AB1'), ('CELLREF', 'A1')])
+        self.assertEqual(tokens('=Sheet1 ! A1'), [('SHEET_NAME', 'Sheet1'), ('CELLREF', 'A1')])
+
+        # a function name, before '(', against a cell reference
+        self.assertEqual(tokens('=SUM(A1)'), [('FUNCTION_NAME', 'SUM'), ('CELLREF', 'A1')])
+        self.assertEqual(tokens('=SUM (A1)'), [('FUNCTION_NAME', 'SUM'), ('CELLREF', 'A1')])
+        self.assertEqual(tokens('=A1'), [('CELLREF', 'A1')])
+
+        # booleans against references starting with TRUE or FALSE
+        self.assertEqual(tokens('=TRUE'), [('BOOLEAN', 'TRUE')])
+        self.assertEqual(tokens('=false'), [('BOOLEAN', 'false')])
+        self.assertEqual(tokens('=TRUE1'), [('CELLREF', 'TRUE1')])
+        self.assertEqual(tokens('=TRUEA1'), [('CELLREF', 'TRUEA1')])
+        self.assertEqual(tokens('=FALSE1'), [('CELLREF', 'FALSE1')])
+
+        # comparison operators are not taken for the '!' after a sheet name
+        for op in ['<>', '!=', '<=', '>=', '==']:
+            self.assertEqual(tokens(f'=A1{op}B1'), [('CELLREF', 'A1'), ('COMPARE_OP', op), ('CELLREF', 'B1')])
+            self.assertEqual(tokens(f'=Sheet1!A1{op}B1'),
+                             [('SHEET_NAME', 'Sheet1'), ('CELLREF', 'A1'), ('COMPARE_OP', op), ('CELLREF', 'B1')])
+
+        # concatenation binds tighter than comparison, and comparisons chain
+        # to the left
+        tree = parser.parse('=1&2=12')
+        self.assertEqual(tree.data, 'compare_expr')
+        self.assertEqual(tree.children[0].data, 'concat_expr')
+        tree = parser.parse('=1<2=TRUE')
+        self.assertEqual(tree.data, 'compare_expr')
+        self.assertEqual(tree.children[0].data, 'compare_expr')
+        self.assertEqual(tree.children[2].data, 'boolean')
+
+        # what did not parse still does not
+        for formula in ['=1E5', '=1 2', '="a" "b"', '=A1 B1', '="a" A1', '=1 +', '=A1!']:
+            with self.assertRaises(lark.exceptions.UnexpectedInput):
+                parser.parse(formula)
+
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.new_sheet('AB1')
+        wb.set_cell_contents('AB1', 'A1', '7')
+        expected = {'=AB1!A1': 7, '=TRUE1': 0, '=1&2=12': False, '=1&2="12"': True, '=1<2=TRUE': True}
+        for formula, value in expected.items():
+            wb.set_cell_contents('Sheet1', 'C1', formula)
+            self.assertEqual(wb.get_cell_value('Sheet1', 'C1'), value)
+        wb.set_cell_contents('Sheet1', 'C1', '=TRUEA1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C1').get_type(), sheets.CellErrorType.BAD_REFERENCE)
+        for formula in ['=1E5', '="a" "b"']:
+            wb.set_cell_contents('Sheet1', 'C1', formula)
+            self.assertEqual(wb.get_cell_value('Sheet1', 'C1').get_type(), sheets.CellErrorType.PARSE_ERROR)
+
+    def test_formula_cache(self):
+        cache = FormulaCache(maxsize=2)
+        tree_1 = cache.parse('=SUM(A1:A100)')
+        self.assertIs(cache.parse('=SUM(A1:A100)'), tree_1)
+        self.assertIsNone(cache.parse('=1 +'))
+        self.assertIsNone(cache.parse('=1 +'))
+        self.assertEqual(cache.cache_info()['hits'], 2)
+        self.assertEqual(cache.cache_info()['misses'], 2)
+
+        # least recently used entry is evicted
+        cache.parse('=A1')
+        self.assertEqual(cache.cache_info()['size'], 2)
+        self.assertIsNot(cache.parse('=SUM(A1:A100)'), tree_1)
+
+        # cells with the same formula text share one tree
+        self.assertIs(cache.parse('=B1 * 2'), cache.parse(' =B1 * 2 '))
+
+    def test_compiled_formulas(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', '=IF(B1, C1 & "x", 1 / 0)')
+        wb.set_cell_contents('Sheet1', 'A2', '=IF(B2, C2 & "x", 1 / 0)')
+        program = wb.get_cell('Sheet1', 'A1').program
+        self.assertTrue(callable(program))
+        self.assertIs(wb.get_cell('Sheet1', 'A2').program, program)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1').get_type(), sheets.CellErrorType.DIVIDE_BY_ZERO)
+
+        # the same compiled program evaluates against each cell's inputs
+        wb.set_cell_contents('Sheet1', 'B1', 'true')
+        wb.set_cell_contents('Sheet1', 'C1', 'abc')
+        wb.set_cell_contents('Sheet1', 'B2', 'true')
+        wb.set_cell_contents('Sheet1', 'C2', 'def')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1'), 'abcx')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A2'), 'defx')
+
+        wb.set_cell_contents('Sheet1', 'A3', '=1 +')
+        self.assertIsNone(wb.get_cell('Sheet1', 'A3').program)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A3').get_type(), sheets.CellErrorType.PARSE_ERROR)
+
+    def test_relative_formula_sharing(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        for row in range(1, 6):
+            wb.set_cell_contents('Sheet1', f'A{row}', str(row))
+            wb.set_cell_contents('Sheet1', f'B{row}', f'=A{row} * $A$1 + SUM(A$1:A{row})')
+
+        # filled-down formulas differ only by offset, so they share a program
+        program = wb.get_cell('Sheet1', 'B1').program
+        for row in range(2, 6):
+            self.assertIs(wb.get_cell('Sheet1', f'B{row}').program, program)
+        self.assertEqual([wb.get_cell_value('Sheet1', f'B{row}') for row in range(1, 6)],
+                         [2, 5, 9, 14, 20])
+        wb.set_cell_contents('Sheet1', 'A2', '10')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), 21)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B5'), 28)
+        self.assertIn(('sheet1', 'b3'), wb.graph.ingoing_get('sheet1', 'a2'))
+
+        # the same text at another location is a different relative formula
+        wb.set_cell_contents('Sheet1', 'C1', '=A1 * $A$1 + SUM(A$1:A1)')
+        self.assertIsNot(wb.get_cell('Sheet1', 'C1').program, program)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C1'), 2)
+
+        # copied formulas keep sharing the program
+        wb.set_cell_contents('Sheet1', 'D1', '=B1 - A$1')
+        wb.copy_cells('Sheet1', 'D1', 'D1', 'D2')
+        wb.copy_cells('Sheet1', 'D1', 'D2', 'D3')
+        self.assertEqual(wb.get_cell_contents('Sheet1', 'D3'), '=B3 - A$1')
+        self.assertIs(wb.get_cell('Sheet1', 'D3').program, wb.get_cell('Sheet1', 'D1').program)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D3'), 16)
+
+        # references that fall off the sheet are still reported
+        wb.set_cell_contents('Sheet1', 'E9999', '=B9999')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E9999'), 0)
+        wb.set_cell_contents('Sheet1', 'E9999', '=B10000')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E9999').get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+        # text that only looks like a relative form does not share a program
+        wb.set_cell_contents('Sheet1', 'F1', '=E1')
+        wb.set_cell_contents('Sheet1', 'F2', '={C[-1]R[0]}')
+        self.assertIsNone(wb.get_cell('Sheet1', 'F2').program)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'F2').get_type(), sheets.CellErrorType.PARSE_ERROR)
+        wb.rename_sheet('Sheet1', 'Foo')
+        self.assertEqual(wb.get_cell_contents('Foo', 'F2'), '={C[-1]R[0]}')
+        self.assertEqual(wb.get_cell_value('Foo', 'F2').get_type(), sheets.CellErrorType.PARSE_ERROR)
+
     def test_automatic_updates(self):
         wb = sheets.Workbook()
         wb.new_sheet()
@@ -310,7 +523,290 @@ class BasicTests(unittest.TestCase):
 
         wb.set_cell_contents('Sheet4', 'C1', '2')
         self.assertEqual(wb.get_cell_value('Sheet4', 'A1'), 4)
-    
+
+    def test_topological_order(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+
+        def assert_ordered():
+            for sn in wb.graph.ingoing:
+                for loc, ingoings in wb.graph.ingoing[sn].items():
+                    for ingoing in ingoings:
+                        self.assertLess(wb.graph.order_get(sn, loc), wb.graph.order_get(*ingoing))
+
+        # cells entered before the cells they reference are reordered
+        wb.set_cell_contents('Sheet1', 'A1', '=A2 + A3')
+        wb.set_cell_contents('Sheet1', 'A2', '=A3 * 2')
+        wb.set_cell_contents('Sheet1', 'A3', '=A4')
+        wb.set_cell_contents('Sheet1', 'A4', '1')
+        assert_ordered()
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1'), 3)
+
+        # an edge that closes a cycle is left out of order until the cycle
+        # is broken
+        wb.set_cell_contents('Sheet1', 'A4', '=A1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        wb.set_cell_contents('Sheet1', 'A3', '=5')
+        assert_ordered()
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1'), 15)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A4'), 15)
+
+        wb.set_cell_contents('Sheet1', 'A3', '=A5')
+        wb.set_cell_contents('Sheet1', 'A5', '2')
+        assert_ordered()
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A4'), 6)
+
+    def test_range_references(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.new_sheet()
+        for row in range(1, 1001):
+            wb.set_cell_contents('Sheet1', f'A{row}', '1')
+
+        # a range is referenced by one edge, however large it is
+        wb.set_cell_contents('Sheet1', 'B1', '=SUM(A1:A1000)')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 1000)
+        self.assertEqual(wb.graph.outgoing_get('Sheet1', 'B1'), [('sheet1', 'a1:a1000')])
+        self.assertEqual(wb.graph.ingoing_get('Sheet1', 'A500'), [('sheet1', 'b1')])
+        self.assertEqual(wb.graph.ingoing_get('Sheet1', 'A1001'), [])
+
+        # edits inside the range, including to cells that were empty or that
+        # become formulas, propagate to the cells referencing it
+        wb.set_cell_contents('Sheet1', 'A500', '=A1 + 1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 1001)
+        wb.set_cell_contents('Sheet1', 'A1', '3')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 1005)
+        wb.set_cell_contents('Sheet1', 'A1000', None)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 1004)
+
+        # references to ranges on other sheets use that sheet's cells
+        wb.set_cell_contents('Sheet2', 'A1', '=SUM(Sheet1!A1:A2) + MAX(Sheet1!B1:B1)')
+        self.assertEqual(wb.get_cell_value('Sheet2', 'A1'), 1008)
+        wb.set_cell_contents('Sheet1', 'A2', '2')
+        self.assertEqual(wb.get_cell_value('Sheet2', 'A1'), 1010)
+
+        # a formula inside a range it depends on is in a cycle, until the
+        # range no longer contains it
+        wb.set_cell_contents('Sheet1', 'A1000', '=B1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1000').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        wb.set_cell_contents('Sheet1', 'B1', '=SUM(A1:A999)')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 1005)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1000'), 1005)
+        self.assertEqual(wb.get_cell_value('Sheet2', 'A1'), 1010)
+
+    def test_shared_values(self):
+        from sheets.CellValue import CellValue
+
+        # the empty value, booleans and standard errors are shared
+        self.assertIs(CellValue(None), CellValue(None))
+        self.assertIs(CellValue(True), CellValue(True))
+        self.assertIs(CellValue(decimal.Decimal('1') == 1), CellValue(True))
+        self.assertIs(CellValue.error(sheets.CellErrorType.BAD_REFERENCE),
+                      CellValue.error(sheets.CellErrorType.BAD_REFERENCE))
+        with self.assertRaises(AttributeError):
+            CellValue(None).val = 1
+
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', 'true')
+        wb.set_cell_contents('Sheet1', 'A2', 'FALSE')
+        self.assertIs(wb.get_cell('Sheet1', 'A1').value, CellValue(True))
+        self.assertIs(wb.get_cell('Sheet1', 'A2').value, CellValue(False))
+
+        # converting a value for a formula leaves the referenced cell alone
+        wb.set_cell_contents('Sheet1', 'B1', "'5")
+        wb.set_cell_contents('Sheet1', 'B2', '=SUM(B1:B1) + B1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), 10)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), '5')
+
+    def test_float_kernel(self):
+        with self.assertRaises(ValueError):
+            sheets.Workbook('double')
+
+        # the same formulas, whose compiled programs are shared, in workbooks
+        # of each kind
+        contents = {'A1': '1.50', 'A2': '=A1 * 2 + "3"', 'A3': '=SUM(A1:A2, TRUE) / 4',
+                    'A4': '=0.1 + 0.2', 'A5': '=-(A1 - 1.5)', 'A6': '=A1 & ""',
+                    'A7': '=A1 > 1', 'A8': '=MAX(A1, "7", 1)', 'A9': '=A1 + "x"',
+                    'B1': '1e300', 'B2': '=B1 * B1'}
+        wb = sheets.Workbook()
+        wb_float = sheets.Workbook('float')
+        for workbook in (wb, wb_float):
+            workbook.new_sheet()
+            for location, formula in contents.items():
+                workbook.set_cell_contents('Sheet1', location, formula)
+
+        values = [wb_float.get_cell_value('Sheet1', f'A{row}') for row in range(1, 9)]
+        self.assertEqual(values, [1.5, 6.0, 2.125, 0.30000000000000004, 0.0, '1.5', True, 7.0])
+        self.assertIs(type(values[0]), float)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A4'), decimal.Decimal('0.3'))
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A3'), decimal.Decimal('2.125'))
+        self.assertEqual(wb_float.get_cell_value('Sheet1', 'A9').get_type(), sheets.CellErrorType.TYPE_ERROR)
+
+        # results too large for a float are errors
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), decimal.Decimal('1e600'))
+        self.assertEqual(wb_float.get_cell_value('Sheet1', 'B2').get_type(), sheets.CellErrorType.TYPE_ERROR)
+
+        # sorting compares float values
+        wb_float.set_cell_contents('Sheet1', 'C1', '=3')
+        wb_float.set_cell_contents('Sheet1', 'C2', '-2.5')
+        wb_float.sort_region('Sheet1', 'C1', 'C2', [1])
+        self.assertEqual(wb_float.get_cell_value('Sheet1', 'C1'), -2.5)
+
+        wb_float.save_workbook(StringIO())
+        loaded = sheets.Workbook.load_workbook(StringIO(json.dumps({'sheets': [
+            {'name': 'Sheet1', 'cell-contents': {'A1': '2', 'A2': '=A1 / 4'}}]})), 'float')
+        self.assertEqual(loaded.get_cell_value('Sheet1', 'A2'), 0.5)
+
+    def test_decimal_canonical_form(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+
+        # stored values have no trailing zeros, whatever the intermediate
+        # results had
+        expected = {'=1.5 * 2': '3', '=SUM(1.5, 1.5)': '3', '=0.25 + 0.25': '0.5',
+                    '=0 * 1.5 / 7': '0', '=-0.5 * 200': '-100', '=100': '100',
+                    '=(1 / 4 * 2) & ""': '0.5'}
+        for formula, value in expected.items():
+            wb.set_cell_contents('Sheet1', 'A1', formula)
+            self.assertEqual(str(wb.get_cell_value('Sheet1', 'A1')), value)
+
+        # the zeros of an exponent are not trailing zeros
+        wb.set_cell_contents('Sheet1', 'B1', '1.5E10')
+        wb.set_cell_contents('Sheet1', 'B2', '=B1 / 10000000000 / 10000000000')
+        wb.set_cell_contents('Sheet1', 'B3', '=B2 & ""')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 15000000000)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), decimal.Decimal('1.5E-10'))
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B3'), '1.5E-10')
+
+    def test_early_cutoff(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', '5')
+        wb.set_cell_contents('Sheet1', 'B1', '=IF(A1 > 0, 1, 0)')
+        for row in range(1, 4):
+            wb.set_cell_contents('Sheet1', f'C{row}', f'=B1 + {row}')
+        wb.set_cell_contents('Sheet1', 'D1', '=C1 * 2')
+
+        # B1 does not change, so its dependents are not evaluated again
+        stats = dict(wb.recalc_stats)
+        wb.set_cell_contents('Sheet1', 'A1', '6')
+        self.assertEqual(wb.recalc_stats['evaluated'] - stats['evaluated'], 1)
+        self.assertEqual(wb.recalc_stats['skipped'] - stats['skipped'], 3)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D1'), 4)
+
+        stats = dict(wb.recalc_stats)
+        wb.set_cell_contents('Sheet1', 'A1', '-6')
+        self.assertEqual(wb.recalc_stats['evaluated'] - stats['evaluated'], 5)
+        self.assertEqual(wb.recalc_stats['skipped'] - stats['skipped'], 0)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C3'), 3)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D1'), 2)
+
+        # values of different types are different, even if they compare equal
+        wb.set_cell_contents('Sheet1', 'E1', 'true')
+        wb.set_cell_contents('Sheet1', 'F1', '=E1')
+        wb.set_cell_contents('Sheet1', 'G1', '=F1 & ""')
+        wb.set_cell_contents('Sheet1', 'E1', '1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'G1'), '1')
+
+    def test_lazy_evaluation(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        with self.assertRaises(ValueError):
+            wb.set_calculation_mode('eventually')
+        wb.set_calculation_mode('lazy')
+
+        changed = []
+        wb.notify_cells_changed(lambda _, cells: changed.extend(cells))
+
+        wb.set_cell_contents('Sheet1', 'A1', '1')
+        for row in range(2, 2001):
+            wb.set_cell_contents('Sheet1', f'A{row}', f'=A{row - 1} + 1')
+        wb.set_cell_contents('Sheet1', 'B1', '=SUM(A1:A3)')
+        self.assertEqual(wb.recalc_stats['evaluated'], 0)
+        self.assertEqual(changed, [])
+
+        # only the cells read, and the cells they reference, are computed
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 6)
+        self.assertEqual(wb.recalc_stats['evaluated'], 4)
+        self.assertEqual(set(changed), {('sheet1', f'a{row}') for row in range(1, 4)} | {('sheet1', 'b1')})
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A2000'), 2000)
+
+        evaluated = wb.recalc_stats['evaluated']
+        wb.set_cell_contents('Sheet1', 'A1', '2')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A2'), 3)
+        self.assertEqual(wb.recalc_stats['evaluated'] - evaluated, 2)
+
+        # cycles are found when the cells are read
+        wb.set_cell_contents('Sheet1', 'C1', '=D1')
+        wb.set_cell_contents('Sheet1', 'D1', '=C1 + A1')
+        self.assertIsInstance(wb.get_cell_value('Sheet1', 'C1'), sheets.CellError)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D1').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        wb.set_cell_contents('Sheet1', 'C1', '5')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D1'), 7)
+
+        # switching back computes everything
+        wb.set_cell_contents('Sheet1', 'A1', '0')
+        wb.set_calculation_mode('automatic')
+        self.assertEqual(wb.stale_cells, set())
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A2000'), 1999)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 3)
+
+    def test_manual_calculation(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.new_sheet('Data')
+        wb.set_calculation_mode('manual')
+
+        changed = []
+        wb.notify_cells_changed(lambda _, cells: changed.append(sorted(cells)))
+
+        wb.set_cell_contents('Data', 'A1', '1')
+        for row in range(1, 101):
+            wb.set_cell_contents('Sheet1', f'A{row}', f'=Data!A1 + {row}')
+        wb.set_cell_contents('Sheet1', 'B1', '=SUM(A1:A100)')
+        wb.set_cell_contents('Sheet1', 'C1', '=$A$100 * 2')
+        self.assertIsNone(wb.get_cell_value('Sheet1', 'A1'))
+        self.assertEqual(wb.recalc_stats['evaluated'], 0)
+
+        # other operations only update contents and the dependency graph
+        wb.rename_sheet('Data', 'Inputs')
+        self.assertEqual(wb.get_cell_contents('Sheet1', 'A1'), '=Inputs!A1 + 1')
+        wb.move_cells('Sheet1', 'C1', 'C1', 'D1')
+        self.assertEqual(wb.recalc_stats['evaluated'], 0)
+        self.assertEqual(changed, [])
+
+        wb.recalculate()
+        self.assertEqual(wb.recalc_stats['evaluated'], 104)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A100'), 101)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 5150)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D1'), 202)
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(len(changed[0]), 103)
+
+        wb.set_cell_contents('Inputs', 'A1', '2')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 5150)
+        wb.recalculate()
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 5250)
+
+        evaluated = wb.recalc_stats['evaluated']
+        wb.recalculate()
+        self.assertEqual(wb.recalc_stats['evaluated'], evaluated)
+        wb.recalculate(full=True)
+        self.assertEqual(wb.recalc_stats['evaluated'] - evaluated, 103)
+        self.assertEqual(len(changed), 2)
+
+        # edits are recalculated on save, and when leaving manual mode
+        wb.set_calculation_mode('manual', recalc_on_save=True)
+        wb.set_cell_contents('Inputs', 'A1', '0')
+        wb.save_workbook(StringIO())
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 5050)
+        wb.set_calculation_mode('manual')
+        wb.set_cell_contents('Inputs', 'A1', '1')
+        wb.set_calculation_mode('automatic')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 5150)
+
     def test_update_tree(self):
         wb = sheets.Workbook()
         wb.new_sheet()
@@ -546,6 +1042,102 @@ class BasicTests(unittest.TestCase):
         output = temp_stdout.getvalue()
         self.assertEqual(output.lower(), "Cell(s) changed: [('sheet1', 'c1'), ('sheet1', 'd1')]\n".lower())
 
+    def test_batch(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+
+        with wb.batch():
+            wb.set_cell_contents('Sheet1', 'A1', '1')
+            for i in range(2, 51):
+                wb.set_cell_contents('Sheet1', f'A{i}', f'=A{i - 1} + 1')
+            # values are only recalculated on commit
+            self.assertEqual(wb.get_cell_value('Sheet1', 'A50'), None)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A50'), 50)
+
+        # nested batches only recalculate on the outermost commit
+        wb.begin_batch()
+        wb.begin_batch()
+        wb.set_cell_contents('Sheet1', 'A1', '=A50')
+        wb.commit()
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1'), 1)
+        wb.commit()
+        for i in range(1, 51):
+            self.assertEqual(wb.get_cell_value('Sheet1', f'A{i}').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+        with wb.batch():
+            wb.set_cell_contents('Sheet1', 'A1', '10')
+            # other operations see the pending edits
+            wb.copy_cells('Sheet1', 'A2', 'A2', 'B1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A50'), 59)
+        self.assertEqual(wb.get_cell_contents('Sheet1', 'B1'), '=#REF! + 1')
+
+        with self.assertRaises(RuntimeError):
+            wb.commit()
+
+    def test_batch_notify(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', '1')
+        wb.set_cell_contents('Sheet1', 'B1', '=A1 * 2')
+        wb.set_cell_contents('Sheet1', 'C1', '=IF(B1 > 0, 1, 0)')
+
+        def on_cells_changed(workbook, changed_cells):
+            print(f'Cell(s) changed: {changed_cells}')
+        wb.notify_cells_changed(on_cells_changed)
+
+        temp_stdout = StringIO()
+        with contextlib.redirect_stdout(temp_stdout):
+            with wb.batch():
+                wb.set_cell_contents('Sheet1', 'A1', '2')
+                wb.set_cell_contents('Sheet1', 'A1', '3')
+                wb.set_cell_contents('Sheet1', 'D1', "'unchanged")
+                wb.set_cell_contents('Sheet1', 'D1', None)
+        output = temp_stdout.getvalue()
+        self.assertEqual(output.lower(), "Cell(s) changed: [('sheet1', 'a1'), ('sheet1', 'b1')]\n".lower())
+
+    def test_set_range_contents(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+
+        # each cell references the one below it, so the block is written in
+        # the opposite order to its references
+        rows = [[f'=B{i + 1} + 1', f'=B{i}'] for i in range(2, 200)] + [['1', '5']]
+        wb.set_range_contents('Sheet1', 'B2', rows)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), 199)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C3'), 198)
+        self.assertEqual(wb.get_cell_contents('Sheet1', 'C200'), '5')
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (3, 200))
+
+        # ragged rows, and None clears a cell
+        wb.set_range_contents('Sheet1', 'B200', [['10'], [None, 'x']])
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), 208)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C201'), 'x')
+        wb.set_range_contents('Sheet1', 'C201', [[None]])
+        wb.set_range_contents('Sheet1', 'A1', [])
+
+        # cycles within the block are found
+        wb.set_range_contents('Sheet1', 'E1', [['=F1', '=E1'], ['=E2', '=E1']])
+        for location in ['E1', 'F1', 'E2']:
+            self.assertEqual(wb.get_cell_value('Sheet1', location).get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'F2').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        wb.set_range_contents('Sheet1', 'E1', [['1']])
+        self.assertEqual(wb.get_cell_value('Sheet1', 'F2'), 1)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E2').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+        changed = []
+        wb.notify_cells_changed(lambda workbook, cells: changed.append(list(cells)))
+        wb.set_range_contents('Sheet1', 'B199', [['2'], ['3']])
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), 199)
+
+        with self.assertRaises(KeyError):
+            wb.set_range_contents('Sheet2', 'A1', [['1']])
+        with self.assertRaises(ValueError):
+            wb.set_range_contents('Sheet1', 'A0', [['1']])
+        with self.assertRaises(ValueError):
+            wb.set_range_contents('Sheet1', 'A9999', [['1'], ['2']])
+        self.assertEqual(wb.get_cell_contents('Sheet1', 'A9999'), None)
+
     def test_absolute_cellref(self):
         wb = sheets.Workbook()
         wb.new_sheet()
@@ -7,6 +7,7 @@ import os
 import lark
 import sheets.Cell
 from sheets.interpreter import FormulaEvaluator
+from sheets.Sheet import Sheet
 import decimal
 import json
 import contextlib
@@ -1427,8 +1428,7 @@ class FunctionsTests(unittest.TestCase):
         wb.set_cell_contents('Sheet2', 'A1', '3')
         wb.set_cell_contents('Sheet2', 'A2', '1')
         wb.set_cell_contents('Sheet1', 'A1', '=MAX(Sheet2!A1:A2)')
-        self.assertIsInstance(wb.get_cell_value('Sheet1', 'A1'), sheets.CellError)
-        self.assertEqual(wb.get_cell_value('Sheet1', 'A1').get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'A1'), decimal.Decimal('3'))
 
         # Test with a range that includes empty cells and non-empty cells
         wb.set_cell_contents('Sheet1', 'C1', '')  # Empty cell
@@ -1532,7 +1532,50 @@ class FunctionsTests(unittest.TestCase):
         wb.set_cell_contents('Sheet1', 'A1', '=AVERAGE(Sheet1!A12:A13)')
         self.assertIsInstance(wb.get_cell_value('Sheet1', 'A1'), sheets.CellError)
         self.assertEqual(wb.get_cell_value('Sheet1', 'A1').get_type(), sheets.CellErrorType.DIVIDE_BY_ZERO)
-    
+
+    def test_product_count(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', '2')
+        wb.set_cell_contents('Sheet1', 'A2', '1.5')
+        wb.set_cell_contents('Sheet1', 'A3', '-4')
+        wb.set_cell_contents('Sheet1', 'B1', "'3")
+        wb.set_cell_contents('Sheet1', 'B2', 'TRUE')
+        wb.set_cell_contents('Sheet1', 'B3', '#REF!')
+
+        expected = {
+            '=PRODUCT(A1:A3)': decimal.Decimal('-12'),
+            '=PRODUCT(A1:B2, "2")': decimal.Decimal('18'),
+            '=PRODUCT(C1:C5)': decimal.Decimal('0'),
+            '=COUNT(A1:B3)': decimal.Decimal('3'),
+            '=COUNT(A1:A3, 5, "5", TRUE)': decimal.Decimal('4'),
+            '=COUNT(C1:C5)': decimal.Decimal('0'),
+            # ranges of numbers only, and mixed ranges, give the same results
+            '=SUM(A1:A3)': decimal.Decimal('-0.5'),
+            '=SUM(A1:B2)': decimal.Decimal('7.5'),
+            '=MAX(A1:B2)': decimal.Decimal('3'),
+            '=AVERAGE(A1:A3, B2)': decimal.Decimal('0.125'),
+        }
+        for formula, value in expected.items():
+            wb.set_cell_contents('Sheet1', 'D1', formula)
+            self.assertEqual(wb.get_cell_value('Sheet1', 'D1'), value, formula)
+
+        for formula in ['=PRODUCT(A1:B3)', '=PRODUCT()', '=COUNT()']:
+            wb.set_cell_contents('Sheet1', 'D1', formula)
+            self.assertIsInstance(wb.get_cell_value('Sheet1', 'D1'), sheets.CellError)
+        wb.set_cell_contents('Sheet1', 'D1', '=PRODUCT(A1:B3)')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D1').get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+        # the float kernel sums without accumulating rounding errors
+        wb_float = sheets.Workbook('float')
+        wb_float.new_sheet()
+        for row in range(1, 11):
+            wb_float.set_cell_contents('Sheet1', f'A{row}', '0.1')
+        wb_float.set_cell_contents('Sheet1', 'B1', '=SUM(A1:A10)')
+        wb_float.set_cell_contents('Sheet1', 'B2', '=COUNT(A1:A10)')
+        self.assertEqual(wb_float.get_cell_value('Sheet1', 'B1'), 1.0)
+        self.assertEqual(wb_float.get_cell_value('Sheet1', 'B2'), 10.0)
+
     def test_hlookup(self):
         wb = sheets.Workbook()
         wb.new_sheet()
@@ -1694,7 +1737,184 @@ class FunctionsTests(unittest.TestCase):
         wb.set_cell_contents('Sheet1', 'B1', 'FALSE')
         wb.set_cell_contents('Sheet1', 'A1', '=SUM(IF(B1, C1:C5, D1:D10))')
         self.assertEqual(wb.get_cell_value('Sheet1', 'A1'), decimal.Decimal('550'))
-    
+
+    def test_range_view(self):
+        from sheets.RangeView import RangeView
+
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'B2', '1')
+        wb.set_cell_contents('Sheet1', 'C3', "'x")
+        wb.set_cell_contents('Sheet1', 'D9999', '2')
+
+        parser = lark.Lark.open(lark_path, start='formula')
+        ev = FormulaEvaluator('sheet1', wb, func_directory=wb.func_directory)
+        view = ev.visit(parser.parse('=D9999:A1'))
+        self.assertIsInstance(view, RangeView)
+        self.assertEqual((view.num_rows, view.num_cols), (9999, 4))
+
+        # only the populated cells are visited, in row-major order
+        self.assertEqual([value.val for value in view.values()], [1, 'x', 2])
+        self.assertEqual([(row, col) for row, col, _ in view.cells()], [(1, 1), (2, 2), (9998, 3)])
+        self.assertEqual(view.value(1, 1).val, 1)
+        self.assertIsNone(view.value(0, 0).val)
+
+        # rows and columns of the range are views too
+        self.assertEqual([value.val for value in view.rows(2).values()], ['x'])
+        self.assertEqual([value.val for value in view.rows(0, 3).columns(1, 3).values()], [1, 'x'])
+        self.assertEqual(view.columns(3).value(9998, 0).val, 2)
+
+        # functions over ranges with empty cells
+        wb.set_cell_contents('Sheet1', 'E1', '=SUM(A1:D9999)')
+        wb.set_cell_contents('Sheet1', 'E2', '=VLOOKUP(1, B1:C5, 1)')
+        wb.set_cell_contents('Sheet1', 'E3', '=HLOOKUP(1, A2:C9, 2)')
+        wb.set_cell_contents('Sheet1', 'E4', '=SUM(Sheet2!A1:B2)')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E1').get_type(), sheets.CellErrorType.TYPE_ERROR)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E2'), 1)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E3'), 0)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E4').get_type(), sheets.CellErrorType.BAD_REFERENCE)
+        wb.set_cell_contents('Sheet1', 'C3', None)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'E1'), 3)
+
+    def test_range_aggregates(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        for row in range(1, 101):
+            wb.set_cell_contents('Sheet1', f'A{row}', str(row))
+        for col, function in zip('BCDEF', ['SUM', 'COUNT', 'AVERAGE', 'MIN', 'MAX']):
+            wb.set_cell_contents('Sheet1', f'{col}1', f'={function}(A1:A100)')
+
+        def results():
+            return [wb.get_cell_value('Sheet1', f'{col}1') for col in 'BCDEF']
+
+        # edits inside the range update the aggregates the functions use
+        wb.set_cell_contents('Sheet1', 'A50', '1000')
+        self.assertEqual(len(wb.graph.aggregates), 1)
+        self.assertEqual(results(), [6000, 100, 60, 1, 1000])
+        wb.set_cell_contents('Sheet1', 'A1', None)
+        wb.set_cell_contents('Sheet1', 'A100', '-5')
+        self.assertEqual(results(), [5894, 99, decimal.Decimal(5894) / 99, -5, 1000])
+        with wb.batch():
+            wb.set_cell_contents('Sheet1', 'A50', None)
+            wb.set_cell_contents('Sheet1', 'A2', '=A3 * 10')
+        self.assertEqual(results(), [4922, 98, decimal.Decimal(4922) / 98, -5, 99])
+
+        # a range holding other values is read cell by cell again (A2 is an
+        # error too)
+        wb.set_cell_contents('Sheet1', 'A3', "'x")
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1').get_type(), sheets.CellErrorType.TYPE_ERROR)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C1'), 96)
+        wb.set_cell_contents('Sheet1', 'A3', '3')
+        self.assertEqual(results(), [4922, 98, decimal.Decimal(4922) / 98, -5, 99])
+
+        # the aggregate is dropped with the last formula over the range
+        for col in 'BCDEF':
+            wb.set_cell_contents('Sheet1', f'{col}1', None)
+        self.assertEqual(wb.graph.aggregates, {})
+
+        # float totals stay exact as numbers come and go
+        wb = sheets.Workbook('float')
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'B1', '=SUM(A1:A10)')
+        for row in range(1, 11):
+            wb.set_cell_contents('Sheet1', f'A{row}', '0.1')
+        wb.set_cell_contents('Sheet1', 'A1', '1e20')
+        wb.set_cell_contents('Sheet1', 'A1', '0.1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B1'), 1.0)
+
+    def test_lookup_index(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.new_sheet('Prices')
+        for row in range(1, 51):
+            wb.set_cell_contents('Prices', f'A{row}', f"'item{row}")
+            wb.set_cell_contents('Prices', f'B{row}', str(row * 10))
+            wb.set_cell_contents('Prices', f'{Sheet.index_to_col(row - 1)}60', str(row))
+        for row in range(1, 6):
+            wb.set_cell_contents('Sheet1', f'A{row}', f"'item{row * 10}")
+            wb.set_cell_contents('Sheet1', f'B{row}', f'=VLOOKUP(A{row}, Prices!A1:B50, 2)')
+        wb.set_cell_contents('Sheet1', 'C1', '=HLOOKUP(7, Prices!A60:AX61, 1)')
+
+        def prices():
+            return [wb.get_cell_value('Sheet1', f'B{row}') for row in range(1, 6)]
+
+        # the lookups over the table share one index; the first evaluation of
+        # the only lookup over the row scans it, as its range was not yet
+        # referenced
+        self.assertEqual(prices(), [100, 200, 300, 400, 500])
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C1'), 7)
+        self.assertEqual(len(wb.graph.lookup_indexes), 1)
+
+        # which follows edits to the search column
+        wb.set_cell_contents('Prices', 'A20', "'item30")
+        self.assertEqual(prices()[2], 200)
+        wb.set_cell_contents('Prices', 'A20', "'item20")
+        wb.set_cell_contents('Prices', 'A10', None)
+        self.assertEqual(prices()[0].get_type(), sheets.CellErrorType.TYPE_ERROR)
+        with wb.batch():
+            wb.set_cell_contents('Prices', 'A40', None)
+            wb.set_cell_contents('Prices', 'A45', "'item40")
+            wb.set_cell_contents('Prices', 'A5', '=A45')
+        self.assertEqual(prices()[3], 50)
+        wb.set_cell_contents('Prices', 'G60', '8')
+        wb.set_cell_contents('Prices', 'H60', '7')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C1'), 7)
+        self.assertEqual(len(wb.graph.lookup_indexes), 2)
+        wb.set_cell_contents('Prices', 'H61', 'x')
+        wb.set_cell_contents('Sheet1', 'C1', '=HLOOKUP(7, Prices!A60:AX61, 2)')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'C1'), 'x')
+
+        # an index is dropped with the last lookup over its range
+        for row in range(1, 6):
+            wb.set_cell_contents('Sheet1', f'B{row}', None)
+        wb.set_cell_contents('Sheet1', 'C1', None)
+        self.assertEqual(wb.graph.lookup_indexes, {})
+
+    def test_range_lookup(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        # tax brackets, in a range extending past the table
+        for row, (start, rate) in enumerate([(0, '0.1'), (10000, '0.2'), (40000, '0.3')], 1):
+            wb.set_cell_contents('Sheet1', f'A{row}', str(start))
+            wb.set_cell_contents('Sheet1', f'B{row}', rate)
+
+        for income, rate in [(0, '0.1'), (9999, '0.1'), (10000, '0.2'), (1000000, '0.3')]:
+            wb.set_cell_contents('Sheet1', 'D1', f'=VLOOKUP({income}, A1:B100, 2, TRUE)')
+            self.assertEqual(wb.get_cell_value('Sheet1', 'D1'), decimal.Decimal(rate))
+        wb.set_cell_contents('Sheet1', 'D1', '=VLOOKUP(-1, A1:B100, 2, TRUE)')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D1').get_type(), sheets.CellErrorType.TYPE_ERROR)
+        wb.set_cell_contents('Sheet1', 'D1', '=VLOOKUP(9999, A1:B100, 2, FALSE)')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'D1').get_type(), sheets.CellErrorType.TYPE_ERROR)
+
+        # values are ordered by type as sort_region() orders them
+        for col, contents in zip('FGHIJ', ['1', '2', "'apple", "'Banana", 'TRUE']):
+            wb.set_cell_contents('Sheet1', f'{col}1', contents)
+            wb.set_cell_contents('Sheet1', f'{col}2', f"'{col}")
+        for key, col in [('"b"', 'H'), ('"APPLE"', 'H'), ('1.5', 'F'), ('FALSE', 'I'), ('"a"', 'G')]:
+            wb.set_cell_contents('Sheet1', 'D2', f'=HLOOKUP({key}, F1:J2, 2, TRUE)')
+            self.assertEqual(wb.get_cell_value('Sheet1', 'D2'), col)
+
+        for formula, position in [('=MATCH(39999, A1:A100)', 2), ('=MATCH(40000, A1:A3, 1)', 3),
+                                  ('=MATCH(10000, A1:A3, 0)', 2), ('=MATCH("banana", F1:J1, 0)', None),
+                                  ('=MATCH("apple", F1:J1, 0)', 3)]:
+            wb.set_cell_contents('Sheet1', 'D3', formula)
+            if position is None:
+                self.assertEqual(wb.get_cell_value('Sheet1', 'D3').get_type(), sheets.CellErrorType.TYPE_ERROR)
+            else:
+                self.assertEqual(wb.get_cell_value('Sheet1', 'D3'), position)
+
+        # descending order
+        for row, contents in enumerate(['50', '30', '30', '10'], 1):
+            wb.set_cell_contents('Sheet1', f'L{row}', contents)
+        for key, position in [(50, 1), (40, 1), (30, 3), (5, 4)]:
+            wb.set_cell_contents('Sheet1', 'D4', f'=MATCH({key}, L1:L10, -1)')
+            self.assertEqual(wb.get_cell_value('Sheet1', 'D4'), position)
+
+        for formula in ['=MATCH(60, L1:L10, -1)', '=MATCH(1, A1:B3)', '=MATCH(1, A1:A3, 2)',
+                        '=VLOOKUP(1, A1:B3, 2, "x")']:
+            wb.set_cell_contents('Sheet1', 'D5', formula)
+            self.assertEqual(wb.get_cell_value('Sheet1', 'D5').get_type(), sheets.CellErrorType.TYPE_ERROR)
+
     # def test_choose_basic(self):
     #     wb = sheets.Workbook()
     #     wb.new_sheet()
@@ -161,7 +161,90 @@ class SpreadsheetTests(unittest.TestCase):
         wb.set_cell_contents('Sheet2', 'A1', None)
         wb.set_cell_contents('Sheet2', 'D4', None)
         self.assertEqual(wb.get_sheet_extent('Sheet2'), (0, 0))
-    
+
+    def test_sparse_storage(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+
+        # only the cells with contents are stored, whatever the extent
+        wb.set_cell_contents('Sheet1', 'ZZZZ9999', '1')
+        wb.set_cell_contents('Sheet1', 'B2', '=ZZZZ9999 + C3')
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (475254, 9999))
+        self.assertEqual(len(wb.sheets['sheet1'].cells), 2)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), 1)
+        self.assertIsNone(wb.get_cell_contents('Sheet1', 'C3'))
+        self.assertIsNone(wb.get_cell_value('Sheet1', 'ZZZZ9998'))
+
+        # cleared cells are dropped
+        wb.set_cell_contents('Sheet1', 'C3', None)
+        wb.set_cell_contents('Sheet1', 'ZZZZ9999', None)
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (2, 2))
+        self.assertEqual(len(wb.sheets['sheet1'].cells), 1)
+        self.assertEqual(wb.get_cell_value('Sheet1', 'B2'), 0)
+
+    def test_coordinate_accessors(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+
+        # rows and columns are numbered from 1, as in get_sheet_extent
+        wb.set_cell_contents_rc('Sheet1', 2, 3, '5')
+        wb.set_cell_contents('Sheet1', 'A1', '=C2 * 2')
+        self.assertEqual(wb.get_cell_contents('Sheet1', 'C2'), '5')
+        self.assertEqual(wb.get_cell_contents_rc('sheet1', 1, 1), '=C2 * 2')
+        self.assertEqual(wb.get_cell_value_rc('Sheet1', 1, 1), decimal.Decimal(10))
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (3, 2))
+        self.assertIsNone(wb.get_cell_value_rc('Sheet1', 5, 5))
+        self.assertIsNone(wb.get_cell_contents_rc('Sheet1', 5, 5))
+
+        wb.set_cell_contents_rc('Sheet1', 9999, 475254, '1')
+        self.assertEqual(wb.get_cell_value('Sheet1', 'ZZZZ9999'), 1)
+        wb.set_cell_contents_rc('Sheet1', 9999, 475254, None)
+        self.assertEqual(wb.get_sheet_extent('Sheet1'), (3, 2))
+
+        with self.assertRaises(KeyError):
+            wb.get_cell_value_rc('Sheet2', 1, 1)
+        with self.assertRaises(KeyError):
+            wb.set_cell_contents_rc('Sheet2', 1, 1, '1')
+        for row, col in [(0, 1), (1, 0), (10000, 1), (1, 475255), ('1', 1)]:
+            with self.assertRaises(ValueError):
+                wb.get_cell_value_rc('Sheet1', row, col)
+            with self.assertRaises(ValueError):
+                wb.get_cell_contents_rc('Sheet1', row, col)
+            with self.assertRaises(ValueError):
+                wb.set_cell_contents_rc('Sheet1', row, col, '1')
+
+    def test_range_values(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', 'x')
+        wb.set_cell_contents('Sheet1', 'B2', '3')
+        wb.set_cell_contents('Sheet1', 'C3', '=B2 * 2')
+
+        expected = [['x', None, None],
+                    [None, decimal.Decimal(3), None],
+                    [None, None, decimal.Decimal(6)]]
+        self.assertEqual(wb.get_range_values('Sheet1', 'A1:C3'), expected)
+        self.assertEqual(wb.get_range_values('sheet1', 'c3:a1'), expected)
+        self.assertEqual(wb.get_range_values('Sheet1', 'B2'), [[decimal.Decimal(3)]])
+        self.assertEqual(wb.get_range_values('Sheet1', 'D4:E4'), [[None, None]])
+
+        # the sparse form only has the cells with contents, numbered from 1
+        self.assertEqual(list(wb.get_range_values('Sheet1', 'B1:ZZZZ9999', sparse=True)),
+                         [(2, 2, decimal.Decimal(3)), (3, 3, decimal.Decimal(6))])
+        self.assertEqual(list(wb.get_range_values('Sheet1', 'A2:A3', sparse=True)), [])
+
+        # out-of-date cells in the range are computed first
+        wb.set_calculation_mode('lazy')
+        wb.set_cell_contents('Sheet1', 'B2', '4')
+        self.assertEqual(wb.get_range_values('Sheet1', 'B2:C3'),
+                         [[decimal.Decimal(4), None], [None, decimal.Decimal(8)]])
+
+        with self.assertRaises(KeyError):
+            wb.get_range_values('Sheet2', 'A1:B2')
+        for range_ref in ['A1:', 'A0:B2', 'A1:ZZZZ10000', 'A1:B2:C3', '$A$1:B2']:
+            with self.assertRaises(ValueError):
+                wb.get_range_values('Sheet1', range_ref)
+
     def test_move_sheet(self):
         wb = sheets.Workbook()
 
@@ -291,6 +374,28 @@ class SpreadsheetTests(unittest.TestCase):
         self.assertEqual(sorted(wb.graph.ingoing_get('Sheet2', 'A1')), sorted([('blah', 'a1')]))
         self.assertEqual(sorted(wb.graph.ingoing_get('Sheet3', 'A1')), sorted([('blah', 'a1')]))
 
+    def test_rename_sheet_merges_references(self):
+        wb = sheets.Workbook()
+        wb.new_sheet()
+        wb.new_sheet()
+        wb.set_cell_contents('Sheet1', 'A1', '7')
+        wb.set_cell_contents('Sheet1', 'B1', '=A1 * 2')
+        wb.set_cell_contents('Sheet2', 'A1', '=Other!A1 + 1')
+        self.assertEqual(wb.get_cell_value('Sheet2', 'A1').get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+        # the renamed cells keep their node ids, and take over the references
+        # made to the new name before the sheet existed
+        node = wb.graph.find('sheet1', 'a1')
+        wb.rename_sheet('Sheet1', 'Other')
+        self.assertEqual(wb.graph.find('other', 'a1'), node)
+        self.assertIsNone(wb.graph.find('sheet1', 'a1'))
+        self.assertEqual(sorted(wb.graph.ingoing_get('Other', 'A1')), [('other', 'b1'), ('sheet2', 'a1')])
+        self.assertEqual(wb.get_cell_value('Sheet2', 'A1'), 8)
+
+        wb.set_cell_contents('Other', 'A1', '1')
+        self.assertEqual(wb.get_cell_value('Sheet2', 'A1'), 2)
+        self.assertEqual(wb.get_cell_value('Other', 'B1'), 2)
+
     def test_rename_sheet(self):
         wb = sheets.Workbook()
         wb.new_sheet()